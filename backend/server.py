@@ -1,15 +1,16 @@
-from fastapi import FastAPI, APIRouter, UploadFile, File, HTTPException, BackgroundTasks, Form, Request
-from fastapi.responses import FileResponse, StreamingResponse, JSONResponse
+from fastapi import FastAPI, APIRouter, UploadFile, File, HTTPException, BackgroundTasks, Form, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import FileResponse, StreamingResponse, JSONResponse, Response
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne, monitoring
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
 import asyncio
 import json
 import ffmpeg
@@ -18,17 +19,26 @@ import tempfile
 import shutil
 import subprocess
 import re
-from io import BytesIO
+from collections import deque, OrderedDict
+from fractions import Fraction
+from email.utils import formatdate, parsedate_to_datetime
+from array import array
+import bisect
+import functools
+import glob
+import hashlib
+import zlib
+import mmap
+import struct
 import time
+import threading
+import sys
+import tracemalloc
+import numpy as np
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
-
 # Create the main app without a prefix
 app = FastAPI(
     title="Video Splitter API",
@@ -49,17 +59,138 @@ TEMP_BASE = Path(tempfile.gettempdir()) / "video_splitter"
 UPLOAD_DIR = TEMP_BASE / "uploads"
 PROCESS_DIR = TEMP_BASE / "processing"
 OUTPUT_DIR = TEMP_BASE / "outputs"
+PREVIEW_DIR = TEMP_BASE / "previews"
+PROXY_DIR = TEMP_BASE / "proxies"
 
 # Create directories if they don't exist
-for dir_path in [UPLOAD_DIR, PROCESS_DIR, OUTPUT_DIR]:
+for dir_path in [UPLOAD_DIR, PROCESS_DIR, OUTPUT_DIR, PREVIEW_DIR, PROXY_DIR]:
     dir_path.mkdir(parents=True, exist_ok=True)
 
+# Maximum number of segments encoded at once per job (defaults to one per core)
+MAX_PARALLEL_SEGMENTS = int(os.environ.get('MAX_PARALLEL_SEGMENTS', os.cpu_count() or 1))
+
+# Minimum seconds between progress writes for a running job
+PROGRESS_UPDATE_INTERVAL = float(os.environ.get('PROGRESS_UPDATE_INTERVAL', '1.0'))
+
+SUPPORTED_VIDEO_EXTENSIONS = ('.mp4', '.mkv', '.avi', '.mov', '.wmv', '.flv', '.webm')
+
+# Chunked upload limits and the write batch size for request bodies
+MIN_UPLOAD_CHUNK_SIZE = 1024 * 1024
+MAX_UPLOAD_CHUNK_SIZE = 256 * 1024 * 1024
+UPLOAD_WRITE_BUFFER_SIZE = int(os.environ.get('UPLOAD_WRITE_BUFFER_SIZE', str(8 * 1024 * 1024)))
+
+# Job scheduler: number of concurrently processed jobs (0 = size from cores and
+# memory), assumed peak memory per job, and how often idle workers poll
+SCHEDULER_WORKERS = int(os.environ.get('SCHEDULER_WORKERS', '0'))
+JOB_MEMORY_BYTES = int(os.environ.get('JOB_MEMORY_MB', '2048')) * 1024 * 1024
+SCHEDULER_POLL_INTERVAL = float(os.environ.get('SCHEDULER_POLL_INTERVAL', '2.0'))
+MAX_JOB_ATTEMPTS = int(os.environ.get('MAX_JOB_ATTEMPTS', '3'))
+# A claimed job is leased to its worker for JOB_LEASE_SECONDS and renewed by
+# heartbeats; jobs whose lease runs out are requeued for any node to pick up
+JOB_LEASE_SECONDS = float(os.environ.get('JOB_LEASE_SECONDS', '60'))
+JOB_HEARTBEAT_INTERVAL = JOB_LEASE_SECONDS / 4
+
+# Progress writes are coalesced per job and flushed in batches; ticks that move
+# less than PROGRESS_MIN_DELTA percent since the last write wait for the next flush
+PROGRESS_FLUSH_INTERVAL = float(os.environ.get('PROGRESS_FLUSH_INTERVAL', '2.0'))
+PROGRESS_MIN_DELTA = float(os.environ.get('PROGRESS_MIN_DELTA', '0.5'))
+
+# Job events: "local" (in-process bus) or "changestream" (Mongo change streams,
+# for deployments with several API processes); heartbeat keeps proxies open.
+# A stream re-reads its job after JOB_EVENT_IDLE_TIMEOUT seconds without events
+# and is closed after JOB_EVENT_MAX_DURATION (clients reconnect for a snapshot).
+JOB_EVENTS_SOURCE = os.environ.get('JOB_EVENTS_SOURCE', 'local')
+JOB_EVENT_QUEUE_SIZE = 100
+JOB_EVENT_HEARTBEAT = float(os.environ.get('JOB_EVENT_HEARTBEAT', '15'))
+JOB_EVENT_IDLE_TIMEOUT = float(os.environ.get('JOB_EVENT_IDLE_TIMEOUT', '300'))
+JOB_EVENT_MAX_DURATION = float(os.environ.get('JOB_EVENT_MAX_DURATION', '3600'))
+JOB_TERMINAL_STATUSES = ('completed', 'failed', 'expired')
+
+# Probe cache: in-process LRU in front of the probe_cache collection
+PROBE_CACHE_SIZE = int(os.environ.get('PROBE_CACHE_SIZE', '256'))
+probe_cache: "OrderedDict[tuple, Dict]" = OrderedDict()
+
+# Header-only probe limits for the upload response (bytes / microseconds)
+FAST_PROBE_SIZE = int(os.environ.get('FAST_PROBE_SIZE', str(5 * 1024 * 1024)))
+FAST_PROBE_DURATION = int(os.environ.get('FAST_PROBE_DURATION', '5000000'))
+
+# Storage manager: when usage of the TEMP_BASE volume (or STORAGE_QUOTA_BYTES,
+# if set) crosses the high watermark, least-recently-accessed finished jobs are
+# evicted down to the low watermark. Uploads that are never split expire after
+# UPLOAD_TTL_HOURS; expired job records are dropped after JOB_RECORD_TTL_DAYS.
+STORAGE_HIGH_WATERMARK = float(os.environ.get('STORAGE_HIGH_WATERMARK', '0.85'))
+STORAGE_LOW_WATERMARK = float(os.environ.get('STORAGE_LOW_WATERMARK', '0.70'))
+STORAGE_QUOTA_BYTES = int(os.environ.get('STORAGE_QUOTA_BYTES', '0'))
+STORAGE_SWEEP_INTERVAL = float(os.environ.get('STORAGE_SWEEP_INTERVAL', '60'))
+UPLOAD_TTL_HOURS = float(os.environ.get('UPLOAD_TTL_HOURS', '24'))
+JOB_RECORD_TTL_DAYS = float(os.environ.get('JOB_RECORD_TTL_DAYS', '7'))
+# Re-encoded outputs are budgeted at this multiple of the source bitrate
+REENCODE_SIZE_FACTOR = float(os.environ.get('REENCODE_SIZE_FACTOR', '1.5'))
+
+# Object storage: uploads, packet indexes, outputs, thumbnails and finished
+# previews are published under the same keys as their paths below TEMP_BASE,
+# so any node can serve them. "local" stores under STORAGE_ROOT (TEMP_BASE
+# itself, or a mount shared by all nodes); "s3" uses an S3-compatible bucket,
+# e.g. MinIO via STORAGE_ENDPOINT_URL. Copies of other nodes' files kept in
+# TEMP_BASE are dropped ORPHAN_GRACE_SECONDS after their job is gone.
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'local')
+STORAGE_ROOT = Path(os.environ.get('STORAGE_ROOT', str(TEMP_BASE)))
+STORAGE_BUCKET = os.environ.get('STORAGE_BUCKET')
+STORAGE_ENDPOINT_URL = os.environ.get('STORAGE_ENDPOINT_URL')
+STORAGE_PREFIX = os.environ.get('STORAGE_PREFIX', '')
+ORPHAN_GRACE_SECONDS = 3600
+
+# Scene detection decodes a tiny grayscale copy of the video at a fixed rate
+# and scores frame differences in batches of SCENE_BATCH_FRAMES
+SCENE_ANALYSIS_FPS = float(os.environ.get('SCENE_ANALYSIS_FPS', '10'))
+SCENE_FRAME_SIZE = (64, 36)
+SCENE_BATCH_FRAMES = 512
+DEFAULT_MIN_SCENE_DURATION = 2.0
+
+# Silence detection reads mono PCM at SILENCE_SAMPLE_RATE in SILENCE_BATCH_SECONDS
+# blocks and measures loudness over SILENCE_WINDOW_SECONDS windows
+SILENCE_SAMPLE_RATE = 8000
+SILENCE_WINDOW_SECONDS = 0.05
+SILENCE_BATCH_SECONDS = 60
+
+# Split cost estimates use the median of the last THROUGHPUT_HISTORY_SAMPLES
+# jobs on this host, falling back to the encoder profile and then these defaults
+THROUGHPUT_HISTORY_SAMPLES = 20
+DEFAULT_COPY_BYTES_PER_SECOND = 200 * 1024 * 1024
+DEFAULT_ENCODE_PIXELS_PER_SECOND = 1920 * 1080 * 30
+
+# Opt-in profiling: requests carrying X-Profile plus the PROFILING_TOKEN in
+# X-Profile-Token, and jobs split with profile=true, are sampled every
+# PROFILE_SAMPLE_INTERVAL seconds and diffed with tracemalloc
+PROFILING_TOKEN = os.environ.get('PROFILING_TOKEN')
+PROFILE_SAMPLE_INTERVAL = float(os.environ.get('PROFILE_SAMPLE_INTERVAL', '0.005'))
+PROFILE_TRACEMALLOC_FRAMES = 10
+PROFILE_TOP_ALLOCATIONS = 50
+PROFILE_MAX_STACKS = 5000
+
+# Timeline thumbnails: one frame every THUMBNAIL_INTERVAL seconds, tiled into
+# SPRITE_COLUMNS x SPRITE_ROWS sprite sheets; served with long-lived caching
+THUMBNAIL_INTERVAL = float(os.environ.get('THUMBNAIL_INTERVAL', '10'))
+THUMBNAIL_WIDTH = int(os.environ.get('THUMBNAIL_WIDTH', '160'))
+SPRITE_COLUMNS = 10
+SPRITE_ROWS = 10
+PREVIEW_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Low-bitrate HLS preview proxy built for each upload (PREVIEW_PROXY=0 makes it
+# on-demand only); at most PREVIEW_PROXY_CONCURRENCY proxies encode at once
+PREVIEW_PROXY = os.environ.get('PREVIEW_PROXY', '1') == '1'
+PREVIEW_PROXY_CONCURRENCY = int(os.environ.get('PREVIEW_PROXY_CONCURRENCY', '1'))
+PREVIEW_HEIGHT = int(os.environ.get('PREVIEW_HEIGHT', '360'))
+PREVIEW_VIDEO_BITRATE = os.environ.get('PREVIEW_VIDEO_BITRATE', '600k')
+PREVIEW_AUDIO_BITRATE = os.environ.get('PREVIEW_AUDIO_BITRATE', '64k')
+PREVIEW_SEGMENT_SECONDS = 4
+
 # Models
 class VideoProcessingJob(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     filename: str
     original_size: int
-    status: str  # "uploading", "processing", "completed", "failed"
+    status: str  # "uploading", "uploaded", "queued", "processing", "completed", "failed", "expired"
     progress: float = 0.0
     splits: List[Dict] = []
     created_at: datetime = Field(default_factory=datetime.utcnow)
@@ -67,16 +198,35 @@ class VideoProcessingJob(BaseModel):
     error_message: Optional[str] = None
     file_path: Optional[str] = None
     video_info: Optional[Dict] = None
+    encode_speed: Optional[float] = None  # Combined encode speed (x realtime)
 
 class SplitConfig(BaseModel):
-    method: str  # "time_based", "intervals", "chapters"
+    method: str  # "time_based", "intervals", "chapters", "scenes", "silence"
     time_points: Optional[List[float]] = None  # for time_based splitting
     interval_duration: Optional[float] = None  # for interval splitting
     preserve_quality: bool = True
     output_format: str = "mp4"
-    subtitle_sync_offset: float = 0.0
+    subtitle_sync_offset: float = 0.0  # Seconds subtitles are moved earlier (negative: later)
+    subtitle_mode: str = "mux"  # "mux" (into the output), "sidecar" (.srt next to it) or "both"
+    profile: bool = False  # Capture a CPU/allocation profile of this job
     force_keyframes: bool = True  # Force keyframes at split points
     keyframe_interval: float = 2.0  # Keyframe interval in seconds
+    max_parallel_segments: Optional[int] = None  # Per-job override of MAX_PARALLEL_SEGMENTS
+    engine: str = "per_segment"  # "per_segment", "segment_muxer" (single pass) or "smart_cut"
+    priority: int = 0  # Higher priority jobs are scheduled first
+    speed_tier: Optional[str] = None  # "fastest", "balanced" or "archival" (libx264 preset)
+    target_realtime_factor: Optional[float] = None  # Desired encode speed per segment (x realtime)
+    scene_threshold: float = 0.15  # Mean frame difference (0-1) that counts as a scene change
+    min_segment_duration: Optional[float] = None  # Shortest segment content-aware methods may produce
+    max_segment_duration: Optional[float] = None  # Longest segment before a cut is forced
+    target_segment_duration: Optional[float] = None  # Preferred segment length for silence splitting
+    silence_threshold_db: float = -35.0  # Audio quieter than this (dBFS) counts as silence
+    min_silence_duration: float = 0.5  # Shortest pause that can hold a cut (seconds)
+
+class UploadSessionRequest(BaseModel):
+    filename: str
+    size: int  # Total file size in bytes
+    chunk_size: int = 8 * 1024 * 1024
 
 class VideoInfo(BaseModel):
     duration: float
@@ -87,241 +237,3590 @@ class VideoInfo(BaseModel):
     subtitle_streams: List[Dict]
     chapters: List[Dict] = []
 
+# Metrics
+# A small Prometheus text-format registry. Metrics are updated from request
+# handlers, ffmpeg runners and pymongo's monitoring threads, hence the locks.
+METRICS: List["Metric"] = []
+
+def escape_label(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_labels(names: tuple, values: tuple, extra: Optional[tuple] = None) -> str:
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{escape_label(extra[1])}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values: Dict[tuple, Any] = {}
+        self.lock = threading.Lock()
+        METRICS.append(self)
+
+    def key(self, labels: Dict) -> tuple:
+        return tuple(labels.get(name, '') for name in self.labels)
+
+    def samples(self) -> List[str]:
+        with self.lock:
+            return [f"{self.name}{format_labels(self.labels, key)} {value}" for key, value in self.values.items()]
+
+    def render(self) -> str:
+        return '\n'.join([
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+            *self.samples()
+        ])
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value: float, **labels):
+        with self.lock:
+            self.values[self.key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = ()):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self.key(labels)
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.values[key] = (counts, total + value)
+
+    def samples(self) -> List[str]:
+        lines = []
+        with self.lock:
+            for key, (counts, total) in self.values.items():
+                cumulative = 0
+                for bound, count in zip((*self.buckets, '+Inf'), counts):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{format_labels(self.labels, key, ('le', bound))} {cumulative}")
+                lines.append(f"{self.name}_sum{format_labels(self.labels, key)} {total}")
+                lines.append(f"{self.name}_count{format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+def render_metrics() -> str:
+    return '\n'.join(metric.render() for metric in METRICS) + '\n'
+
+SECONDS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+UPLOAD_BYTES = Counter('video_splitter_upload_bytes_total', 'Bytes received by upload endpoints', ('endpoint',))
+UPLOAD_SIZE = Histogram(
+    'video_splitter_upload_size_bytes', 'Size of upload requests', ('endpoint',),
+    tuple(mb * 1024 * 1024 for mb in (1, 10, 100, 500, 1024, 2048, 5120, 10240, 20480))
+)
+UPLOAD_SECONDS = Histogram('video_splitter_upload_seconds', 'Upload request duration', ('endpoint',), SECONDS_BUCKETS)
+FFPROBE_SECONDS = Histogram('video_splitter_ffprobe_seconds', 'ffprobe wall time', (), SECONDS_BUCKETS)
+SEGMENT_SECONDS = Histogram('video_splitter_segment_seconds', 'ffmpeg wall time per segment', ('codec',), SECONDS_BUCKETS)
+REALTIME_FACTOR = Histogram(
+    'video_splitter_realtime_factor', 'Media seconds processed per wall-clock second', ('codec',),
+    (0.25, 0.5, 1, 2, 4, 8, 16, 32, 64, 128, 256)
+)
+ACTIVE_FFMPEG = Gauge('video_splitter_active_ffmpeg', 'ffmpeg processes running')
+QUEUE_DEPTH = Gauge('video_splitter_queue_depth', 'Split jobs waiting in the queue')
+ACTIVE_JOBS = Gauge('video_splitter_active_jobs', 'Split jobs processed by this instance')
+MONGO_SECONDS = Histogram(
+    'video_splitter_mongo_command_seconds', 'MongoDB command latency', ('command',),
+    (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
+MONGO_FAILURES = Counter('video_splitter_mongo_command_failures_total', 'Failed MongoDB commands', ('command',))
+BYTES_SERVED = Counter('video_splitter_bytes_served_total', 'Response body bytes sent', ('route',))
+STORAGE_BYTES = Gauge('video_splitter_storage_bytes', 'Bytes stored under TEMP_BASE', ('directory',))
+VOLUME_BYTES = Gauge('video_splitter_volume_bytes', 'Size of the TEMP_BASE volume', ('state',))
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_SECONDS.observe(event.duration_micros / 1e6, command=event.command_name)
+
+    def failed(self, event):
+        MONGO_SECONDS.observe(event.duration_micros / 1e6, command=event.command_name)
+        MONGO_FAILURES.inc(command=event.command_name)
+
+# MongoDB connection
+mongo_url = os.environ['MONGO_URL']
+client = AsyncIOMotorClient(mongo_url, event_listeners=[MongoCommandMetrics()])
+db = client[os.environ['DB_NAME']]
+
+# Profiling
+# A sampler thread walks every other thread's stack with sys._current_frames()
+# and counts them in folded ("a;b;c count") form, ready for flamegraph.pl or
+# speedscope. Nothing runs unless a profile is active. The event loop is shared,
+# so a profile shows everything the process did while it was recording.
+UUID_PATTERN = re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}')
+# Profiles stop from worker threads, so the user count and tracemalloc's
+# start/stop are only touched under this lock
+tracemalloc_users = 0
+tracemalloc_lock = threading.Lock()
+
+class Profile:
+    """CPU samples and allocation growth captured over one request or job"""
+
+    def __init__(self, kind: str, job_id: Optional[str], label: str):
+        self.id = str(uuid.uuid4())
+        self.kind = kind
+        self.job_id = job_id
+        self.label = label
+        self.stacks: Dict[str, int] = {}
+        self.samples = 0
+        self.stopped = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.snapshot = None
+
+    def start(self):
+        global tracemalloc_users
+        self.started_at = datetime.utcnow()
+        self.started = time.monotonic()
+        with tracemalloc_lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(PROFILE_TRACEMALLOC_FRAMES)
+            tracemalloc_users += 1
+            self.snapshot = tracemalloc.take_snapshot()
+        self.thread = threading.Thread(target=self.run, name=f"profiler-{self.id[:8]}", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while not self.stopped.wait(PROFILE_SAMPLE_INTERVAL):
+            self.sample()
+
+    def sample(self):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == self.thread.ident or names.get(thread_id, '').startswith('profiler-'):
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            folded = ';'.join([names.get(thread_id, str(thread_id)), *reversed(stack)])
+            self.stacks[folded] = self.stacks.get(folded, 0) + 1
+        self.samples += 1
+
+    def stop(self) -> List[Dict]:
+        """Stop sampling and return the biggest allocation growth since start"""
+        global tracemalloc_users
+        self.stopped.set()
+        self.thread.join()
+        self.duration = time.monotonic() - self.started
+
+        with tracemalloc_lock:
+            after = tracemalloc.take_snapshot()
+            tracemalloc_users -= 1
+            if tracemalloc_users == 0:
+                tracemalloc.stop()
+
+        # Leave out the sampler's own bookkeeping
+        sample = Profile.sample.__code__
+        own_lines = {line for _, _, line in sample.co_lines() if line}
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        filters += [tracemalloc.Filter(False, sample.co_filename, line) for line in own_lines]
+        growth = after.filter_traces(filters).compare_to(self.snapshot.filter_traces(filters), 'lineno')
+        self.snapshot = None
+
+        return [
+            {
+                'location': str(stat.traceback[0]),
+                'size_diff': stat.size_diff,
+                'count_diff': stat.count_diff,
+                'size': stat.size
+            }
+            for stat in growth[:PROFILE_TOP_ALLOCATIONS]
+        ]
+
+    def folded(self) -> str:
+        top = sorted(self.stacks.items(), key=lambda item: item[1], reverse=True)[:PROFILE_MAX_STACKS]
+        return ''.join(f"{stack} {count}\n" for stack, count in top)
+
+    async def save(self):
+        """Stop and store the profile; its summary is added to the job record"""
+        allocations = await asyncio.to_thread(self.stop)
+        summary = {
+            'id': self.id,
+            'kind': self.kind,
+            'label': self.label,
+            'started_at': self.started_at,
+            'duration': round(self.duration, 3),
+            'samples': self.samples
+        }
+        await db.profiles.insert_one({
+            **summary,
+            'job_id': self.job_id,
+            'interval': PROFILE_SAMPLE_INTERVAL,
+            'allocations': allocations,
+            'folded': self.folded()
+        })
+        if self.job_id:
+            await db.video_jobs.update_one({'id': self.job_id}, {'$push': {'profiles': summary}})
+        logger.info(f"Saved {self.kind} profile {self.id} ({self.samples} samples, {self.duration:.2f}s)")
+
+def profiling_authorized(request: Request) -> bool:
+    return bool(PROFILING_TOKEN) and request.headers.get('x-profile-token') == PROFILING_TOKEN
+
+def require_profiling(request: Request):
+    """Profiles do not exist for callers without the PROFILING_TOKEN, or at all without one"""
+    if not PROFILING_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not profiling_authorized(request):
+        raise HTTPException(status_code=403, detail="Profiling not allowed")
+
+class ProfileRequestsMiddleware:
+    """Profile a request when an admin asks for it with the X-Profile header.
+
+    Plain ASGI, so every other request (and its streamed body) passes straight
+    through; a profiled request is recorded until its response is fully sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not PROFILING_TOKEN:
+            await self.app(scope, receive, send)
+            return
+        request = Request(scope)
+        if 'x-profile' not in request.headers or not profiling_authorized(request):
+            await self.app(scope, receive, send)
+            return
+
+        job_match = UUID_PATTERN.search(scope['path'])
+        profile = Profile('request', job_match.group(0) if job_match else None, f"{scope['method']} {scope['path']}")
+
+        async def send_with_profile_id(message):
+            if message['type'] == 'http.response.start':
+                message['headers'] = [*message.get('headers', []), (b'x-profile-id', profile.id.encode())]
+            await send(message)
+
+        profile.start()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            await profile.save()
+
+app.add_middleware(ProfileRequestsMiddleware)
+
 # Helper functions
-async def get_video_info(file_path: str) -> Dict:
-    """Extract video information using ffprobe"""
+async def run_ffprobe_async(file_path: str, *extra_args: str) -> Dict:
+    """Run ffprobe as an asyncio subprocess and return its parsed JSON output"""
+    args = [
+        'ffprobe', '-v', 'error',
+        '-show_format', '-show_streams', '-show_chapters',
+        '-of', 'json', *extra_args, file_path
+    ]
+    started = time.monotonic()
+    proc = await asyncio.create_subprocess_exec(
+        *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    stdout, stderr = await proc.communicate()
+    FFPROBE_SECONDS.observe(time.monotonic() - started)
+    if proc.returncode != 0:
+        raise ffmpeg.Error('ffprobe', stdout, stderr)
+    return json.loads(stdout.decode('utf-8'))
+
+def parse_ffmpeg_progress(block: Dict[str, str]) -> Dict:
+    """Convert one block of ffmpeg `-progress` key=value output into numbers"""
+    def to_float(value: Optional[str]) -> Optional[float]:
+        try:
+            return float(value.rstrip('x')) if value else None
+        except ValueError:
+            return None  # ffmpeg reports "N/A" until it has a value
+
+    out_time_us = to_float(block.get('out_time_us') or block.get('out_time_ms'))
+    return {
+        'out_time': out_time_us / 1_000_000 if out_time_us is not None else None,
+        'fps': to_float(block.get('fps')),
+        'speed': to_float(block.get('speed')),
+        'finished': block.get('progress') == 'end'
+    }
+
+async def run_ffmpeg_async(stream, on_progress=None) -> None:
+    """Run an ffmpeg-python stream as an asyncio subprocess.
+
+    ffmpeg writes `-progress` blocks to stdout, which are parsed incrementally
+    and passed to `on_progress` (an async callable) as they arrive. Raises
+    ffmpeg.Error with the tail of stderr if ffmpeg fails.
+    """
+    args = stream.compile() if not isinstance(stream, list) else stream
+    args = [args[0], '-hide_banner', '-nostats', '-progress', 'pipe:1', *args[1:]]
+
+    proc = await asyncio.create_subprocess_exec(
+        *args,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+
+    # Drain stderr concurrently so ffmpeg never blocks on a full pipe
+    stderr_tail = deque(maxlen=50)
+
+    async def drain_stderr():
+        async for line in proc.stderr:
+            stderr_tail.append(line)
+
+    stderr_task = asyncio.create_task(drain_stderr())
+    ACTIVE_FFMPEG.inc()
+
     try:
-        probe = ffmpeg.probe(file_path)
-        
-        video_streams = []
-        audio_streams = []
-        subtitle_streams = []
-        
-        for stream in probe['streams']:
-            if stream['codec_type'] == 'video':
-                video_streams.append({
-                    'index': stream['index'],
-                    'codec': stream['codec_name'],
-                    'width': stream.get('width'),
-                    'height': stream.get('height'),
-                    'fps': eval(stream.get('r_frame_rate', '0/1'))
-                })
-            elif stream['codec_type'] == 'audio':
-                audio_streams.append({
-                    'index': stream['index'],
-                    'codec': stream['codec_name'],
-                    'language': stream.get('tags', {}).get('language', 'unknown')
-                })
-            elif stream['codec_type'] == 'subtitle':
-                subtitle_streams.append({
-                    'index': stream['index'],
-                    'codec': stream['codec_name'],
-                    'language': stream.get('tags', {}).get('language', 'unknown')
-                })
-        
-        # Extract chapters if available
-        chapters = []
-        if 'chapters' in probe:
-            for chapter in probe['chapters']:
-                chapters.append({
-                    'id': chapter['id'],
-                    'start': float(chapter['start_time']),
-                    'end': float(chapter['end_time']),
-                    'title': chapter.get('tags', {}).get('title', f'Chapter {chapter["id"]}')
-                })
-        
-        return {
-            'duration': float(probe['format']['duration']),
-            'format': probe['format']['format_name'],
-            'size': int(probe['format']['size']),
-            'video_streams': video_streams,
-            'audio_streams': audio_streams,
-            'subtitle_streams': subtitle_streams,
-            'chapters': chapters
-        }
+        block = {}
+        async for raw_line in proc.stdout:
+            line = raw_line.decode('utf-8', errors='replace').strip()
+            if '=' not in line:
+                continue
+            key, value = line.split('=', 1)
+            block[key] = value
+            if key == 'progress':
+                if on_progress:
+                    await on_progress(parse_ffmpeg_progress(block))
+                block = {}
+
+        await stderr_task
+        returncode = await proc.wait()
+    finally:
+        ACTIVE_FFMPEG.dec()
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+        stderr_task.cancel()
+
+    if returncode != 0:
+        raise ffmpeg.Error('ffmpeg', b'', b''.join(stderr_tail))
+
+class JobProgressTracker:
+    """Aggregate per-segment ffmpeg progress into throttled job updates.
+
+    Progress is weighted by segment duration, so segments running in parallel
+    and finishing out of order still add up correctly.
+    """
+
+    def __init__(self, job_id: str, durations: List[float], min_interval: float = PROGRESS_UPDATE_INTERVAL):
+        self.job_id = job_id
+        self.durations = [max(d, 0.0) for d in durations]
+        self.total_duration = sum(self.durations) or 1.0
+        self.done = [0.0] * len(durations)
+        self.speeds: Dict[int, float] = {}
+        self.completed = 0
+        self.min_interval = min_interval
+        self.last_flush = 0.0
+        self.last_progress = 0.0
+
+    async def update_segment(self, index: int, progress: Dict):
+        """Record live progress for one segment"""
+        if progress['out_time'] is not None:
+            self.done[index] = min(max(progress['out_time'], 0.0), self.durations[index])
+        if progress['speed'] is not None:
+            self.speeds[index] = progress['speed']
+        await self.flush()
+
+    async def complete_segment(self, index: int):
+        """Mark a segment as finished and write progress immediately"""
+        self.done[index] = self.durations[index]
+        self.speeds.pop(index, None)
+        self.completed += 1
+        publish_job_event(self.job_id, 'segment_completed', {
+            'segment': index + 1,
+            'segments_completed': self.completed,
+            'total_segments': len(self.durations)
+        })
+        await self.flush(force=True)
+
+    async def flush(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self.last_flush < self.min_interval:
+            return
+        self.last_flush = now
+
+        # Never let progress move backwards between writes
+        progress = min(sum(self.done) / self.total_duration * 100, 100.0)
+        self.last_progress = max(self.last_progress, progress)
+
+        extra = {'segments_completed': self.completed}
+        if self.speeds:
+            extra['encode_speed'] = round(sum(self.speeds.values()), 2)
+        await update_job_progress(self.job_id, round(self.last_progress, 2), extra=extra)
+
+def parse_frame_rate(value: Optional[str]) -> float:
+    """Parse an ffprobe rational like "30000/1001" without eval()"""
+    try:
+        rate = Fraction(value or '0/1')
+    except (ValueError, ZeroDivisionError):
+        return 0.0
+    return float(rate)
+
+def summarize_probe(probe: Dict) -> Dict:
+    """Reduce raw ffprobe output to the video info stored on jobs"""
+    video_streams = []
+    audio_streams = []
+    subtitle_streams = []
+
+    for stream in probe['streams']:
+        if stream['codec_type'] == 'video':
+            video_streams.append({
+                'index': stream['index'],
+                'codec': stream['codec_name'],
+                'width': stream.get('width'),
+                'height': stream.get('height'),
+                'fps': parse_frame_rate(stream.get('r_frame_rate'))
+            })
+        elif stream['codec_type'] == 'audio':
+            audio_streams.append({
+                'index': stream['index'],
+                'codec': stream['codec_name'],
+                'language': stream.get('tags', {}).get('language', 'unknown')
+            })
+        elif stream['codec_type'] == 'subtitle':
+            subtitle_streams.append({
+                'index': stream['index'],
+                'codec': stream['codec_name'],
+                'language': stream.get('tags', {}).get('language', 'unknown')
+            })
+
+    # Extract chapters if available
+    chapters = []
+    if 'chapters' in probe:
+        for chapter in probe['chapters']:
+            chapters.append({
+                'id': chapter['id'],
+                'start': float(chapter['start_time']),
+                'end': float(chapter['end_time']),
+                'title': chapter.get('tags', {}).get('title', f'Chapter {chapter["id"]}')
+            })
+
+    return {
+        'duration': float(probe['format']['duration']),
+        'format': probe['format']['format_name'],
+        'size': int(probe['format']['size']),
+        'video_streams': video_streams,
+        'audio_streams': audio_streams,
+        'subtitle_streams': subtitle_streams,
+        'chapters': chapters
+    }
+
+def file_identity(file_path: str) -> Dict:
+    """Identity of a file on disk; any change to size or mtime invalidates cached probes"""
+    stat = os.stat(file_path)
+    return {
+        'path': os.path.abspath(file_path),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns
+    }
+
+async def lookup_probe_cache(identity: Dict, content_hash: Optional[str], fast: bool) -> Optional[Dict]:
+    """Find cached video info in the in-process LRU, then in Mongo"""
+    key = (identity['path'], identity['size'], identity['mtime_ns'])
+    entry = probe_cache.get(key)
+    if entry is not None and (fast or not entry['fast']):
+        probe_cache.move_to_end(key)
+        return entry['video_info']
+
+    # Identical content (same hash) is as good as the same file
+    query = {'content_hash': content_hash} if content_hash else identity
+    try:
+        doc = await db.probe_cache.find_one(query)
+    except Exception as e:
+        logger.warning(f"Probe cache lookup failed: {e}")
+        return None
+    if not doc or (doc.get('fast') and not fast):
+        return None
+
+    remember_probe(key, doc['video_info'], doc.get('fast', False))
+    return doc['video_info']
+
+def remember_probe(key: tuple, video_info: Dict, fast: bool):
+    probe_cache[key] = {'video_info': video_info, 'fast': fast}
+    probe_cache.move_to_end(key)
+    while len(probe_cache) > PROBE_CACHE_SIZE:
+        probe_cache.popitem(last=False)
+
+async def store_probe_cache(identity: Dict, content_hash: Optional[str], fast: bool, video_info: Dict):
+    remember_probe((identity['path'], identity['size'], identity['mtime_ns']), video_info, fast)
+    try:
+        # One entry per path: a changed file overwrites its stale entry
+        await db.probe_cache.update_one(
+            {'path': identity['path']},
+            {'$set': {
+                **identity,
+                'content_hash': content_hash,
+                'fast': fast,
+                'video_info': video_info,
+                'updated_at': datetime.utcnow()
+            }},
+            upsert=True
+        )
+    except Exception as e:
+        logger.warning(f"Probe cache store failed: {e}")
+
+async def forget_probe(file_path: str):
+    """Drop cached probes for a file that is being deleted"""
+    path = os.path.abspath(file_path)
+    for key in [key for key in probe_cache if key[0] == path]:
+        del probe_cache[key]
+    await db.probe_cache.delete_one({'path': path})
+
+async def get_video_info(file_path: str, fast: bool = False, content_hash: Optional[str] = None) -> Dict:
+    """Extract video information using ffprobe, served from the probe cache when possible.
+
+    With `fast=True` ffprobe only reads a bounded amount of the file header
+    (FAST_PROBE_SIZE / FAST_PROBE_DURATION), which is enough for the upload
+    response; a cached full probe also satisfies fast requests.
+    """
+    try:
+        identity = file_identity(file_path)
+        cached = await lookup_probe_cache(identity, content_hash, fast)
+        if cached is not None:
+            return cached
+
+        extra_args = []
+        if fast:
+            extra_args = ['-probesize', str(FAST_PROBE_SIZE), '-analyzeduration', str(FAST_PROBE_DURATION)]
+        probe = await run_ffprobe_async(file_path, *extra_args)
+        video_info = summarize_probe(probe)
+
+        await store_probe_cache(identity, content_hash, fast, video_info)
+        return video_info
     except Exception as e:
         logger.error(f"Error getting video info: {e}")
         raise HTTPException(status_code=500, detail=f"Error analyzing video: {str(e)}")
 
-async def split_video_with_subtitles(
-    input_path: str, 
-    output_dir: str, 
-    splits: List[Dict], 
+# Encoder tuning
+# Speed tiers map straight to libx264 presets. A target realtime factor picks
+# the slowest (best quality) preset that the host's calibrated throughput
+# profile says can keep up, scaled by the source's real resolution and fps.
+SPEED_TIER_PRESETS = {
+    'fastest': 'veryfast',
+    'balanced': 'medium',
+    'archival': 'slow'
+}
+CALIBRATION_PRESETS = ['ultrafast', 'superfast', 'veryfast', 'faster', 'fast', 'medium', 'slow']
+CALIBRATION_SIZE = (1280, 720)
+CALIBRATION_FPS = 30
+
+encoder_profile: Optional[Dict] = None
+
+async def get_encoder_profile() -> Optional[Dict]:
+    """This host's calibrated encoder throughput profile, if one was recorded"""
+    global encoder_profile
+    if encoder_profile is None:
+        encoder_profile = await db.encoder_profiles.find_one(
+            {'host': os.uname().nodename}, {'_id': 0}
+        )
+    return encoder_profile
+
+async def calibrate_encoder(duration: float = 5.0, thread_counts: Optional[List[int]] = None) -> Dict:
+    """Benchmark libx264 presets and thread counts on a synthetic clip and store the profile"""
+    global encoder_profile
+    cores = os.cpu_count() or 1
+    thread_counts = thread_counts or sorted({1, max(1, cores // 2), cores})
+    width, height = CALIBRATION_SIZE
+    frames = duration * CALIBRATION_FPS
+
+    results = []
+    for preset in CALIBRATION_PRESETS:
+        for threads in thread_counts:
+            stream = (
+                ffmpeg.input(
+                    f"testsrc2=size={width}x{height}:rate={CALIBRATION_FPS}",
+                    f='lavfi', t=duration
+                )
+                .output('-', f='null', vcodec='libx264', preset=preset, threads=threads)
+            )
+            started = time.monotonic()
+            await run_ffmpeg_async(stream)
+            elapsed = time.monotonic() - started
+            results.append({
+                'preset': preset,
+                'threads': threads,
+                'fps': round(frames / elapsed, 2)
+            })
+            logger.info(f"Encoder calibration: {preset} x{threads} threads -> {frames / elapsed:.1f} fps")
+
+    profile = {
+        'host': os.uname().nodename,
+        'cores': cores,
+        'width': width,
+        'height': height,
+        'results': results,
+        'created_at': datetime.utcnow()
+    }
+    await db.encoder_profiles.replace_one({'host': profile['host']}, profile, upsert=True)
+    profile.pop('_id', None)
+    encoder_profile = profile
+    return profile
+
+def source_fps(video_info: Optional[Dict]) -> Optional[float]:
+    streams = (video_info or {}).get('video_streams') or []
+    fps = streams[0].get('fps') if streams else None
+    return fps if fps and fps > 0 else None
+
+def resolve_encoder_settings(
     config: SplitConfig,
-    job_id: str
-) -> List[str]:
-    """Split video while preserving subtitles"""
-    output_files = []
-    
+    video_info: Optional[Dict] = None,
+    parallel: int = 1,
+    profile: Optional[Dict] = None
+) -> Dict:
+    """Pick libx264 preset, CRF and thread count for a job"""
+    # Concurrent segments share the cores; libx264's auto thread count would
+    # give every one of them all the cores
+    threads = max(1, (os.cpu_count() or 1) // max(1, parallel))
+    settings = {
+        'preset': SPEED_TIER_PRESETS.get(config.speed_tier or 'balanced', 'medium'),
+        'crf': '18' if config.preserve_quality else '23',
+        'threads': threads
+    }
+
+    if config.target_realtime_factor and profile and profile.get('results'):
+        streams = (video_info or {}).get('video_streams') or []
+        width = (streams[0].get('width') if streams else None) or profile['width']
+        height = (streams[0].get('height') if streams else None) or profile['height']
+        fps = source_fps(video_info) or CALIBRATION_FPS
+
+        # Encode fps needed per segment, in calibration-resolution frames
+        pixel_scale = (width * height) / (profile['width'] * profile['height'])
+        required = fps * config.target_realtime_factor * pixel_scale
+
+        nearest = min({row['threads'] for row in profile['results']}, key=lambda t: abs(t - threads))
+        rows = {row['preset']: row for row in profile['results'] if row['threads'] == nearest}
+
+        # Slowest preset that keeps up; the fastest one if none does
+        chosen = next(
+            (preset for preset in reversed(CALIBRATION_PRESETS) if preset in rows and rows[preset]['fps'] >= required),
+            next((preset for preset in CALIBRATION_PRESETS if preset in rows), settings['preset'])
+        )
+        settings.update({'preset': chosen, 'threads': nearest})
+
+    return settings
+
+def segment_parallelism(config: SplitConfig, total_splits: int) -> int:
+    """Number of segments a job encodes at once (per job override wins)"""
+    if config.engine == "segment_muxer":
+        return 1
+    return max(1, min(config.max_parallel_segments or MAX_PARALLEL_SEGMENTS, total_splits))
+
+def build_segment_output_args(config: SplitConfig, encoder: Optional[Dict] = None, fps: Optional[float] = None) -> Dict:
+    """Build ffmpeg output options for a split segment"""
+    encoder = encoder or resolve_encoder_settings(config)
+
+    # Configure output based on quality settings and keyframes
+    if config.preserve_quality and not config.force_keyframes:
+        # Copy streams without re-encoding (fastest but no keyframe control)
+        output_args = {
+            'c:v': 'copy',
+            'c:a': 'copy'
+        }
+    else:
+        # Re-encode with optional keyframe control
+        output_args = {
+            'c:v': 'libx264',  # Video codec
+            'c:a': 'aac'       # Audio codec
+        }
+
+        # Add keyframe settings (simplified)
+        if config.force_keyframes:
+            # GOP length from the source's real frame rate (30fps if unknown)
+            gop_size = max(1, round(config.keyframe_interval * (fps or 30)))
+
+            output_args.update({
+                'g': gop_size,  # GOP size
+                'keyint_min': gop_size,  # Minimum interval between keyframes
+                'sc_threshold': '0'  # Disable scene change detection
+                # Removed complex force_key_frames for now
+            })
+
+        # Quality/speed settings for re-encoding (crf 18 preserves quality, 23 is standard)
+        output_args.update({
+            'crf': encoder['crf'],
+            'preset': encoder['preset']
+        })
+        if encoder.get('threads'):
+            output_args['threads'] = encoder['threads']
+
+    # Subtitles (and their sync offset) are added per segment by the subtitle pipeline
+    return output_args
+
+# Packet index: per-upload video packet table (pts, byte position, size,
+# keyframe flag) stored next to the upload as typed arrays and memory-mapped
+# on read, so keyframe lookups never need to re-run ffprobe.
+PACKET_INDEX_MAGIC = b'VSPKIDX1'
+PACKET_INDEX_HEADER = struct.Struct('<8sQQ')  # magic, packet count, keyframe count
+
+class PacketIndex:
+    """Read-only, memory-mapped view of a packet index file"""
+
+    def __init__(self, index_path: str):
+        self.path = index_path
+        self._file = open(index_path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, keyframe_count = PACKET_INDEX_HEADER.unpack_from(self._mmap, 0)
+        if magic != PACKET_INDEX_MAGIC:
+            self.close()
+            raise ValueError(f"Not a packet index: {index_path}")
+
+        view = memoryview(self._mmap)
+        offset = PACKET_INDEX_HEADER.size
+
+        def section(typecode: str, length: int) -> memoryview:
+            nonlocal offset
+            size = array(typecode).itemsize * length
+            part = view[offset:offset + size].cast(typecode)
+            offset += size
+            return part
+
+        # Packets sorted by pts, followed by the keyframe subset
+        self.pts = section('d', count)
+        self.pos = section('q', count)
+        self.size = section('I', count)
+        self.keyframe_pts = section('d', keyframe_count)
+        self.keyframe_pos = section('q', keyframe_count)
+        self.count = count
+
+    def keyframes(self, start: float = 0.0, end: Optional[float] = None) -> List[float]:
+        """Keyframe timestamps within [start, end]"""
+        lo, hi = self._range(self.keyframe_pts, start, end)
+        return list(self.keyframe_pts[lo:hi])
+
+    def keyframe_entries(self, start: float = 0.0, end: Optional[float] = None) -> List[Dict]:
+        lo, hi = self._range(self.keyframe_pts, start, end)
+        return [
+            {'time': self.keyframe_pts[i], 'pos': self.keyframe_pos[i]}
+            for i in range(lo, hi)
+        ]
+
+    def byte_range(self, start: float, end: float) -> int:
+        """Total packet bytes within [start, end) (used by split cost estimates)"""
+        lo = bisect.bisect_left(self.pts, start)
+        hi = bisect.bisect_left(self.pts, end)
+        return sum(self.size[lo:max(lo, hi)])
+
+    @staticmethod
+    def _range(values: memoryview, start: float, end: Optional[float]):
+        lo = bisect.bisect_left(values, start)
+        hi = len(values) if end is None else bisect.bisect_right(values, end)
+        return lo, max(lo, hi)
+
+    def close(self):
+        for name in ('pts', 'pos', 'size', 'keyframe_pts', 'keyframe_pos'):
+            view = getattr(self, name, None)
+            if view is not None:
+                view.release()
+        self._mmap.close()
+        self._file.close()
+
+# Open packet indexes keyed by source path, so the mapping is shared by requests
+packet_indexes: Dict[str, PacketIndex] = {}
+
+def packet_index_path(file_path: str) -> str:
+    return f"{file_path}.pktidx"
+
+def open_packet_index(file_path: str) -> Optional[PacketIndex]:
+    """Return the memory-mapped packet index for a source file, if one exists"""
+    index = packet_indexes.get(file_path)
+    if index is not None:
+        return index
+
+    index_path = packet_index_path(file_path)
+    if not os.path.exists(index_path):
+        return None
     try:
-        # Create output directory
-        os.makedirs(output_dir, exist_ok=True)
-        
-        total_splits = len(splits)
-        
-        for i, split in enumerate(splits):
-            start_time = split['start']
-            end_time = split['end']
-            duration = end_time - start_time
-            
-            # Generate output filename
-            base_name = Path(input_path).stem
-            output_filename = f"{base_name}_part_{i+1:03d}.{config.output_format}"
-            output_path = os.path.join(output_dir, output_filename)
-            
-            # Build ffmpeg command
-            input_stream = ffmpeg.input(input_path, ss=start_time, t=duration)
-            
-            # Configure output based on quality settings and keyframes
-            if config.preserve_quality and not config.force_keyframes:
-                # Copy streams without re-encoding (fastest but no keyframe control)
-                output_args = {
-                    'c:v': 'copy',
-                    'c:a': 'copy',
-                    'c:s': 'copy'  # Copy subtitle streams
-                }
-            else:
-                # Re-encode with optional keyframe control
-                output_args = {
-                    'c:v': 'libx264',  # Video codec
-                    'c:a': 'aac',      # Audio codec
-                    'c:s': 'copy'      # Copy subtitle streams
-                }
-                
-                # Add keyframe settings (simplified)
-                if config.force_keyframes:
-                    # Very simple keyframe settings
-                    gop_size = int(config.keyframe_interval * 30)  # 30fps assumption
-                    
-                    output_args.update({
-                        'g': gop_size,  # GOP size 
-                        'keyint_min': gop_size,  # Minimum interval between keyframes
-                        'sc_threshold': '0'  # Disable scene change detection
-                        # Removed complex force_key_frames for now
-                    })
-                
-                # Quality settings for re-encoding
-                if config.preserve_quality:
-                    output_args.update({
-                        'crf': '18',  # High quality (lower = better quality)
-                        'preset': 'medium'  # Balanced speed/quality
-                    })
-                else:
-                    output_args.update({
-                        'crf': '23',  # Standard quality
-                        'preset': 'medium'
-                    })
-            
-            # Add subtitle sync offset if specified
-            if config.subtitle_sync_offset != 0:
-                output_args['itsoffset'] = -config.subtitle_sync_offset
-            
-            # Run ffmpeg
-            try:
-                (
-                    input_stream
-                    .output(output_path, **output_args)
-                    .overwrite_output()
-                    .run(capture_stdout=True, capture_stderr=True)
-                )
-                
-                output_files.append(output_path)
-                
-                # Update progress
-                progress = ((i + 1) / total_splits) * 100
-                await update_job_progress(job_id, progress)
-                
-            except ffmpeg.Error as e:
-                error_msg = e.stderr.decode() if e.stderr else str(e)
-                logger.error(f"FFmpeg error for split {i+1}: {error_msg}")
-                raise Exception(f"Error processing split {i+1}: {error_msg}")
-            except Exception as e:
-                logger.error(f"General error for split {i+1}: {str(e)}")
-                raise e
-    
+        index = PacketIndex(index_path)
+    except (OSError, ValueError, struct.error) as e:
+        logger.error(f"Unreadable packet index {index_path}: {e}")
+        return None
+    packet_indexes[file_path] = index
+    return index
+
+async def load_packet_index(file_path: str) -> Optional[PacketIndex]:
+    """open_packet_index, fetching the index first if another node built it"""
+    index = open_packet_index(file_path)
+    if index is not None or os.path.exists(packet_index_path(file_path)):
+        return index
+    try:
+        if not await is_stored(packet_index_path(file_path)):
+            return None
+        await localize(packet_index_path(file_path))
     except Exception as e:
-        logger.error(f"Error splitting video: {e}")
-        raise e
-    
-    return output_files
+        logger.warning(f"Could not fetch the packet index of {file_path}: {e}")
+        return None
+    return open_packet_index(file_path)
 
-async def update_job_progress(job_id: str, progress: float, status: str = None):
-    """Update job progress in database"""
-    update_data = {
-        'progress': progress,
-        'updated_at': datetime.utcnow()
-    }
-    if status:
-        update_data['status'] = status
-    
-    await db.video_jobs.update_one(
-        {'id': job_id},
-        {'$set': update_data}
+def close_packet_index(file_path: str):
+    index = packet_indexes.pop(file_path, None)
+    if index is not None:
+        index.close()
+
+async def build_packet_index(file_path: str) -> str:
+    """Scan the first video stream's packets once and persist them as a packet index"""
+    args = [
+        'ffprobe', '-v', 'error', '-select_streams', 'v:0',
+        '-show_entries', 'packet=pts_time,dts_time,pos,size,flags',
+        '-of', 'csv=p=0', file_path
+    ]
+    started = time.monotonic()
+    proc = await asyncio.create_subprocess_exec(
+        *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
     )
 
-async def process_video_job(job_id: str, file_path: str, config: SplitConfig):
-    """Background task to process video splitting"""
+    packets = []
+    async for raw_line in proc.stdout:
+        fields = raw_line.decode().strip().split(',')
+        if len(fields) < 5:
+            continue
+        pts_time, dts_time, size, pos, flags = fields[:5]
+        timestamp = pts_time if pts_time not in ('', 'N/A') else dts_time
+        if timestamp in ('', 'N/A'):
+            continue
+        packets.append((
+            float(timestamp),
+            int(pos) if pos not in ('', 'N/A') else -1,
+            int(size) if size not in ('', 'N/A') else 0,
+            'K' in flags
+        ))
+    stderr = await proc.stderr.read()
+    returncode = await proc.wait()
+    FFPROBE_SECONDS.observe(time.monotonic() - started)
+    if returncode != 0:
+        raise ffmpeg.Error('ffprobe', b'', stderr)
+
+    # Packets arrive in decode order; sort by presentation time for lookups
+    packets.sort(key=lambda packet: packet[0])
+    keyframes = [packet for packet in packets if packet[3]]
+
+    index_path = packet_index_path(file_path)
+    tmp_path = f"{index_path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(PACKET_INDEX_HEADER.pack(PACKET_INDEX_MAGIC, len(packets), len(keyframes)))
+        array('d', (packet[0] for packet in packets)).tofile(f)
+        array('q', (packet[1] for packet in packets)).tofile(f)
+        array('I', (packet[2] for packet in packets)).tofile(f)
+        array('d', (packet[0] for packet in keyframes)).tofile(f)
+        array('q', (packet[1] for packet in keyframes)).tofile(f)
+    close_packet_index(file_path)
+    os.replace(tmp_path, index_path)
+
+    logger.info(f"Packet index built for {file_path}: {len(packets)} packets, {len(keyframes)} keyframes")
+    return index_path
+
+async def index_uploaded_video(job_id: str, file_path: str):
+    """Background task: build the packet index for an upload and record it on the job"""
+    await db.video_jobs.update_one({'id': job_id}, {'$set': {'packet_index': 'building'}})
     try:
-        # Update status to processing
-        await update_job_progress(job_id, 0, "processing")
-        
-        # Get video info
-        video_info = await get_video_info(file_path)
-        
-        # Generate splits based on method
-        splits = []
-        if config.method == "time_based" and config.time_points:
-            # Sort time points
-            time_points = sorted(config.time_points)
-            for i in range(len(time_points)):
-                start = time_points[i]
-                end = time_points[i + 1] if i + 1 < len(time_points) else video_info['duration']
-                splits.append({'start': start, 'end': end})
-        
-        elif config.method == "intervals" and config.interval_duration:
-            duration = video_info['duration']
-            current_time = 0
-            while current_time < duration:
-                end_time = min(current_time + config.interval_duration, duration)
-                splits.append({'start': current_time, 'end': end_time})
-                current_time = end_time
-        
-        elif config.method == "chapters" and video_info['chapters']:
-            for chapter in video_info['chapters']:
-                splits.append({'start': chapter['start'], 'end': chapter['end']})
-        
-        if not splits:
-            raise Exception("No valid splits generated")
-        
-        # Create output directory for this job
-        output_dir = OUTPUT_DIR / job_id
-        
-        # Split the video
-        output_files = await split_video_with_subtitles(
-            file_path, str(output_dir), splits, config, job_id
+        index_path = await build_packet_index(file_path)
+        # Jobs and keyframe requests may be served by other nodes
+        await publish_file(index_path)
+        await db.video_jobs.update_one(
+            {'id': job_id},
+            {'$set': {'packet_index': 'ready', 'packet_index_path': index_path}}
         )
-        
-        # Update job with completion
+    except Exception as e:
+        logger.error(f"Error building packet index for job {job_id}: {e}")
+        await db.video_jobs.update_one({'id': job_id}, {'$set': {'packet_index': 'failed'}})
+
+# Thumbnail sprite sheets
+
+def format_vtt_timestamp(seconds: float) -> str:
+    millis = int(round(seconds * 1000))
+    hours, millis = divmod(millis, 3600000)
+    minutes, millis = divmod(millis, 60000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}.{millis:03d}"
+
+async def generate_thumbnail_sprites(job_id: str, file_path: str) -> Dict:
+    """Decode the source once, sampling a downscaled frame per interval into sprite sheets.
+
+    Writes sprite_NNN.jpg, thumbnails.vtt (media fragment cues for players) and
+    thumbnails.json (the same layout for custom timeline UIs) under PREVIEW_DIR/job_id.
+    """
+    video_info = await get_video_info(file_path)
+    if not video_info['video_streams']:
+        raise ValueError("No video stream to generate thumbnails from")
+
+    video = video_info['video_streams'][0]
+    duration = video_info['duration']
+    width = THUMBNAIL_WIDTH
+    # Even height keeps the scaler and JPEG encoder happy
+    height = max(2, round(width * (video['height'] or 9) / (video['width'] or 16) / 2) * 2)
+    per_sheet = SPRITE_COLUMNS * SPRITE_ROWS
+    count = max(1, int(-(-duration // THUMBNAIL_INTERVAL)))
+
+    preview_dir = PREVIEW_DIR / job_id
+    work_dir = PREVIEW_DIR / f".{job_id}.tmp"
+    shutil.rmtree(work_dir, ignore_errors=True)
+    work_dir.mkdir(parents=True)
+
+    stream = (
+        ffmpeg.input(file_path)
+        .video
+        .filter('fps', fps=f"1/{THUMBNAIL_INTERVAL}")
+        .filter('scale', width, height)
+        .filter('tile', f"{SPRITE_COLUMNS}x{SPRITE_ROWS}")
+        .output(str(work_dir / 'sprite_%03d.jpg'), start_number=0, vsync='0', **{'q:v': 5})
+    )
+    await run_ffmpeg_async(stream)
+
+    sheets = sorted(path.name for path in work_dir.glob('sprite_*.jpg'))
+    count = min(count, len(sheets) * per_sheet)
+
+    thumbnails = []
+    cues = ['WEBVTT', '']
+    for i in range(count):
+        start = i * THUMBNAIL_INTERVAL
+        end = min(start + THUMBNAIL_INTERVAL, duration)
+        sheet = sheets[i // per_sheet]
+        x = (i % per_sheet) % SPRITE_COLUMNS * width
+        y = (i % per_sheet) // SPRITE_COLUMNS * height
+        thumbnails.append({'start': start, 'end': end, 'sheet': sheet, 'x': x, 'y': y})
+        cues.append(f"{format_vtt_timestamp(start)} --> {format_vtt_timestamp(end)}")
+        cues.append(f"{sheet}#xywh={x},{y},{width},{height}")
+        cues.append('')
+
+    manifest = {
+        'interval': THUMBNAIL_INTERVAL,
+        'width': width,
+        'height': height,
+        'columns': SPRITE_COLUMNS,
+        'rows': SPRITE_ROWS,
+        'count': count,
+        'sheets': sheets,
+        'thumbnails': thumbnails
+    }
+    (work_dir / 'thumbnails.vtt').write_text('\n'.join(cues))
+    (work_dir / 'thumbnails.json').write_text(json.dumps(manifest))
+
+    # Publish the finished set atomically so readers never see partial sheets
+    shutil.rmtree(preview_dir, ignore_errors=True)
+    os.replace(work_dir, preview_dir)
+    await publish_directory(preview_dir)
+
+    logger.info(f"Generated {count} thumbnails in {len(sheets)} sprite sheets for job {job_id}")
+    return manifest
+
+async def prepare_thumbnails(job_id: str, file_path: str):
+    """Background task: build timeline sprite sheets for an upload and record it on the job"""
+    await db.video_jobs.update_one({'id': job_id}, {'$set': {'thumbnails': 'building'}})
+    try:
+        manifest = await generate_thumbnail_sprites(job_id, file_path)
         await db.video_jobs.update_one(
             {'id': job_id},
-            {'$set': {
-                'status': 'completed',
-                'progress': 100.0,
-                'splits': [{'file': os.path.basename(f)} for f in output_files],
-                'updated_at': datetime.utcnow()
+            {'$set': {'thumbnails': 'ready', 'thumbnail_count': manifest['count']}}
+        )
+    except Exception as e:
+        logger.error(f"Error generating thumbnails for job {job_id}: {e}")
+        shutil.rmtree(PREVIEW_DIR / f".{job_id}.tmp", ignore_errors=True)
+        await db.video_jobs.update_one({'id': job_id}, {'$set': {'thumbnails': 'failed'}})
+
+# HLS preview proxy
+
+preview_proxy_slots: Optional[asyncio.Semaphore] = None
+preview_proxy_tasks: Dict[str, asyncio.Task] = {}
+
+async def build_preview_proxy(job_id: str, file_path: str):
+    """Encode a low-resolution HLS rendition of an upload into PROXY_DIR/job_id.
+
+    The playlist is an EVENT playlist rewritten after every segment, so players
+    can start on the first few seconds while the rest is still encoding.
+    """
+    video_info = await get_video_info(file_path)
+    if not video_info['video_streams']:
+        raise ValueError("No video stream to build a preview from")
+
+    video = video_info['video_streams'][0]
+    fps = source_fps(video_info) or 30
+    # Never upscale; keep dimensions even for yuv420p
+    height = min(PREVIEW_HEIGHT, video['height'] or PREVIEW_HEIGHT) // 2 * 2
+    gop_size = max(1, round(fps * PREVIEW_SEGMENT_SECONDS))
+
+    proxy_dir = PROXY_DIR / job_id
+    shutil.rmtree(proxy_dir, ignore_errors=True)
+    proxy_dir.mkdir(parents=True)
+
+    source = ffmpeg.input(file_path)
+    stream = ffmpeg.output(
+        source['v:0'].filter('scale', -2, height),
+        source['a:0?'],
+        str(proxy_dir / 'index.m3u8'),
+        f='hls',
+        hls_time=PREVIEW_SEGMENT_SECONDS,
+        hls_playlist_type='event',
+        hls_flags='temp_file',
+        hls_segment_filename=str(proxy_dir / 'segment_%05d.ts'),
+        g=gop_size,
+        keyint_min=gop_size,
+        sc_threshold='0',
+        pix_fmt='yuv420p',
+        ac=2,
+        **{
+            'c:v': 'libx264',
+            'preset': 'veryfast',
+            'b:v': PREVIEW_VIDEO_BITRATE,
+            'maxrate': PREVIEW_VIDEO_BITRATE,
+            'bufsize': PREVIEW_VIDEO_BITRATE,
+            'c:a': 'aac',
+            'b:a': PREVIEW_AUDIO_BITRATE
+        }
+    )
+    await run_ffmpeg_async(stream)
+    # Other nodes serve the finished rendition from storage
+    await publish_directory(proxy_dir)
+    logger.info(f"Preview proxy ready for job {job_id}")
+
+async def prepare_preview_proxy(job_id: str, file_path: str):
+    """Background task: build the preview proxy for an upload and record it on the job"""
+    global preview_proxy_slots
+    if preview_proxy_slots is None:
+        preview_proxy_slots = asyncio.Semaphore(max(1, PREVIEW_PROXY_CONCURRENCY))
+
+    await db.video_jobs.update_one({'id': job_id}, {'$set': {'preview': 'queued'}})
+    try:
+        async with preview_proxy_slots:
+            await db.video_jobs.update_one({'id': job_id}, {'$set': {'preview': 'building'}})
+            await localize(file_path)
+            await build_preview_proxy(job_id, file_path)
+        await db.video_jobs.update_one({'id': job_id}, {'$set': {'preview': 'ready'}})
+    except asyncio.CancelledError:
+        shutil.rmtree(PROXY_DIR / job_id, ignore_errors=True)
+        raise
+    except Exception as e:
+        logger.error(f"Error building preview proxy for job {job_id}: {e}")
+        await db.video_jobs.update_one({'id': job_id}, {'$set': {'preview': 'failed'}})
+    finally:
+        preview_proxy_tasks.pop(job_id, None)
+
+async def start_preview_proxy(job_id: str, file_path: str):
+    """Start building a job's preview proxy unless one is already running"""
+    if job_id not in preview_proxy_tasks:
+        preview_proxy_tasks[job_id] = asyncio.create_task(prepare_preview_proxy(job_id, file_path))
+
+async def probe_keyframes(input_path: str, start: float, end: float) -> List[float]:
+    """Return video keyframe timestamps between start and end (seconds)"""
+    index = await load_packet_index(input_path)
+    if index is not None:
+        return index.keyframes(start, end)
+
+    args = [
+        'ffprobe', '-v', 'error', '-select_streams', 'v:0',
+        '-read_intervals', f"{start}%{end}",
+        '-show_entries', 'packet=pts_time,flags', '-of', 'csv=p=0', input_path
+    ]
+    started = time.monotonic()
+    proc = await asyncio.create_subprocess_exec(
+        *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    stdout, stderr = await proc.communicate()
+    FFPROBE_SECONDS.observe(time.monotonic() - started)
+    if proc.returncode != 0:
+        raise ffmpeg.Error('ffprobe', stdout, stderr)
+
+    keyframes = []
+    for line in stdout.decode().splitlines():
+        pts_time, _, flags = line.partition(',')
+        if 'K' in flags and pts_time not in ('', 'N/A'):
+            keyframes.append(float(pts_time))
+    return sorted(keyframes)
+
+# Subtitle pipeline
+# Text subtitle streams are extracted from the source once per job (one ffmpeg
+# run for all of them) into sorted cue lists. Each segment then gets its own
+# slice of every track, rebased to the segment start and shifted by the sync
+# offset, written as SRT and muxed in and/or kept as a sidecar file.
+IMAGE_SUBTITLE_CODECS = ('hdmv_pgs_subtitle', 'dvd_subtitle', 'dvb_subtitle', 'xsub')
+SUBTITLE_MUX_CODECS = {
+    'mp4': 'mov_text',
+    'mov': 'mov_text',
+    'mkv': 'srt',
+    'webm': 'webvtt'
+}
+SRT_TIMESTAMP = re.compile(r'(\d+):(\d{2}):(\d{2})[,.](\d{3})')
+
+class SubtitleTrack:
+    """Cues of one text subtitle stream, sorted by start time"""
+
+    def __init__(self, index: int, language: str, cues: List[tuple]):
+        self.index = index
+        self.language = language
+        self.cues = sorted(cues)
+        self.starts = [cue[0] for cue in self.cues]
+        self.max_duration = max((end - start for start, end, _ in self.cues), default=0.0)
+        self.suffix = language
+
+    def cues_between(self, start: float, end: float) -> List[tuple]:
+        """Cues overlapping [start, end); no cue starts before start - max_duration"""
+        lo = bisect.bisect_left(self.starts, start - self.max_duration)
+        hi = bisect.bisect_left(self.starts, end)
+        return [cue for cue in self.cues[lo:hi] if cue[1] > start]
+
+def parse_srt_timestamp(value: str) -> float:
+    hours, minutes, seconds, millis = SRT_TIMESTAMP.match(value.strip()).groups()
+    return int(hours) * 3600 + int(minutes) * 60 + int(seconds) + int(millis) / 1000
+
+def format_srt_timestamp(seconds: float) -> str:
+    return format_vtt_timestamp(seconds).replace('.', ',')
+
+def parse_srt(text: str) -> List[tuple]:
+    cues = []
+    for block in re.split(r'\n\s*\n', text.replace('\r\n', '\n').strip()):
+        lines = block.split('\n')
+        timing = next((n for n, line in enumerate(lines) if '-->' in line), None)
+        if timing is None:
+            continue
+        start, end = lines[timing].split('-->')
+        cue_text = '\n'.join(lines[timing + 1:]).strip()
+        if cue_text:
+            cues.append((parse_srt_timestamp(start), parse_srt_timestamp(end.split()[0]), cue_text))
+    return cues
+
+async def extract_subtitle_tracks(input_path: str, video_info: Dict, work_dir: Path) -> List[SubtitleTrack]:
+    """Convert every text subtitle stream to SRT in a single ffmpeg run and load the cues"""
+    streams = [
+        stream for stream in video_info['subtitle_streams']
+        if stream['codec'] not in IMAGE_SUBTITLE_CODECS
+    ]
+    if not streams:
+        return []
+
+    work_dir.mkdir(parents=True, exist_ok=True)
+    source = ffmpeg.input(input_path)
+    outputs = [
+        source[str(stream['index'])].output(str(work_dir / f"track_{stream['index']}.srt"), **{'c:s': 'srt'})
+        for stream in streams
+    ]
+    await run_ffmpeg_async(ffmpeg.merge_outputs(*outputs).overwrite_output())
+
+    tracks = []
+    for stream in streams:
+        track_path = work_dir / f"track_{stream['index']}.srt"
+        async with aiofiles.open(track_path, 'r', encoding='utf-8', errors='replace') as f:
+            cues = parse_srt(await f.read())
+        track_path.unlink()
+        tracks.append(SubtitleTrack(stream['index'], stream['language'], cues))
+
+    # Sidecar names are <segment>.<language>.srt, numbered when languages repeat
+    languages = [track.language for track in tracks]
+    for track in tracks:
+        if languages.count(track.language) > 1:
+            track.suffix = f"{track.language}.{track.index}"
+
+    logger.info(f"Extracted {len(tracks)} subtitle tracks ({sum(len(t.cues) for t in tracks)} cues) from {input_path}")
+    return tracks
+
+def write_subtitle_slices(
+    tracks: List[SubtitleTrack],
+    start: float,
+    end: float,
+    sync_offset: float,
+    directory: str,
+    stem: str
+) -> List[Dict]:
+    """Write each track's cues for [start, end) as SRT, timed from the segment start"""
+    # A positive sync offset shows cues earlier, so read the source that much later
+    window_start = start + sync_offset
+    window_end = end + sync_offset
+    written = []
+    for track in tracks:
+        cues = track.cues_between(window_start, window_end)
+        if not cues:
+            continue
+        blocks = []
+        for n, (cue_start, cue_end, text) in enumerate(cues, 1):
+            cue_start = max(cue_start, window_start) - window_start
+            cue_end = min(cue_end, window_end) - window_start
+            blocks.append(f"{n}\n{format_srt_timestamp(cue_start)} --> {format_srt_timestamp(cue_end)}\n{text}\n")
+        path = os.path.join(directory, f"{stem}.{track.suffix}.srt")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(blocks))
+        written.append({'path': path, 'language': track.language})
+    return written
+
+def subtitle_output_streams(source, subtitle_files: List[Dict], image_streams: List[Dict], output_format: str) -> tuple:
+    """Subtitle streams and per-stream options to mux into one output"""
+    codec = SUBTITLE_MUX_CODECS.get(output_format)
+    if not codec:
+        return [], {}
+
+    streams = []
+    args = {}
+    for subtitle in subtitle_files:
+        n = len(streams)
+        streams.append(ffmpeg.input(subtitle['path'])['s:0'])
+        args[f'c:s:{n}'] = codec
+        args[f'metadata:s:s:{n}'] = f"language={subtitle['language']}"
+    # Bitmap subtitles can only be carried over as-is, which only Matroska supports
+    if output_format == 'mkv':
+        for stream in image_streams:
+            n = len(streams)
+            streams.append(source[str(stream['index'])])
+            args[f'c:s:{n}'] = 'copy'
+            args[f'metadata:s:s:{n}'] = f"language={stream['language']}"
+    return streams, args
+
+def image_subtitle_streams(video_info: Dict, output_format: str, job_id: str) -> List[Dict]:
+    streams = [
+        stream for stream in video_info['subtitle_streams']
+        if stream['codec'] in IMAGE_SUBTITLE_CODECS
+    ]
+    if streams and output_format != 'mkv':
+        logger.info(f"Job {job_id}: {len(streams)} bitmap subtitle streams cannot be stored in {output_format}, skipping them")
+    return streams
+
+# Smart cut
+# Segments are stream-copied from their first IDR frame on; only the frames
+# before it are re-encoded. The head is encoded to the source's SPS (profile,
+# level, bit depth and chroma format, reference frames) and both pieces keep
+# their parameter sets in-band, which MP4/MOV outputs signal with the avc3
+# sample entry. Sources libx264 cannot match are re-encoded in full.
+SMART_CUT_FORMATS = ('mp4', 'mov', 'mkv')
+SMART_CUT_IDR_CANDIDATES = 8  # keyframes checked per segment for an IDR frame
+
+# ffprobe profile names -> libx264 profiles
+X264_PROFILES = {
+    'Constrained Baseline': 'baseline',
+    'Baseline': 'baseline',
+    'Main': 'main',
+    'High': 'high',
+    'High 10': 'high10',
+    'High 4:2:2': 'high422',
+    'High 4:4:4 Predictive': 'high444',
+}
+TRACE_FIELD_PATTERN = re.compile(r'\]\s+\d+\s+(\S+)\s+[01]+ = (-?\d+)$')
+NAL_IDR_SLICE = 5
+
+# Pixel formats the installed libx264 can encode (filled on first use)
+libx264_pix_fmts: Optional[set] = None
+
+async def libx264_pixel_formats() -> set:
+    global libx264_pix_fmts
+    if libx264_pix_fmts is None:
+        proc = await asyncio.create_subprocess_exec(
+            'ffmpeg', '-hide_banner', '-h', 'encoder=libx264',
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+        )
+        stdout, _ = await proc.communicate()
+        match = re.search(r'Supported pixel formats:(.*)', stdout.decode('utf-8', errors='replace'))
+        libx264_pix_fmts = set(match.group(1).split()) if match else set()
+    return libx264_pix_fmts
+
+async def probe_h264_sps(input_path: str) -> Dict[str, int]:
+    """Fields of the first video stream's sequence parameter set, traced by ffmpeg's trace_headers filter"""
+    args = [
+        'ffmpeg', '-hide_banner', '-nostdin', '-v', 'info', '-i', input_path,
+        '-map', '0:v:0', '-c', 'copy', '-bsf:v', 'trace_headers', '-frames:v', '1', '-f', 'null', '-'
+    ]
+    proc = await asyncio.create_subprocess_exec(
+        *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    stdout, stderr = await proc.communicate()
+    if proc.returncode != 0:
+        raise ffmpeg.Error('ffmpeg', stdout, stderr)
+
+    fields = {}
+    in_sps = False
+    for line in stderr.decode('utf-8', errors='replace').splitlines():
+        if 'trace_headers' not in line:
+            continue
+        match = TRACE_FIELD_PATTERN.search(line)
+        if match is None:
+            # A section title: stop after the first SPS
+            if fields:
+                break
+            in_sps = line.endswith('Sequence Parameter Set')
+        elif in_sps:
+            fields[match.group(1)] = int(match.group(2))
+    return fields
+
+def probe_start_time(probe: Dict) -> float:
+    """Container start time; packet timestamps count from it, -ss does not"""
+    return float(probe['format'].get('start_time', 0) or 0)
+
+async def smart_cut_source(input_path: str, output_format: str, job_id: str) -> Optional[Dict]:
+    """Start time and head encoder options matching the source's H.264 stream.
+
+    Returns None (and logs why) when the stream can't be matched, in which
+    case segments are re-encoded in full.
+    """
+    if output_format not in SMART_CUT_FORMATS:
+        reason = f"{output_format} output"
+    else:
+        try:
+            probe = await run_ffprobe_async(input_path, '-select_streams', 'v:0')
+            sps = await probe_h264_sps(input_path)
+        except ffmpeg.Error as e:
+            logger.error(f"Job {job_id}: could not probe H.264 parameters: {e.stderr.decode(errors='replace') if e.stderr else e}")
+            return None
+        stream = probe['streams'][0] if probe.get('streams') else {}
+        profile = X264_PROFILES.get(stream.get('profile'))
+        pix_fmt = stream.get('pix_fmt')
+        if stream.get('codec_name') != 'h264':
+            reason = "non-H.264 video"
+        elif profile is None:
+            reason = f"H.264 profile {stream.get('profile')!r}"
+        elif pix_fmt not in await libx264_pixel_formats():
+            reason = f"pixel format {pix_fmt}"
+        elif 'level_idc' not in sps or 'max_num_ref_frames' not in sps:
+            reason = "an unreadable SPS"
+        elif not sps.get('frame_mbs_only_flag', 1):
+            reason = "interlaced video"
+        else:
+            encode = {
+                'profile:v': profile,
+                # x264 reads levels of 7 and up as level_idc (31 = 3.1)
+                'level': str(sps['level_idc']),
+                'pix_fmt': pix_fmt,
+                'refs': max(1, sps['max_num_ref_frames']),
+            }
+            for option, key in (('color_range', 'color_range'), ('colorspace', 'color_space'),
+                                ('color_trc', 'color_transfer'), ('color_primaries', 'color_primaries')):
+                if stream.get(key) not in (None, 'unknown'):
+                    encode[option] = stream[key]
+            return {'start_time': probe_start_time(probe), 'encode': encode}
+    logger.info(f"Job {job_id}: smart cut cannot match {reason}, re-encoding segments instead")
+    return None
+
+def parse_hex_dump(dump: str) -> bytes:
+    """Bytes of an ffprobe -show_data dump ("00000000: 0000 0001 6764 ...  ascii")"""
+    return bytes.fromhex(''.join(line[10:51] for line in dump.splitlines() if line).replace(' ', ''))
+
+def h264_nal_types(data: bytes) -> List[int]:
+    """NAL unit types in one H.264 packet, Annex B or 4-byte length prefixed"""
+    if data.startswith(b'\x00\x00\x01') or data.startswith(b'\x00\x00\x00\x01'):
+        return [data[m.end()] & 0x1f for m in re.finditer(b'\x00\x00\x01', data) if m.end() < len(data)]
+    types = []
+    pos = 0
+    while pos + 4 < len(data):
+        types.append(data[pos + 4] & 0x1f)
+        pos += 4 + int.from_bytes(data[pos:pos + 4], 'big')
+    # Anything else (e.g. 1- or 2-byte lengths) is not trusted as an IDR
+    return types if pos == len(data) else []
+
+async def find_idr_keyframe(input_path: str, keyframes: List[float]) -> Optional[float]:
+    """First keyframe that is an IDR frame; open-GOP I frames are flagged as keyframes too"""
+    for keyframe in keyframes[:SMART_CUT_IDR_CANDIDATES]:
+        probe = await run_ffprobe_async(
+            input_path, '-select_streams', 'v:0', '-read_intervals', f"{keyframe}%+#1",
+            '-show_packets', '-show_data'
+        )
+        for packet in probe.get('packets', []):
+            try:
+                pts_time = float(packet.get('pts_time'))
+            except (TypeError, ValueError):
+                continue
+            if abs(pts_time - keyframe) < 1e-3:
+                if NAL_IDR_SLICE in h264_nal_types(parse_hex_dump(packet.get('data', ''))):
+                    return keyframe
+                break
+    return None
+
+async def smart_cut_segment(
+    input_path: str,
+    output_path: str,
+    start: float,
+    end: float,
+    config: SplitConfig,
+    work_prefix: str,
+    cut_source: Dict,
+    on_progress=None,
+    encoder: Optional[Dict] = None,
+    subtitle_files: Optional[List[Dict]] = None,
+    image_streams: Optional[List[Dict]] = None
+) -> bool:
+    """Cut one segment frame-accurately, re-encoding only the frames before its first IDR frame.
+
+    The video from `start` up to the IDR frame is re-encoded with the options
+    from smart_cut_source(), the rest is stream-copied, and both pieces are
+    concatenated losslessly before audio and subtitles are copied in from the
+    source. Returns False when the segment has no usable IDR frame, in which
+    case the caller should re-encode it fully.
+    """
+    encoder = encoder or resolve_encoder_settings(config)
+    # Packet timestamps are absolute, while -ss counts from the file's start time
+    offset = cut_source['start_time']
+    keyframes = await probe_keyframes(input_path, start + offset, end + offset)
+    candidates = [k for k in keyframes if start - 0.001 <= k - offset < end - 0.001]
+    idr = await find_idr_keyframe(input_path, candidates)
+    if idr is None:
+        return False
+    keyframe = idr - offset
+
+    head_path = f"{work_prefix}_head.ts"
+    tail_path = f"{work_prefix}_tail.ts"
+    list_path = f"{work_prefix}_concat.txt"
+    pieces = []
+
+    async def report(offset: float, progress: Dict):
+        if on_progress and progress['out_time'] is not None:
+            await on_progress({**progress, 'out_time': offset + progress['out_time']})
+
+    try:
+        # Re-encode the frames before the IDR frame (if any)
+        head_duration = keyframe - start
+        if head_duration > 0.001:
+            head = (
+                ffmpeg.input(input_path, ss=start, t=head_duration)
+                .output(
+                    head_path, map='0:v:0', an=None, sn=None,
+                    **{'c:v': 'libx264', 'crf': encoder['crf'], 'preset': encoder['preset'],
+                       'threads': encoder['threads'], **cut_source['encode'], 'f': 'mpegts'}
+                )
+                .overwrite_output()
+            )
+            await run_ffmpeg_async(head, lambda p: report(0.0, p))
+            pieces.append(head_path)
+
+        # Stream-copy everything from the IDR frame to the end of the segment.
+        # The seek can land on an earlier keyframe (ffprobe rounds timestamps and
+        # some demuxers seek by DTS), so packets before the IDR frame are dropped.
+        seek = keyframe - 0.0005
+        tail = (
+            ffmpeg.input(input_path, ss=seek, t=end - seek)
+            .output(
+                tail_path, map='0:v:0', an=None, sn=None,
+                **{'c:v': 'copy', 'copypriorss': 0, 'bsf:v': 'h264_mp4toannexb', 'f': 'mpegts'}
+            )
+            .overwrite_output()
+        )
+        await run_ffmpeg_async(tail, lambda p: report(head_duration, p))
+        pieces.append(tail_path)
+
+        async with aiofiles.open(list_path, 'w') as f:
+            await f.write(''.join(f"file '{Path(piece).resolve()}'\n" for piece in pieces))
+
+        # Join the video pieces and copy audio for the same range; subtitles
+        # come from the segment's slices. The pieces have different parameter
+        # sets, so MP4/MOV must not present the head's as the only ones.
+        video = ffmpeg.input(list_path, f='concat', safe=0)
+        source = ffmpeg.input(input_path, ss=start, t=end - start)
+        subtitle_streams, subtitle_args = subtitle_output_streams(
+            source, subtitle_files or [], image_streams or [], config.output_format
+        )
+        if config.output_format in ('mp4', 'mov'):
+            subtitle_args['tag:v'] = 'avc3'
+        mux = (
+            ffmpeg.output(
+                video['v:0'], source['a:0?'], *subtitle_streams, output_path,
+                c='copy', t=end - start, **subtitle_args
+            )
+            .overwrite_output()
+        )
+        await run_ffmpeg_async(mux)
+    finally:
+        for path in (head_path, tail_path, list_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    return True
+
+def record_segment_timing(codec: str, media_seconds: float, wall_seconds: float):
+    SEGMENT_SECONDS.observe(wall_seconds, codec=codec)
+    if wall_seconds > 0:
+        REALTIME_FACTOR.observe(media_seconds / wall_seconds, codec=codec)
+
+async def split_video_with_subtitles(
+    input_path: str, 
+    output_dir: str, 
+    splits: List[Dict], 
+    config: SplitConfig,
+    job_id: str,
+    completed: Optional[Dict[int, str]] = None,
+    on_segment=None,
+    tracker: Optional[JobProgressTracker] = None
+) -> List[str]:
+    """Split video while preserving subtitles, encoding segments concurrently.
+
+    Segments in `completed` (index -> existing output) are not encoded again;
+    `on_segment(index, output_path)` is awaited as each new segment finishes.
+    An engine falling back to this one passes its `tracker`, so job progress
+    carries on from where it got to.
+    """
+    completed = completed or {}
+    if config.engine == "segment_muxer":
+        return await split_video_single_pass(input_path, output_dir, splits, config, job_id, completed, on_segment)
+    if config.engine not in ("per_segment", "smart_cut"):
+        raise Exception(f"Unknown split engine: {config.engine}")
+
+    # Create output directory
+    os.makedirs(output_dir, exist_ok=True)
+
+    total_splits = len(splits)
+    base_name = Path(input_path).stem
+
+    # Bound the number of concurrent ffmpeg processes (per job override wins)
+    max_parallel = segment_parallelism(config, total_splits)
+    semaphore = asyncio.Semaphore(max_parallel)
+    tracker = tracker or JobProgressTracker(job_id, [split['end'] - split['start'] for split in splits])
+
+    video_info = await get_video_info(input_path)
+    encoder = resolve_encoder_settings(config, video_info, max_parallel, await get_encoder_profile())
+    output_args = build_segment_output_args(config, encoder, source_fps(video_info))
+
+    # Smart cut stream-copies H.264 from IDR frames; other codecs are re-encoded
+    cut_source = None
+    work_dir = PROCESS_DIR / job_id
+    if config.engine == "smart_cut":
+        video_streams = video_info['video_streams']
+        if video_streams and video_streams[0]['codec'] == 'h264':
+            cut_source = await smart_cut_source(input_path, config.output_format, job_id)
+        else:
+            logger.info(f"Job {job_id}: smart cut needs H.264 video, re-encoding segments instead")
+        work_dir.mkdir(parents=True, exist_ok=True)
+
+    # Demux text subtitles once for all segments
+    subtitle_tracks = await extract_subtitle_tracks(input_path, video_info, work_dir)
+    image_streams = image_subtitle_streams(video_info, config.output_format, job_id)
+    sidecars = config.subtitle_mode in ("sidecar", "both")
+    mux_subtitles = config.subtitle_mode in ("mux", "both")
+
+    async def encode_segment(i: int, split: Dict) -> str:
+        start_time = split['start']
+        duration = split['end'] - start_time
+
+        # Generate output filename
+        output_filename = f"{base_name}_part_{i+1:03d}.{config.output_format}"
+        output_path = os.path.join(output_dir, output_filename)
+
+        if i in completed:
+            await tracker.complete_segment(i)
+            return completed[i]
+
+        # Slice this segment's subtitles (sidecars live next to the output)
+        subtitle_files = await asyncio.to_thread(
+            write_subtitle_slices, subtitle_tracks, start_time, split['end'], config.subtitle_sync_offset,
+            output_dir if sidecars else str(work_dir), Path(output_filename).stem
+        )
+        muxed_files = subtitle_files if mux_subtitles else []
+
+        # Build ffmpeg command
+        source = ffmpeg.input(input_path, ss=start_time, t=duration)
+        subtitle_streams, subtitle_args = subtitle_output_streams(
+            source, muxed_files, image_streams, config.output_format
+        )
+        stream = (
+            ffmpeg.output(
+                source['v:0'], source['a:0?'], *subtitle_streams, output_path,
+                **output_args, **subtitle_args
+            )
+            .overwrite_output()
+        )
+
+        async def on_progress(progress: Dict):
+            await tracker.update_segment(i, progress)
+
+        async with semaphore:
+            started = time.monotonic()
+            try:
+                if cut_source:
+                    cut = await smart_cut_segment(
+                        input_path, output_path, start_time, split['end'],
+                        config, str(work_dir / f"{i+1:03d}"), cut_source, on_progress, encoder,
+                        muxed_files, image_streams
+                    )
+                    if cut:
+                        stream = None
+                if stream is not None:
+                    # Run ffmpeg as a subprocess so the event loop keeps serving requests
+                    await run_ffmpeg_async(stream, on_progress)
+                record_segment_timing(
+                    'smart_cut' if stream is None else output_args['c:v'],
+                    duration, time.monotonic() - started
+                )
+            except ffmpeg.Error as e:
+                error_msg = e.stderr.decode() if e.stderr else str(e)
+                logger.error(f"FFmpeg error for split {i+1}: {error_msg}")
+                raise Exception(f"Error processing split {i+1}: {error_msg}")
+            except Exception as e:
+                logger.error(f"General error for split {i+1}: {str(e)}")
+                raise Exception(f"Error processing split {i+1}: {str(e)}")
+            finally:
+                if not sidecars:
+                    for subtitle in subtitle_files:
+                        os.remove(subtitle['path'])
+
+        if on_segment:
+            await on_segment(i, output_path)
+        await tracker.complete_segment(i)
+
+        return output_path
+
+    results = await asyncio.gather(
+        *(encode_segment(i, split) for i, split in enumerate(splits)),
+        return_exceptions=True
+    )
+
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+    errors = [str(r) for r in results if isinstance(r, Exception)]
+    if errors:
+        logger.error(f"Error splitting video: {len(errors)} of {total_splits} splits failed")
+        raise Exception(f"{len(errors)} of {total_splits} splits failed: " + "; ".join(errors))
+
+    # gather preserves input order, so output files match the split order
+    return list(results)
+
+async def split_video_single_pass(
+    input_path: str,
+    output_dir: str,
+    splits: List[Dict],
+    config: SplitConfig,
+    job_id: str,
+    completed: Optional[Dict[int, str]] = None,
+    on_segment=None
+) -> List[str]:
+    """Split video in one read of the source using ffmpeg's segment muxer"""
+    # The segment muxer writes contiguous pieces, so splits must not overlap
+    ordered = all(
+        splits[i]['end'] <= splits[i + 1]['start'] + 1e-6 for i in range(len(splits) - 1)
+    )
+    if not ordered or completed:
+        # Resuming: re-reading the whole source for a few missing segments is wasteful
+        reason = "resuming a partial job" if ordered else "overlapping splits"
+        logger.info(f"Job {job_id}: {reason}, falling back to per-segment engine")
+        return await split_video_with_subtitles(
+            input_path, output_dir, splits, config.copy(update={'engine': 'per_segment'}), job_id,
+            completed, on_segment
+        )
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    base_name = Path(input_path).stem
+    offset = splits[0]['start']
+    span = splits[-1]['end'] - offset
+
+    # Cut at every split start and end; pieces that fall in gaps between
+    # splits (e.g. unselected chapters) are discarded afterwards
+    cut_points = sorted({
+        round(t - offset, 6)
+        for split in splits
+        for t in (split['start'], split['end'])
+        if 0 < t - offset < span
+    })
+
+    piece_pattern = os.path.join(output_dir, f".{job_id}_piece_%04d.{config.output_format}")
+    segment_list = os.path.join(output_dir, f".{job_id}_pieces.csv")
+
+    video_info = await get_video_info(input_path)
+    encoder = resolve_encoder_settings(config, video_info, 1, await get_encoder_profile())
+    output_args = build_segment_output_args(config, encoder, source_fps(video_info))
+    output_args.update({
+        'f': 'segment',
+        'segment_list': segment_list,
+        'segment_list_type': 'csv',
+        'reset_timestamps': 1
+    })
+    if cut_points:
+        times = ','.join(f"{t:.6f}" for t in cut_points)
+        output_args['segment_times'] = times
+        if output_args['c:v'] != 'copy':
+            # Re-encoding: put keyframes exactly on the cut points
+            output_args['force_key_frames'] = times
+
+    # The segment muxer cuts the subtitles too, so feed it each track's full span
+    work_dir = PROCESS_DIR / job_id
+    subtitle_tracks = await extract_subtitle_tracks(input_path, video_info, work_dir)
+    image_streams = image_subtitle_streams(video_info, config.output_format, job_id)
+    span_files = []
+    if config.subtitle_mode in ("mux", "both") and subtitle_tracks:
+        span_files = await asyncio.to_thread(
+            write_subtitle_slices, subtitle_tracks, offset, offset + span,
+            config.subtitle_sync_offset, str(work_dir), f"{job_id}_span"
+        )
+
+    source = ffmpeg.input(input_path, ss=offset, t=span)
+    subtitle_streams, subtitle_args = subtitle_output_streams(
+        source, span_files, image_streams, config.output_format
+    )
+    stream = (
+        ffmpeg.output(
+            source['v:0'], source['a:0?'], *subtitle_streams, piece_pattern,
+            **output_args, **subtitle_args
+        )
+        .overwrite_output()
+    )
+
+    # Segments are only marked complete once their pieces are known to be
+    # usable, so a fallback never reports the same segment twice
+    tracker = JobProgressTracker(job_id, [split['end'] - split['start'] for split in splits])
+
+    async def on_progress(progress: Dict):
+        if progress['out_time'] is None:
+            return
+        position = offset + progress['out_time']
+        for i, split in enumerate(splits):
+            if split['start'] < position and tracker.done[i] < tracker.durations[i]:
+                await tracker.update_segment(i, {**progress, 'out_time': min(position, split['end']) - split['start']})
+
+    started = time.monotonic()
+    try:
+        await run_ffmpeg_async(stream, on_progress)
+        record_segment_timing(output_args['c:v'], span, time.monotonic() - started)
+    except ffmpeg.Error as e:
+        error_msg = e.stderr.decode() if e.stderr else str(e)
+        logger.error(f"FFmpeg error in single-pass split: {error_msg}")
+        raise Exception(f"Error processing splits: {error_msg}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    async with aiofiles.open(segment_list, 'r') as f:
+        pieces = [line.strip().rsplit(',', 2) for line in await f.readlines() if line.strip()]
+    os.remove(segment_list)
+    pieces = [
+        (os.path.join(output_dir, piece_name), float(piece_end) - float(piece_start))
+        for piece_name, piece_start, piece_end in pieces
+    ]
+
+    # The muxer writes one piece per interval between cut points, in order.
+    # Its reported times can be shifted by the stream's start offset, so only
+    # piece durations are compared, within one frame.
+    tolerance = 1.0 / (source_fps(video_info) or 30)
+    bounds = [0.0, *cut_points, round(span, 6)]
+    intervals = list(zip(bounds, bounds[1:]))
+    if output_args['c:v'] == 'copy':
+        # Copy mode can only cut on keyframes: a cut with no keyframe near it
+        # lands late or merges two pieces, which leaves the content of one
+        # split in another's piece
+        usable = len(pieces) == len(intervals) and all(
+            abs(duration - (end - start)) <= tolerance
+            for (_path, duration), (start, end) in list(zip(pieces, intervals))[1:]
+        )
+    else:
+        # Re-encoding puts a keyframe on every cut point; only intervals
+        # shorter than a frame at the very end can get no piece of their own
+        usable = len(pieces) <= len(intervals) and all(
+            end - start < tolerance for start, end in intervals[len(pieces):]
+        )
+
+    if not usable:
+        for path, _duration in pieces:
+            if os.path.exists(path):
+                os.remove(path)
+        logger.info(
+            f"Job {job_id}: segment muxer wrote {len(pieces)} pieces for {len(intervals)} cut intervals, "
+            f"falling back to per-segment engine"
+        )
+        return await split_video_with_subtitles(
+            input_path, output_dir, splits, config.copy(update={'engine': 'per_segment'}), job_id,
+            None, on_segment, tracker
+        )
+
+    # Pieces in gaps between splits (e.g. unselected chapters) are discarded
+    owners = {}
+    for i, split in enumerate(splits):
+        piece = bounds.index(round(split['start'] - offset, 6))
+        if piece < len(pieces):
+            owners[i] = pieces[piece][0]
+    kept = set(owners.values())
+    for path, _duration in pieces:
+        if path not in kept:
+            os.remove(path)
+
+    output_files = {}
+    for i, piece_path in owners.items():
+        output_path = os.path.join(output_dir, f"{base_name}_part_{i+1:03d}.{config.output_format}")
+        os.replace(piece_path, output_path)
+        output_files[i] = output_path
+        if config.subtitle_mode in ("sidecar", "both"):
+            await asyncio.to_thread(
+                write_subtitle_slices, subtitle_tracks, splits[i]['start'], splits[i]['end'],
+                config.subtitle_sync_offset, output_dir, Path(output_path).stem
+            )
+        if on_segment:
+            await on_segment(i, output_path)
+
+    if len(output_files) < len(splits):
+        # Sub-frame tail splits are cut on their own; the finished pieces are
+        # passed along as completed and marked done there
+        missing = [str(i + 1) for i in range(len(splits)) if i not in output_files]
+        logger.info(f"Job {job_id}: splits {', '.join(missing)} are shorter than a frame, cutting them separately")
+        return await split_video_with_subtitles(
+            input_path, output_dir, splits, config.copy(update={'engine': 'per_segment'}), job_id,
+            output_files, on_segment, tracker
+        )
+
+    for i in range(len(splits)):
+        await tracker.complete_segment(i)
+    return [output_files[i] for i in range(len(splits))]
+
+# Job events
+# update_job_progress and the job lifecycle publish to an in-process bus that
+# feeds the SSE/WebSocket progress endpoints. With JOB_EVENTS_SOURCE=changestream
+# (multi-process deployments) events come from a Mongo change stream instead.
+class JobEventBus:
+    """In-process pub/sub of job events, keyed by job id"""
+
+    def __init__(self):
+        self.subscribers: Dict[str, set] = {}
+
+    def subscribe(self, job_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=JOB_EVENT_QUEUE_SIZE)
+        self.subscribers.setdefault(job_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, job_id: str, queue: asyncio.Queue):
+        queues = self.subscribers.get(job_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self.subscribers[job_id]
+
+    def publish(self, job_id: str, event: Dict):
+        for queue in self.subscribers.get(job_id, ()):
+            if queue.full():
+                # Slow consumer: drop the oldest event, the newest state wins
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+job_events = JobEventBus()
+
+def publish_job_event(job_id: str, event_type: str, data: Dict):
+    """Publish a job event locally unless events are relayed from Mongo"""
+    if JOB_EVENTS_SOURCE == 'local':
+        job_events.publish(job_id, {'type': event_type, 'job_id': job_id, **data})
+
+async def relay_job_changes():
+    """Feed the event bus from a video_jobs change stream (needs a replica set)"""
+    pipeline = [{'$match': {'operationType': {'$in': ['update', 'replace']}}}]
+    while True:
+        try:
+            async with db.video_jobs.watch(pipeline, full_document='updateLookup') as stream:
+                async for change in stream:
+                    job = change.get('fullDocument')
+                    if job and job.get('id') in job_events.subscribers:
+                        job_events.publish(job['id'], {'type': 'update', **job_event_snapshot(job)})
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Job change stream failed, retrying: {e}")
+            await asyncio.sleep(5)
+
+def job_event_snapshot(job: Dict) -> Dict:
+    """The job fields pushed to progress subscribers"""
+    return {
+        'job_id': job['id'],
+        'status': job.get('status'),
+        'progress': job.get('progress', 0.0),
+        'encode_speed': job.get('encode_speed'),
+        'segments_completed': job.get('segments_completed'),
+        'splits': job.get('splits', []),
+        'error_message': job.get('error_message')
+    }
+
+# Progress persistence
+# Progress ticks from all running jobs are merged per job and written in one
+# bulk_write every PROGRESS_FLUSH_INTERVAL seconds; status changes flush at once.
+# Ticks only ever update a job that is still processing, and a job that stops
+# without a final status (cancelled, lease lost) drops its pending ticks.
+class ProgressWriter:
+    """Coalesce job progress writes and batch them across jobs"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.pending: Dict[str, Dict] = {}
+        self.written: Dict[str, Dict] = {}
+        self.lock = asyncio.Lock()
+        self.task: Optional[asyncio.Task] = None
+
+    async def write(self, job_id: str, fields: Dict, flush: bool = False):
+        self.pending.setdefault(job_id, {}).update(fields)
+        if flush:
+            await self.flush()
+
+    def discard(self, job_id: str):
+        """Forget a job's unwritten ticks once it has stopped running here"""
+        self.pending.pop(job_id, None)
+        self.written.pop(job_id, None)
+
+    def held_back(self, job_id: str, fields: Dict) -> bool:
+        """Whether a plain tick barely moved progress and changes nothing else"""
+        if 'status' in fields or fields.get('progress') is None:
+            return False
+        written = self.written.get(job_id, {})
+        if abs(fields['progress'] - written.get('progress', -100.0)) >= PROGRESS_MIN_DELTA:
+            return False
+        return all(
+            written.get(key) == value for key, value in fields.items() if key not in ('progress', 'updated_at')
+        )
+
+    async def flush(self):
+        async with self.lock:
+            if not self.pending:
+                return
+            batch, self.pending = self.pending, {}
+
+            operations = []
+            written = {}
+            for job_id, fields in batch.items():
+                # Hold back ticks that barely moved (they are merged into the
+                # next write); status changes and new counters always go through
+                if self.held_back(job_id, fields):
+                    self.pending[job_id] = {**fields, **self.pending.get(job_id, {})}
+                    continue
+                if 'status' in fields:
+                    # The next run of the job starts from scratch
+                    self.written.pop(job_id, None)
+                    query = {'id': job_id}
+                else:
+                    written[job_id] = fields
+                    query = {'id': job_id, 'status': 'processing'}
+                operations.append(UpdateOne(query, {'$set': fields}))
+
+            if not operations:
+                return
+            try:
+                await db.video_jobs.bulk_write(operations, ordered=False)
+            except Exception as e:
+                logger.error(f"Progress flush failed for {len(operations)} jobs: {e}")
+                # Keep the failed fields unless newer ones arrived meanwhile
+                for job_id, fields in batch.items():
+                    self.pending[job_id] = {**fields, **self.pending.get(job_id, {})}
+                return
+            # Only ticks that reached Mongo count towards the delta gate
+            self.written.update(written)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+        await self.flush()
+
+progress_writer = ProgressWriter(PROGRESS_FLUSH_INTERVAL)
+
+async def update_job_progress(job_id: str, progress: float, status: str = None, extra: Optional[Dict] = None):
+    """Update job progress in database"""
+    update_data = {
+        'progress': progress,
+        'updated_at': datetime.utcnow()
+    }
+    if status:
+        update_data['status'] = status
+    if extra:
+        update_data.update(extra)
+    
+    # Status changes are persisted immediately, plain ticks are coalesced
+    await progress_writer.write(job_id, update_data, flush=bool(status))
+
+    event = {key: value for key, value in update_data.items() if key != 'updated_at'}
+    publish_job_event(job_id, 'progress', event)
+
+# Content-aware split planning
+
+def splits_from_cut_points(cut_points: List[float], duration: float) -> List[Dict]:
+    """Turn sorted cut points into contiguous splits covering the whole video"""
+    bounds = [0.0, *cut_points, duration]
+    return [{'start': start, 'end': end} for start, end in zip(bounds, bounds[1:]) if end > start]
+
+def choose_cut_points(
+    candidates: List[tuple],
+    duration: float,
+    min_length: float,
+    max_length: Optional[float]
+) -> List[float]:
+    """Pick cuts from time-ordered (time, score) candidates under min/max segment length"""
+    cuts = []
+    last = 0.0
+    for time_point, _ in candidates:
+        if max_length:
+            # Nothing usable inside the window; cut at the limit instead
+            while time_point - last > max_length and duration - (last + max_length) >= min_length:
+                last += max_length
+                cuts.append(last)
+        if time_point - last >= min_length and duration - time_point >= min_length:
+            cuts.append(time_point)
+            last = time_point
+    if max_length:
+        while duration - last > max_length:
+            # Cut at the limit unless that leaves a runt; then halve the rest
+            remaining = duration - last
+            last += max_length if remaining - max_length >= min_length else remaining / 2
+            cuts.append(last)
+    return cuts
+
+async def detect_scene_cuts(file_path: str, video_info: Dict, config: SplitConfig) -> List[float]:
+    """Find scene changes from a downscaled grayscale decode piped out of ffmpeg.
+
+    Frames are read SCENE_BATCH_FRAMES at a time and scored as the mean absolute
+    difference from the previous frame, so memory stays constant however long
+    the video is; only frames scoring over the threshold are kept.
+    """
+    width, height = SCENE_FRAME_SIZE
+    frame_bytes = width * height
+    args = (
+        # Deblocking makes no difference at 64x36, so the decoder may skip it
+        ffmpeg.input(file_path, skip_loop_filter='all')
+        .video
+        .filter('fps', fps=SCENE_ANALYSIS_FPS)
+        .filter('scale', width, height, flags='fast_bilinear')
+        .output('pipe:', f='rawvideo', pix_fmt='gray')
+        .compile()
+    )
+    proc = await asyncio.create_subprocess_exec(
+        args[0], '-hide_banner', '-nostats', '-loglevel', 'error', *args[1:],
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+
+    candidates = []
+    previous = None
+    frame_number = 0
+    try:
+        while True:
+            try:
+                chunk = await proc.stdout.readexactly(frame_bytes * SCENE_BATCH_FRAMES)
+            except asyncio.IncompleteReadError as e:
+                chunk = e.partial[:len(e.partial) - len(e.partial) % frame_bytes]
+            if not chunk:
+                break
+
+            frames = np.frombuffer(chunk, dtype=np.uint8).reshape(-1, frame_bytes).astype(np.int16)
+            if previous is not None:
+                frames = np.concatenate((previous, frames))
+            scores = np.abs(np.diff(frames, axis=0)).mean(axis=1) / 255.0
+
+            # scores[i] compares frames[i] and frames[i + 1]
+            first = frame_number - (1 if previous is not None else 0)
+            for i in np.flatnonzero(scores >= config.scene_threshold):
+                candidates.append(((first + int(i) + 1) / SCENE_ANALYSIS_FPS, float(scores[i])))
+
+            frame_number = first + len(frames)
+            previous = frames[-1:]
+            if len(chunk) < frame_bytes * SCENE_BATCH_FRAMES:
+                break
+
+        stderr = await proc.stderr.read()
+        if await proc.wait() != 0:
+            raise ffmpeg.Error('ffmpeg', b'', stderr)
+    finally:
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+
+    cuts = choose_cut_points(
+        candidates,
+        video_info['duration'],
+        config.min_segment_duration or DEFAULT_MIN_SCENE_DURATION,
+        config.max_segment_duration
+    )
+    logger.info(f"Scene detection on {file_path}: {frame_number} frames, {len(candidates)} changes, {len(cuts)} cuts")
+    return cuts
+
+async def detect_silences(file_path: str, config: SplitConfig) -> List[tuple]:
+    """Find pauses as (start, end) pairs from a low-rate mono PCM stream.
+
+    Only the audio is decoded. Each batch of samples is cut into fixed windows
+    whose RMS level is computed with NumPy; runs of quiet windows carry over
+    between batches, so memory does not grow with the duration.
+    """
+    window = int(SILENCE_SAMPLE_RATE * SILENCE_WINDOW_SECONDS)
+    batch_bytes = window * int(SILENCE_BATCH_SECONDS / SILENCE_WINDOW_SECONDS) * 2
+    threshold = 32768.0 * 10 ** (config.silence_threshold_db / 20)
+    min_windows = max(1, round(config.min_silence_duration / SILENCE_WINDOW_SECONDS))
+
+    args = (
+        ffmpeg.input(file_path, vn=None, sn=None, dn=None)
+        .audio
+        .output('pipe:', f='s16le', ac=1, ar=SILENCE_SAMPLE_RATE)
+        .compile()
+    )
+    proc = await asyncio.create_subprocess_exec(
+        args[0], '-hide_banner', '-nostats', '-loglevel', 'error', *args[1:],
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+
+    silences = []
+    run_start = None  # first window of the quiet run in progress
+    window_number = 0
+    try:
+        while True:
+            try:
+                chunk = await proc.stdout.readexactly(batch_bytes)
+            except asyncio.IncompleteReadError as e:
+                chunk = e.partial[:len(e.partial) - len(e.partial) % (window * 2)]
+            if not chunk:
+                break
+
+            samples = np.frombuffer(chunk, dtype='<i2').astype(np.float32).reshape(-1, window)
+            quiet = np.sqrt(np.mean(samples * samples, axis=1)) < threshold
+
+            # Quiet runs in this batch as [start, end) window indices
+            edges = np.diff(np.concatenate(([False], quiet, [False])).astype(np.int8))
+            runs = [
+                [window_number + int(a), window_number + int(b)]
+                for a, b in zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1))
+            ]
+            if run_start is not None:
+                if runs and runs[0][0] == window_number:
+                    runs[0][0] = run_start
+                else:
+                    runs.insert(0, [run_start, window_number])
+                run_start = None
+            if runs and runs[-1][1] == window_number + len(quiet):
+                # Still quiet at the end of the batch; finish it in the next one
+                run_start = runs.pop()[0]
+
+            silences.extend(
+                (a * SILENCE_WINDOW_SECONDS, b * SILENCE_WINDOW_SECONDS)
+                for a, b in runs if b - a >= min_windows
+            )
+
+            window_number += len(quiet)
+            if len(chunk) < batch_bytes:
+                break
+
+        if run_start is not None and window_number - run_start >= min_windows:
+            silences.append((run_start * SILENCE_WINDOW_SECONDS, window_number * SILENCE_WINDOW_SECONDS))
+
+        stderr = await proc.stderr.read()
+        if await proc.wait() != 0:
+            raise ffmpeg.Error('ffmpeg', b'', stderr)
+    finally:
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+
+    logger.info(f"Silence detection on {file_path}: {window_number * SILENCE_WINDOW_SECONDS:.0f}s of audio, {len(silences)} pauses")
+    return silences
+
+def choose_silence_cuts(
+    silences: List[tuple],
+    duration: float,
+    target: float,
+    min_length: float,
+    max_length: float
+) -> List[float]:
+    """Cut in the pause closest to each target boundary, forcing a cut past max_length"""
+    midpoints = [(start + end) / 2 for start, end in silences]
+    cuts = []
+    last = 0.0
+    while duration - last > target:
+        goal = last + target
+        lo = bisect.bisect_left(midpoints, last + min_length)
+        hi = bisect.bisect_right(midpoints, min(last + max_length, duration - min_length))
+        if lo < hi:
+            cut = min(midpoints[lo:hi], key=lambda point: abs(point - goal))
+        elif duration - last > max_length:
+            cut = goal
+        else:
+            break
+        cuts.append(cut)
+        last = cut
+    return cuts
+
+async def plan_splits(file_path: str, video_info: Dict, config: SplitConfig) -> List[Dict]:
+    """Work out the segments a split config produces for a video"""
+    splits = []
+    if config.method == "time_based" and config.time_points:
+        # Sort time points
+        time_points = sorted(config.time_points)
+        for i in range(len(time_points)):
+            start = time_points[i]
+            end = time_points[i + 1] if i + 1 < len(time_points) else video_info['duration']
+            splits.append({'start': start, 'end': end})
+    
+    elif config.method == "intervals" and config.interval_duration:
+        duration = video_info['duration']
+        current_time = 0
+        while current_time < duration:
+            end_time = min(current_time + config.interval_duration, duration)
+            splits.append({'start': current_time, 'end': end_time})
+            current_time = end_time
+    
+    elif config.method == "chapters" and video_info['chapters']:
+        for chapter in video_info['chapters']:
+            splits.append({'start': chapter['start'], 'end': chapter['end']})
+    
+    elif config.method == "scenes":
+        cut_points = await detect_scene_cuts(file_path, video_info, config)
+        splits = splits_from_cut_points(cut_points, video_info['duration'])
+    
+    elif config.method == "silence":
+        if not video_info['audio_streams']:
+            raise Exception("No audio stream to detect silence in")
+        target = config.target_segment_duration or config.interval_duration
+        if not target:
+            raise Exception("Silence splitting needs target_segment_duration")
+        silences = await detect_silences(file_path, config)
+        cut_points = choose_silence_cuts(
+            silences,
+            video_info['duration'],
+            target,
+            config.min_segment_duration or target / 2,
+            config.max_segment_duration or target * 1.5
+        )
+        splits = splits_from_cut_points(cut_points, video_info['duration'])
+
+    return splits
+
+# Split cost estimation
+# Finished jobs record how fast this host copied (bytes/s) or encoded (pixels/s)
+# per encoder mode and engine, and how large outputs came out relative to the
+# source. Engines are kept apart: a smart cut job mostly stream-copies, so its
+# rate and size ratio say nothing about a full re-encode with the same preset.
+
+def encode_mode(config: SplitConfig, encoder: Dict) -> str:
+    if config.preserve_quality and not config.force_keyframes:
+        return 'copy'
+    return f"libx264:{encoder['preset']}"
+
+def video_pixel_rate(video_info: Dict) -> float:
+    """Pixels per second of source video (width x height x fps)"""
+    streams = video_info.get('video_streams') or []
+    if not streams:
+        return 0.0
+    return (streams[0].get('width') or 0) * (streams[0].get('height') or 0) * (source_fps(video_info) or 30)
+
+async def record_throughput(
+    video_info: Dict,
+    splits: List[Dict],
+    config: SplitConfig,
+    encoder: Dict,
+    wall_seconds: float,
+    output_bytes: int
+):
+    """Remember how a finished split performed, for future estimates"""
+    media_seconds = sum(split['end'] - split['start'] for split in splits)
+    if wall_seconds <= 0 or media_seconds <= 0:
+        return
+    duration = video_info['duration'] or media_seconds
+    await db.throughput_history.insert_one({
+        'host': os.uname().nodename,
+        'mode': encode_mode(config, encoder),
+        'engine': config.engine,
+        'parallel': segment_parallelism(config, len(splits)),
+        'media_seconds': media_seconds,
+        'wall_seconds': wall_seconds,
+        'source_bytes': video_info['size'] * min(media_seconds / duration, 1.0),
+        'output_bytes': output_bytes,
+        'pixels': video_pixel_rate(video_info) * media_seconds,
+        'created_at': datetime.utcnow()
+    })
+
+async def throughput_samples(mode: str, engine: str) -> List[Dict]:
+    cursor = db.throughput_history.find(
+        {'host': os.uname().nodename, 'mode': mode, 'engine': engine}, {'_id': 0}
+    ).sort('created_at', -1).limit(THROUGHPUT_HISTORY_SAMPLES)
+    return [sample async for sample in cursor]
+
+def median(values: List[float]) -> float:
+    ordered = sorted(values)
+    middle = len(ordered) // 2
+    return ordered[middle] if len(ordered) % 2 else (ordered[middle - 1] + ordered[middle]) / 2
+
+async def estimate_split_cost(file_path: str, video_info: Dict, splits: List[Dict], config: SplitConfig) -> Dict:
+    """Estimate output size and processing time per segment without running anything"""
+    parallel = segment_parallelism(config, len(splits))
+    profile = await get_encoder_profile()
+    encoder = resolve_encoder_settings(config, video_info, parallel, profile)
+    copy = encode_mode(config, encoder) == 'copy'
+    duration = video_info['duration'] or 1
+    bytes_per_second = video_info['size'] / duration
+    pixel_rate = video_pixel_rate(video_info)
+
+    # With a packet index, each split gets the source bytes its own video
+    # packets account for instead of the file's average bitrate
+    index = await load_packet_index(file_path)
+    video_bytes = sum(index.size) if index is not None else 0
+
+    # Copy throughput and encode throughput are learned separately
+    copy_samples = await throughput_samples('copy', config.engine)
+    copy_speed = (
+        median([sample['source_bytes'] / sample['wall_seconds'] for sample in copy_samples])
+        if copy_samples else DEFAULT_COPY_BYTES_PER_SECOND
+    )
+    encode_samples = [] if copy else await throughput_samples(encode_mode(config, encoder), config.engine)
+    if encode_samples:
+        encode_speed = median([sample['pixels'] / sample['wall_seconds'] for sample in encode_samples])
+        ratios = [sample['output_bytes'] / sample['source_bytes'] for sample in encode_samples if sample['source_bytes']]
+        size_factor = median(ratios) if ratios else REENCODE_SIZE_FACTOR
+        basis = 'history'
+    else:
+        rows = [row for row in (profile or {}).get('results', []) if row['preset'] == encoder['preset']]
+        if rows:
+            threads = max(1, (os.cpu_count() or 1) // parallel)
+            row = min(rows, key=lambda row: abs(row['threads'] - threads))
+            encode_speed = row['fps'] * profile['width'] * profile['height'] * parallel
+            basis = 'calibration'
+        else:
+            encode_speed = DEFAULT_ENCODE_PIXELS_PER_SECOND * parallel
+            basis = 'default'
+        size_factor = REENCODE_SIZE_FACTOR
+    if copy:
+        basis = 'history' if copy_samples else 'default'
+
+    smart_cut = config.engine == "smart_cut" and not copy
+    if smart_cut and splits:
+        # Keyframes for all splits at once; packet timestamps are absolute
+        start_offset = probe_start_time(await run_ffprobe_async(file_path, '-select_streams', 'v:0'))
+        keyframes = await probe_keyframes(
+            file_path,
+            min(split['start'] for split in splits) + start_offset,
+            max(split['end'] for split in splits) + start_offset
+        )
+        keyframes = [k - start_offset for k in keyframes]
+
+    segments = []
+    for i, split in enumerate(splits):
+        length = split['end'] - split['start']
+        copy_seconds = length
+        encode_seconds = 0.0 if copy else length
+        if smart_cut:
+            # Only the stretch before the first keyframe is re-encoded
+            first = bisect.bisect_left(keyframes, split['start'] - 0.001)
+            head = min(max(keyframes[first] - split['start'], 0.0), length) if first < len(keyframes) else length
+            copy_seconds, encode_seconds = length - head, head
+        elif not copy:
+            copy_seconds = 0.0
+
+        split_rate = bytes_per_second
+        if video_bytes and length > 0:
+            share = index.byte_range(split['start'], split['end']) / video_bytes
+            split_rate = video_info['size'] * share / length
+
+        estimated_bytes = split_rate * copy_seconds + split_rate * encode_seconds * size_factor
+        # Segments share the job's throughput while running side by side
+        copy_time = split_rate * copy_seconds / copy_speed * parallel
+        encode_time = pixel_rate * encode_seconds / encode_speed * parallel
+        segments.append({
+            'index': i + 1,
+            'start': split['start'],
+            'end': split['end'],
+            'duration': length,
+            'estimated_bytes': int(estimated_bytes),
+            'estimated_copy_seconds': round(copy_time, 2),
+            'estimated_encode_seconds': round(encode_time, 2),
+            'estimated_seconds': round(copy_time + encode_time, 2)
+        })
+
+    # Segments run `parallel` at a time; each starts on the first free slot
+    slots = [0.0] * parallel
+    for segment in segments:
+        slot = slots.index(min(slots))
+        slots[slot] += segment['estimated_seconds']
+
+    return {
+        'mode': 'copy' if copy else 'reencode',
+        'engine': config.engine,
+        'encoder': None if copy else encoder,
+        'parallel': parallel,
+        'basis': basis,
+        'samples': len(copy_samples if copy else encode_samples),
+        'segments': segments,
+        'estimated_total_bytes': sum(segment['estimated_bytes'] for segment in segments),
+        'estimated_total_seconds': round(max(slots), 2)
+    }
+
+# Segment checkpoints
+# Every finished segment is recorded on the job (checkpoints.<index>) with the
+# spec it was cut from, its stored path, size and CRC-32. A retried or resumed
+# job re-runs only the segments whose checkpoint is missing, stale or corrupt.
+SEGMENT_SPEC_FIELDS = (
+    'preserve_quality', 'output_format', 'subtitle_sync_offset', 'subtitle_mode', 'force_keyframes',
+    'keyframe_interval', 'engine', 'speed_tier', 'target_realtime_factor'
+)
+
+def segment_spec(split: Dict, config: SplitConfig, video_info: Dict) -> str:
+    """Fingerprint of everything that determines a segment's output"""
+    spec = {
+        'start': round(split['start'], 6),
+        'end': round(split['end'], 6),
+        'source': [video_info['size'], video_info['duration']],
+        **{field: getattr(config, field) for field in SEGMENT_SPEC_FIELDS}
+    }
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()[:16]
+
+async def save_checkpoint(job_id: str, index: int, split: Dict, spec: str, output_path: str) -> Dict:
+    """Describe, publish and record a finished segment (and its sidecars)"""
+    sidecars = sorted(Path(output_path).parent.glob(f"{glob.escape(Path(output_path).stem)}.*.srt"))
+    files = []
+    for file_path in [output_path, *map(str, sidecars)]:
+        described = await asyncio.to_thread(describe_output_file, file_path)
+        await publish_file(file_path)
+        files.append({**described, 'path': storage_key(file_path)})
+
+    checkpoint = {
+        **files[0],
+        'start': split['start'],
+        'end': split['end'],
+        'spec': spec,
+        'completed_at': datetime.utcnow()
+    }
+    if files[1:]:
+        checkpoint['subtitles'] = files[1:]
+    await db.video_jobs.update_one({'id': job_id}, {'$set': {f'checkpoints.{index}': checkpoint}})
+    return checkpoint
+
+async def verify_checkpoint(checkpoint: Dict, spec: str) -> bool:
+    """Whether a checkpoint matches the segment spec and its files are intact"""
+    if checkpoint.get('spec') != spec:
+        return False
+    for entry in [checkpoint, *checkpoint.get('subtitles', [])]:
+        file_path = TEMP_BASE / entry['path']
+        try:
+            await localize(file_path)
+        except FileNotFoundError:
+            return False
+        current = await asyncio.to_thread(describe_output_file, str(file_path))
+        if (current['size'], current['crc32']) != (entry['size'], entry['crc32']):
+            logger.warning(f"Checkpointed segment {entry['file']} is corrupt; it will be re-run")
+            return False
+    return True
+
+async def verified_checkpoints(stored: Dict, specs: List[str]) -> Dict[int, Dict]:
+    """The stored checkpoints (keyed by segment index) that can be reused"""
+    candidates = [(int(key), checkpoint) for key, checkpoint in stored.items() if int(key) < len(specs)]
+    valid = await asyncio.gather(*(verify_checkpoint(checkpoint, specs[i]) for i, checkpoint in candidates))
+    return {i: checkpoint for (i, checkpoint), ok in zip(candidates, valid) if ok}
+
+def checkpoint_output(checkpoint: Dict) -> Dict:
+    """The job's `splits` entry for a checkpointed segment"""
+    fields = ('file', 'size', 'mtime', 'crc32')
+    output = {field: checkpoint[field] for field in fields}
+    if checkpoint.get('subtitles'):
+        output['subtitles'] = [{field: sidecar[field] for field in fields} for sidecar in checkpoint['subtitles']]
+    return output
+
+async def process_video_job(job_id: str, file_path: str, config: SplitConfig):
+    """Background task to process video splitting"""
+    profile = Profile('job', job_id, f"split {config.method} ({config.engine})") if config.profile else None
+    if profile:
+        profile.start()
+    fetched = False
+
+    try:
+        # Update status to processing
+        await update_job_progress(job_id, 0, "processing")
+
+        # The upload may have been received by another node
+        fetched = await localize(file_path)
+        
+        # Get video info
+        video_info = await get_video_info(file_path)
+        
+        # Generate splits based on method
+        splits = await plan_splits(file_path, video_info, config)
+        
+        if not splits:
+            raise Exception("No valid splits generated")
+        
+        # Create output directory for this job
+        output_dir = OUTPUT_DIR / job_id
+
+        # Segments an earlier attempt finished, and that are still intact, are kept
+        specs = [segment_spec(split, config, video_info) for split in splits]
+        job = await db.video_jobs.find_one({'id': job_id}, {'checkpoints': 1})
+        checkpoints = await verified_checkpoints((job or {}).get('checkpoints') or {}, specs)
+        reused = len(checkpoints)
+        if reused:
+            logger.info(f"Job {job_id}: reusing {reused} of {len(splits)} checkpointed segments")
+        remaining = [split for i, split in enumerate(splits) if i not in checkpoints]
+        
+        # Make room for the outputs up front instead of failing with ENOSPC mid-encode
+        await storage_manager.reserve(job_id, estimate_split_bytes(video_info, remaining, config))
+
+        async def checkpoint_segment(index: int, output_path: str):
+            checkpoints[index] = await save_checkpoint(job_id, index, splits[index], specs[index], output_path)
+
+        # Split the video
+        started = time.monotonic()
+        if remaining:
+            await split_video_with_subtitles(
+                file_path, str(output_dir), splits, config, job_id,
+                {i: str(TEMP_BASE / checkpoint['path']) for i, checkpoint in checkpoints.items()},
+                checkpoint_segment
+            )
+        wall_seconds = time.monotonic() - started
+        
+        # Update job with completion
+        # Size and CRC-32 per output come from the checkpoints (reused by the streamed ZIP download)
+        output_splits = [checkpoint_output(checkpoints[i]) for i in range(len(splits))]
+        if not reused:
+            try:
+                encoder = resolve_encoder_settings(
+                    config, video_info, segment_parallelism(config, len(splits)), await get_encoder_profile()
+                )
+                await record_throughput(
+                    video_info, splits, config, encoder, wall_seconds,
+                    sum(split['size'] for split in output_splits)
+                )
+            except Exception as e:
+                logger.warning(f"Could not record throughput for job {job_id}: {e}")
+        await progress_writer.write(job_id, {
+            'status': 'completed',
+            'progress': 100.0,
+            'splits': output_splits,
+            # Drop checkpoints of segments an older plan had but this one does not
+            'checkpoints': {str(i): checkpoint for i, checkpoint in checkpoints.items()},
+            'storage_bytes': await asyncio.to_thread(job_storage_bytes, job_id, file_path),
+            'last_accessed_at': datetime.utcnow(),
+            'updated_at': datetime.utcnow()
+        }, flush=True)
+        publish_job_event(job_id, 'completed', {'status': 'completed', 'progress': 100.0, 'splits': output_splits})
+        
+    except Exception as e:
+        logger.error(f"Error processing video job {job_id}: {e}")
+        await progress_writer.write(job_id, {
+            'status': 'failed',
+            'error_message': str(e),
+            'updated_at': datetime.utcnow()
+        }, flush=True)
+        publish_job_event(job_id, 'failed', {'status': 'failed', 'error_message': str(e)})
+
+    except asyncio.CancelledError:
+        # Shutdown or a lost lease: whoever runs the job next owns its progress
+        progress_writer.discard(job_id)
+        raise
+
+    finally:
+        storage_manager.release(job_id)
+        if fetched and Path(file_path).exists():
+            # Only a scratch copy here; the origin node keeps serving the upload
+            Path(file_path).unlink()
+        if profile:
+            await profile.save()
+
+# Object storage
+
+def storage_key(file_path) -> str:
+    """Object key of a file under TEMP_BASE (its relative path)"""
+    return Path(file_path).relative_to(TEMP_BASE).as_posix()
+
+def copy_file_atomic(source: Path, destination: Path):
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    partial = destination.with_name(f".{destination.name}.{uuid.uuid4().hex}.part")
+    try:
+        shutil.copyfile(source, partial)
+        os.replace(partial, destination)
+    finally:
+        if partial.exists():
+            partial.unlink()
+
+class LocalObjectStore:
+    """Objects stored as files under a directory"""
+
+    def __init__(self, root: Path):
+        self.root = root
+        # Rooted at TEMP_BASE, every file already is its own stored object
+        self.local = root.resolve() == TEMP_BASE.resolve()
+
+    def path(self, key: str) -> Path:
+        return self.root / key
+
+    async def put(self, key: str, file_path: Path):
+        if not self.local:
+            await asyncio.to_thread(copy_file_atomic, Path(file_path), self.path(key))
+
+    async def fetch(self, key: str, file_path: Path):
+        if self.local:
+            raise FileNotFoundError(f"{key} is not in storage")
+        await asyncio.to_thread(copy_file_atomic, self.path(key), Path(file_path))
+
+    async def stat(self, key: str) -> Optional[Dict]:
+        try:
+            stat = await asyncio.to_thread(os.stat, self.path(key))
+        except FileNotFoundError:
+            return None
+        return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+    def read_range(self, key: str, start: int, end: int):
+        return iter_file_range(str(self.path(key)), start, end)
+
+    async def delete(self, key: str):
+        """Delete an object, or every object under `key/`"""
+        path = self.path(key)
+        if path.is_dir():
+            await asyncio.to_thread(shutil.rmtree, path, True)
+        elif path.exists():
+            path.unlink()
+
+class S3ObjectStore:
+    """Objects in an S3-compatible bucket (same interface as LocalObjectStore)"""
+
+    local = False
+
+    def __init__(self, bucket: Optional[str], endpoint_url: Optional[str] = None, prefix: str = ''):
+        import boto3
+        from botocore.exceptions import ClientError
+
+        if not bucket:
+            raise ValueError("STORAGE_BUCKET is required for the s3 storage backend")
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client_error = ClientError
+        # boto3 clients are thread-safe; every call runs in a worker thread
+        self.client = boto3.client('s3', endpoint_url=endpoint_url)
+
+    def object_key(self, key: str) -> str:
+        return self.prefix + key
+
+    async def put(self, key: str, file_path: Path):
+        # upload_file switches to parallel multipart uploads for large files
+        await asyncio.to_thread(self.client.upload_file, str(file_path), self.bucket, self.object_key(key))
+
+    async def fetch(self, key: str, file_path: Path):
+        file_path = Path(file_path)
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        partial = file_path.with_name(f".{file_path.name}.{uuid.uuid4().hex}.part")
+        try:
+            await asyncio.to_thread(self.client.download_file, self.bucket, self.object_key(key), str(partial))
+            os.replace(partial, file_path)
+        except self.client_error as e:
+            raise FileNotFoundError(f"{key} is not in storage: {e}")
+        finally:
+            if partial.exists():
+                partial.unlink()
+
+    async def stat(self, key: str) -> Optional[Dict]:
+        try:
+            head = await asyncio.to_thread(self.client.head_object, Bucket=self.bucket, Key=self.object_key(key))
+        except self.client_error as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+        return {'size': head['ContentLength'], 'mtime': head['LastModified'].timestamp()}
+
+    async def read_range(self, key: str, start: int, end: int):
+        response = await asyncio.to_thread(
+            self.client.get_object, Bucket=self.bucket, Key=self.object_key(key), Range=f'bytes={start}-{end}'
+        )
+        body = response['Body']
+        try:
+            while True:
+                chunk = await asyncio.to_thread(body.read, STREAM_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            body.close()
+
+    def delete_tree(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self.object_key(key))
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.object_key(key) + '/'):
+            objects = [{'Key': item['Key']} for item in page.get('Contents', [])]
+            if objects:
+                self.client.delete_objects(Bucket=self.bucket, Delete={'Objects': objects, 'Quiet': True})
+
+    async def delete(self, key: str):
+        """Delete an object, or every object under `key/`"""
+        await asyncio.to_thread(self.delete_tree, key)
+
+def create_object_store():
+    if STORAGE_BACKEND == 's3':
+        return S3ObjectStore(STORAGE_BUCKET, STORAGE_ENDPOINT_URL, STORAGE_PREFIX)
+    if STORAGE_BACKEND != 'local':
+        raise ValueError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND}")
+    return LocalObjectStore(STORAGE_ROOT)
+
+object_store = create_object_store()
+
+async def publish_file(file_path):
+    await object_store.put(storage_key(file_path), Path(file_path))
+
+async def publish_directory(directory: Path):
+    await asyncio.gather(*(publish_file(path) for path in sorted(directory.iterdir()) if path.is_file()))
+
+async def localize(file_path) -> bool:
+    """Make sure a published file exists on this node; True if it had to be fetched"""
+    if Path(file_path).exists():
+        return False
+    await object_store.fetch(storage_key(file_path), Path(file_path))
+    return True
+
+async def is_stored(file_path) -> bool:
+    return Path(file_path).exists() or await object_store.stat(storage_key(file_path)) is not None
+
+async def locate_file(file_path: Path) -> Optional[Dict]:
+    """Size, mtime and reader of a published file: this node's copy if it has one, else the store's"""
+    if file_path.exists():
+        stat = file_path.stat()
+        return {'path': str(file_path), 'size': stat.st_size, 'mtime': stat.st_mtime, 'read_range': None}
+    key = storage_key(file_path)
+    stat = await object_store.stat(key)
+    if stat is None:
+        return None
+    return {'path': None, **stat, 'read_range': functools.partial(object_store.read_range, key)}
+
+# Storage manager
+
+def directory_size(path: Path) -> int:
+    """Total size of the files under a directory (0 if it does not exist)"""
+    total = 0
+    try:
+        entries = list(os.scandir(path))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                total += directory_size(Path(entry.path))
+            else:
+                total += entry.stat(follow_symlinks=False).st_size
+        except FileNotFoundError:
+            continue
+    return total
+
+def job_storage_bytes(job_id: str, file_path: Optional[str]) -> int:
+    """Bytes a job holds on disk: its upload, packet index, outputs and previews"""
+    total = 0
+    if file_path:
+        for path in (file_path, packet_index_path(file_path)):
+            try:
+                total += os.path.getsize(path)
+            except OSError:
+                pass
+    for base in (OUTPUT_DIR, PREVIEW_DIR, PROXY_DIR):
+        total += directory_size(base / job_id)
+    return total
+
+def estimate_split_bytes(video_info: Dict, splits: List[Dict], config: SplitConfig) -> int:
+    """Rough output size of a split: the source bitrate over the covered duration"""
+    duration = video_info['duration'] or 1
+    covered = sum(split['end'] - split['start'] for split in splits)
+    copy = config.preserve_quality and not config.force_keyframes
+    factor = 1.0 if copy else REENCODE_SIZE_FACTOR
+    return int(video_info['size'] * min(covered / duration, 1.0) * factor)
+
+async def remove_job_files(job_id: str, job: Optional[Dict]):
+    """Delete everything a job holds on disk and drop its in-process caches"""
+    if job and job.get('file_path'):
+        upload_path = Path(job['file_path'])
+        if upload_path.exists():
+            upload_path.unlink()
+        close_packet_index(job['file_path'])
+        await forget_probe(job['file_path'])
+        index_path = Path(packet_index_path(job['file_path']))
+        if index_path.exists():
+            index_path.unlink()
+        await object_store.delete(storage_key(job['file_path']))
+        await object_store.delete(storage_key(index_path))
+
+    stream_targets.pop(job_id, None)
+    proxy_task = preview_proxy_tasks.pop(job_id, None)
+    if proxy_task:
+        proxy_task.cancel()
+
+    # Remove outputs and previews
+    for base in (OUTPUT_DIR, PREVIEW_DIR, PROXY_DIR):
+        shutil.rmtree(base / job_id, ignore_errors=True)
+        await object_store.delete(storage_key(base / job_id))
+
+class StorageManager:
+    """Keep TEMP_BASE under its watermarks by expiring idle and stale jobs"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.reservations: Dict[str, int] = {}
+        self.accessed: Dict[str, datetime] = {}
+        self.lock = asyncio.Lock()
+        self.task: Optional[asyncio.Task] = None
+
+    def touch(self, job_id: str):
+        """Record an access (batched into last_accessed_at on the next sweep)"""
+        self.accessed[job_id] = datetime.utcnow()
+
+    def release(self, job_id: str):
+        self.reservations.pop(job_id, None)
+
+    def reserved_bytes(self) -> int:
+        # Bytes a running job has already written no longer need reserving
+        return sum(
+            max(0, size - directory_size(OUTPUT_DIR / job_id))
+            for job_id, size in self.reservations.items()
+        )
+
+    def usage(self) -> tuple:
+        """(used, capacity) bytes of the managed volume"""
+        if STORAGE_QUOTA_BYTES:
+            return directory_size(TEMP_BASE), STORAGE_QUOTA_BYTES
+        disk = shutil.disk_usage(TEMP_BASE)
+        return disk.used, disk.total
+
+    async def ensure_space(self, size: int):
+        """Evict idle jobs until `size` more bytes fit; raise if they never will"""
+        async with self.lock:
+            used, capacity = await asyncio.to_thread(self.usage)
+            reserved = await asyncio.to_thread(self.reserved_bytes)
+            needed = used + reserved + size
+            # Evicting cannot help a request that would not fit on an empty volume
+            if needed > capacity * STORAGE_HIGH_WATERMARK and reserved + size <= capacity:
+                used -= await self.evict(needed - capacity * STORAGE_LOW_WATERMARK)
+                needed = used + reserved + size
+            if needed > capacity:
+                raise Exception(
+                    f"Not enough disk space: need {size / 1024 / 1024:.0f} MB, "
+                    f"{max(0, capacity - used - reserved) / 1024 / 1024:.0f} MB available"
+                )
+
+    async def reserve(self, job_id: str, size: int):
+        """Set aside space for a job's outputs before it starts writing them"""
+        await self.ensure_space(size)
+        self.reservations[job_id] = size
+
+    async def expire_job(self, job: Dict, reason: str, statuses: List[str]) -> int:
+        """Delete a job's files and mark its record expired; returns bytes freed.
+
+        The job is claimed first, and only while its status is still one of
+        `statuses`, so a retry or split that got in meanwhile keeps its files.
+        """
+        now = datetime.utcnow()
+        claimed = await db.video_jobs.find_one_and_update(
+            {'id': job['id'], 'status': {'$in': statuses}},
+            {'$set': {
+                'status': 'expired',
+                'error_message': reason,
+                'expired_at': now,
+                'updated_at': now
             }}
         )
-        
-    except Exception as e:
-        logger.error(f"Error processing video job {job_id}: {e}")
-        await db.video_jobs.update_one(
-            {'id': job_id},
-            {'$set': {
-                'status': 'failed',
-                'error_message': str(e),
-                'updated_at': datetime.utcnow()
-            }}
+        if claimed is None:
+            return 0
+
+        freed = await asyncio.to_thread(job_storage_bytes, job['id'], job.get('file_path'))
+        await remove_job_files(job['id'], job)
+        await db.video_jobs.update_one({'id': job['id']}, {'$set': {'storage_bytes': 0}})
+        publish_job_event(job['id'], 'expired', {'status': 'expired', 'error_message': reason})
+        logger.info(f"Expired job {job['id']} ({freed / 1024 / 1024:.1f} MB): {reason}")
+        return freed
+
+    async def evict(self, target: float) -> int:
+        """Expire least-recently-accessed finished jobs until `target` bytes are freed.
+
+        Failed jobs keep their source and checkpoints for /api/retry, so they
+        are only evicted once every completed job is gone.
+        """
+        await self.flush_access()
+        freed = 0
+        for status in ('completed', 'failed'):
+            candidates = db.video_jobs.find(
+                {'status': status},
+                {'_id': 0, 'id': 1, 'file_path': 1}
+            ).sort([('last_accessed_at', 1), ('updated_at', 1)])
+            async for job in candidates:
+                if freed >= target:
+                    return freed
+                freed += await self.expire_job(job, 'Evicted to free disk space', [status])
+        return freed
+
+    async def flush_access(self):
+        if not self.accessed:
+            return
+        batch, self.accessed = self.accessed, {}
+        await db.video_jobs.bulk_write(
+            [UpdateOne({'id': job_id}, {'$set': {'last_accessed_at': at}}) for job_id, at in batch.items()],
+            ordered=False
+        )
+
+    async def expire_stale_uploads(self):
+        """Expire uploads nobody split, and abandoned chunked upload sessions"""
+        cutoff = datetime.utcnow() - timedelta(hours=UPLOAD_TTL_HOURS)
+        stale = db.video_jobs.find(
+            {'status': 'uploaded', 'created_at': {'$lt': cutoff},
+             'last_accessed_at': {'$not': {'$gte': cutoff}}},
+            {'_id': 0, 'id': 1, 'file_path': 1}
+        )
+        async for job in stale:
+            await self.expire_job(job, 'Upload expired before it was split', ['uploaded'])
+
+        async for session in db.upload_sessions.find({'status': 'open', 'updated_at': {'$lt': cutoff}}):
+            upload_path = Path(session['file_path'])
+            if upload_path.exists():
+                upload_path.unlink()
+            await db.upload_sessions.delete_one({'id': session['id']})
+            logger.info(f"Removed abandoned upload session {session['id']}")
+
+    async def record_job_sizes(self):
+        """Refresh storage_bytes on every job that still holds files"""
+        operations = []
+        async for job in db.video_jobs.find(
+            {'status': {'$ne': 'expired'}},
+            {'_id': 0, 'id': 1, 'file_path': 1, 'storage_bytes': 1}
+        ):
+            size = await asyncio.to_thread(job_storage_bytes, job['id'], job.get('file_path'))
+            if size != job.get('storage_bytes'):
+                operations.append(UpdateOne({'id': job['id']}, {'$set': {'storage_bytes': size}}))
+        if operations:
+            await db.video_jobs.bulk_write(operations, ordered=False)
+
+    async def drop_orphaned_copies(self):
+        """Remove this node's copies of jobs that were expired or cleaned up elsewhere"""
+        cutoff = time.time() - ORPHAN_GRACE_SECONDS
+        candidates: Dict[str, List[str]] = {}
+        for base in (UPLOAD_DIR, OUTPUT_DIR, PREVIEW_DIR, PROXY_DIR):
+            if not base.exists():
+                continue
+            for entry in os.scandir(base):
+                # Uploads are named "<job id>_<filename>", everything else "<job id>"
+                job_id = entry.name[:36]
+                try:
+                    if UUID_PATTERN.fullmatch(job_id) and entry.stat(follow_symlinks=False).st_mtime < cutoff:
+                        candidates.setdefault(job_id, []).append(entry.path)
+                except FileNotFoundError:
+                    continue
+        if not candidates:
+            return
+
+        live = set()
+        async for job in db.video_jobs.find(
+            {'id': {'$in': list(candidates)}, 'status': {'$ne': 'expired'}}, {'_id': 0, 'id': 1}
+        ):
+            live.add(job['id'])
+        async for session in db.upload_sessions.find({'id': {'$in': list(candidates)}}, {'_id': 0, 'id': 1}):
+            live.add(session['id'])
+
+        for job_id, paths in candidates.items():
+            if job_id in live:
+                continue
+            for path in paths:
+                close_packet_index(path)
+                if os.path.isdir(path):
+                    await asyncio.to_thread(shutil.rmtree, path, True)
+                elif os.path.exists(path):
+                    os.unlink(path)
+            stream_targets.pop(job_id, None)
+            logger.info(f"Dropped local copies of job {job_id}")
+
+    async def sweep(self):
+        await self.flush_access()
+        await self.expire_stale_uploads()
+        if object_store.local:
+            await self.record_job_sizes()
+        else:
+            # Sizes seen by a single node are partial once files live in shared storage
+            await self.drop_orphaned_copies()
+        try:
+            await self.ensure_space(0)
+        except Exception as e:
+            logger.warning(f"Storage above capacity after eviction: {e}")
+
+    async def stats(self) -> Dict:
+        used, capacity = await asyncio.to_thread(self.usage)
+        directories = {
+            name: await asyncio.to_thread(directory_size, path)
+            for name, path in (
+                ('uploads', UPLOAD_DIR), ('processing', PROCESS_DIR), ('outputs', OUTPUT_DIR),
+                ('previews', PREVIEW_DIR), ('proxies', PROXY_DIR)
+            )
+        }
+        jobs = {}
+        async for row in db.video_jobs.aggregate([
+            {'$group': {'_id': '$status', 'count': {'$sum': 1}, 'bytes': {'$sum': '$storage_bytes'}}}
+        ]):
+            jobs[row['_id']] = {'count': row['count'], 'bytes': row['bytes']}
+        return {
+            'used': used,
+            'capacity': capacity,
+            'free': max(0, capacity - used),
+            'reserved': await asyncio.to_thread(self.reserved_bytes),
+            'high_watermark': STORAGE_HIGH_WATERMARK,
+            'low_watermark': STORAGE_LOW_WATERMARK,
+            'directories': directories,
+            'jobs': jobs
+        }
+
+    async def run(self):
+        while True:
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"Storage sweep failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+        await self.flush_access()
+
+storage_manager = StorageManager(STORAGE_SWEEP_INTERVAL)
+
+# Job scheduler
+# Split requests are queued in video_jobs and claimed atomically by a fixed
+# pool of workers, so a burst of submissions never starts more encodes than
+# the host can run and queued jobs survive restarts. Any number of processes
+# and hosts can share the queue: a claimed job is leased to its worker, which
+# renews the lease with heartbeats, and jobs whose lease lapses (their node
+# died or lost Mongo) are requeued by whichever node notices first.
+def default_worker_count() -> int:
+    """Size the worker pool to the host's cores and memory"""
+    cores = os.cpu_count() or 1
+    try:
+        memory = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        memory = None
+    # Each job already spreads its segments over MAX_PARALLEL_SEGMENTS cores
+    workers = max(1, cores // max(1, min(MAX_PARALLEL_SEGMENTS, cores)))
+    if memory:
+        workers = min(workers, max(1, memory // JOB_MEMORY_BYTES))
+    return workers
+
+class JobScheduler:
+    """Pool of workers that claim queued split jobs from Mongo"""
+
+    def __init__(self, worker_count: int):
+        self.worker_count = worker_count
+        self.worker_id = f"{os.uname().nodename}-{os.getpid()}"
+        self.wakeup = asyncio.Event()
+        self.workers: List[asyncio.Task] = []
+        self.active: Dict[str, asyncio.Task] = {}
+        self.reaper: Optional[asyncio.Task] = None
+
+    async def start(self):
+        await self.recover()
+        self.workers = [
+            asyncio.create_task(self.run_worker(n)) for n in range(self.worker_count)
+        ]
+        self.reaper = asyncio.create_task(self.run_reaper())
+        logger.info(f"Job scheduler {self.worker_id} started with {self.worker_count} workers")
+
+    async def stop(self):
+        tasks = self.workers + list(self.active.values()) + ([self.reaper] if self.reaper else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.workers = []
+        self.reaper = None
+        await self.release_leases()
+
+    async def release_leases(self):
+        """Hand this process's unfinished jobs back to the queue on shutdown"""
+        result = await db.video_jobs.update_many(
+            {'status': 'processing', 'worker_id': self.worker_id},
+            {
+                '$set': {'status': 'queued', 'progress': 0.0, 'updated_at': datetime.utcnow()},
+                '$unset': {'worker_id': '', 'lease_expires_at': ''},
+                # A clean shutdown is not a failed attempt
+                '$inc': {'attempts': -1}
+            }
+        )
+        if result.modified_count:
+            logger.info(f"Released {result.modified_count} jobs back to the queue")
+
+    async def recover(self) -> int:
+        """Requeue "processing" jobs whose worker stopped renewing their lease"""
+        now = datetime.utcnow()
+        abandoned = {
+            'status': 'processing',
+            '$or': [{'lease_expires_at': {'$lt': now}}, {'lease_expires_at': {'$exists': False}}]
+        }
+        await db.video_jobs.update_many(
+            {**abandoned, 'attempts': {'$gte': MAX_JOB_ATTEMPTS}},
+            {
+                '$set': {
+                    'status': 'failed',
+                    'error_message': 'Job was interrupted too many times',
+                    'updated_at': now
+                },
+                '$unset': {'worker_id': '', 'lease_expires_at': ''}
+            }
+        )
+        result = await db.video_jobs.update_many(
+            abandoned,
+            {
+                '$set': {'status': 'queued', 'progress': 0.0, 'updated_at': now},
+                '$unset': {'worker_id': '', 'lease_expires_at': ''}
+            }
+        )
+        if result.modified_count:
+            logger.info(f"Requeued {result.modified_count} interrupted jobs")
+        return result.modified_count
+
+    async def run_reaper(self):
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_INTERVAL)
+            try:
+                if await self.recover():
+                    self.notify()
+            except Exception as e:
+                logger.error(f"Scheduler failed to requeue abandoned jobs: {e}")
+
+    async def heartbeat(self, job_id: str, task: asyncio.Task):
+        """Renew a running job's lease; stop the job if another worker has taken it over"""
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_INTERVAL)
+            try:
+                result = await db.video_jobs.update_one(
+                    {'id': job_id, 'worker_id': self.worker_id},
+                    {'$set': {'lease_expires_at': datetime.utcnow() + timedelta(seconds=JOB_LEASE_SECONDS)}}
+                )
+            except Exception as e:
+                logger.warning(f"Could not renew the lease on job {job_id}: {e}")
+                continue
+            if result.matched_count == 0:
+                logger.warning(f"Lost the lease on job {job_id}; stopping it")
+                task.cancel()
+                return
+
+    def notify(self):
+        """Wake idle workers after a job has been queued"""
+        self.wakeup.set()
+
+    async def enqueue(self, job_id: str, config: SplitConfig, from_statuses: List[str],
+                      reset_attempts: bool = False) -> bool:
+        """Queue a job that is still in one of `from_statuses`; False if it no longer is"""
+        now = datetime.utcnow()
+        update = {
+            'status': 'queued',
+            'progress': 0.0,
+            'priority': config.priority,
+            'split_config': config.dict(),
+            'queued_at': now,
+            'updated_at': now,
+            'error_message': None
+        }
+        if reset_attempts:
+            update['attempts'] = 0
+        # Checking the status in the filter keeps concurrent requests from queueing a job twice
+        result = await db.video_jobs.update_one(
+            {'id': job_id, 'status': {'$in': from_statuses}},
+            {'$set': update}
+        )
+        if result.matched_count == 0:
+            return False
+        publish_job_event(job_id, 'queued', {'status': 'queued', 'progress': 0.0})
+        self.notify()
+        return True
+
+    async def claim(self) -> Optional[Dict]:
+        """Atomically move the highest-priority, oldest queued job to "processing" """
+        return await db.video_jobs.find_one_and_update(
+            {'status': 'queued'},
+            {
+                '$set': {
+                    'status': 'processing',
+                    'worker_id': self.worker_id,
+                    'lease_expires_at': datetime.utcnow() + timedelta(seconds=JOB_LEASE_SECONDS),
+                    'started_at': datetime.utcnow(),
+                    'updated_at': datetime.utcnow()
+                },
+                '$inc': {'attempts': 1}
+            },
+            sort=[('priority', -1), ('queued_at', 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def run_worker(self, number: int):
+        while True:
+            try:
+                job = await self.claim()
+            except Exception as e:
+                logger.error(f"Scheduler worker {number} failed to claim a job: {e}")
+                job = None
+
+            if job is None:
+                # Jobs may also be queued by other processes, so poll as well
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), SCHEDULER_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self.run_job(job)
+            except Exception as e:
+                logger.error(f"Scheduler worker {number} crashed on job {job['id']}: {e}")
+
+    async def run_job(self, job: Dict):
+        config = SplitConfig(**job['split_config'])
+        task = asyncio.create_task(process_video_job(job['id'], job['file_path'], config))
+        self.active[job['id']] = task
+        heartbeat = asyncio.create_task(self.heartbeat(job['id'], task))
+        try:
+            # wait() rather than await: losing the lease cancels the job, not this worker
+            await asyncio.wait({task})
+        finally:
+            heartbeat.cancel()
+            self.active.pop(job['id'], None)
+
+    async def queue_position(self, job: Dict) -> Optional[int]:
+        """1-based position of a queued job in claim order"""
+        if job.get('status') != 'queued':
+            return None
+        priority = job.get('priority', 0)
+        ahead = await db.video_jobs.count_documents({
+            'status': 'queued',
+            '$or': [
+                {'priority': {'$gt': priority}},
+                {'priority': priority, 'queued_at': {'$lt': job['queued_at']}}
+            ]
+        })
+        return ahead + 1
+
+scheduler = JobScheduler(SCHEDULER_WORKERS or default_worker_count())
+
+# Range streaming
+# Files are streamed in fixed-size chunks, so memory per connection stays at
+# STREAM_CHUNK_SIZE no matter how large the requested range is.
+STREAM_CHUNK_SIZE = int(os.environ.get('STREAM_CHUNK_SIZE', str(256 * 1024)))
+STREAM_TARGET_TTL = float(os.environ.get('STREAM_TARGET_TTL', '60'))
+# Range headers with more parts than this are ignored and answered with the
+# whole file, so a request cannot fan out into thousands of parts (CVE-2011-3192)
+STREAM_MAX_RANGES = int(os.environ.get('STREAM_MAX_RANGES', '16'))
+
+VIDEO_MEDIA_TYPES = {
+    '.mp4': 'video/mp4',
+    '.mkv': 'video/x-matroska',
+    '.avi': 'video/x-msvideo',
+    '.mov': 'video/quicktime',
+    '.wmv': 'video/x-ms-wmv',
+    '.flv': 'video/x-flv',
+    '.webm': 'video/webm',
+    '.gif': 'image/gif'
+}
+
+STREAM_CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, HEAD, OPTIONS',
+    'Access-Control-Allow-Headers': 'Range, Content-Type, If-Range, If-None-Match, If-Modified-Since',
+    'Access-Control-Expose-Headers': 'Content-Length, Content-Range, Accept-Ranges, ETag, Last-Modified'
+}
+
+# job_id -> (expires_at, target); saves a Mongo lookup per scrub request
+stream_targets: Dict[str, tuple] = {}
+
+async def get_stream_target(job_id: str) -> Dict:
+    """Resolve a job to its source path, size and media type (cached briefly)"""
+    cached = stream_targets.get(job_id)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+
+    job = await db.video_jobs.find_one({"id": job_id}, {'file_path': 1, 'filename': 1})
+    if not job or not job.get('file_path'):
+        raise HTTPException(status_code=404, detail="Video not found")
+
+    file_path = Path(job['file_path'])
+    located = await locate_file(file_path)
+    if located is None:
+        raise HTTPException(status_code=404, detail="Video file not found")
+
+    target = {
+        **located,
+        'filename': job['filename'],
+        'media_type': VIDEO_MEDIA_TYPES.get(file_path.suffix.lower(), 'video/mp4')
+    }
+    stream_targets[job_id] = (time.monotonic() + STREAM_TARGET_TTL, target)
+    return target
+
+def parse_range_header(range_header: str, file_size: int) -> Optional[List[tuple]]:
+    """Parse a `bytes=` Range header into inclusive (start, end) pairs.
+
+    Returns None when the header is malformed or has more than
+    STREAM_MAX_RANGES parts (the range is ignored) and an empty list when no
+    range is satisfiable. Overlapping and adjacent ranges are merged, in
+    file order.
+    """
+    unit, _, spec = range_header.partition('=')
+    if unit.strip().lower() != 'bytes' or not spec or spec.count(',') >= STREAM_MAX_RANGES:
+        return None
+
+    ranges = []
+    for part in spec.split(','):
+        match = re.fullmatch(r'\s*(\d*)-(\d*)\s*', part)
+        if not match or match.group(1) == match.group(2) == '':
+            return None
+        first, last = match.groups()
+        if first == '':
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length == 0:
+                continue
+            start, end = max(file_size - length, 0), file_size - 1
+        else:
+            start = int(first)
+            end = min(int(last), file_size - 1) if last else file_size - 1
+            if last and int(last) < start:
+                return None
+        if start < file_size:
+            ranges.append((start, end))
+
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+async def iter_file_range(file_path: str, start: int, end: int):
+    """Yield bytes start..end (inclusive) of a file in STREAM_CHUNK_SIZE chunks"""
+    remaining = end - start + 1
+    async with aiofiles.open(file_path, 'rb') as f:
+        await f.seek(start)
+        while remaining > 0:
+            chunk = await f.read(min(STREAM_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+async def iter_multipart_ranges(read_range, parts: List[tuple]):
+    for header, start, end in parts:
+        yield header
+        async for chunk in read_range(start, end):
+            yield chunk
+        yield b'\r\n'
+
+def counted_range_reader(read_range, route: str):
+    async def read(start: int, end: int):
+        async for chunk in read_range(start, end):
+            BYTES_SERVED.inc(len(chunk), route=route)
+            yield chunk
+    return read
+
+def build_range_response(
+    request: Request,
+    file_path: Optional[str],
+    file_size: int,
+    mtime: float,
+    media_type: str,
+    extra_headers: Optional[Dict] = None,
+    head: bool = False,
+    read_range=None,
+    metric_route: Optional[str] = None
+):
+    """Serve a file honouring Range, If-Range, If-None-Match and If-Modified-Since.
+
+    `read_range(start, end)` can replace the file as the body source for
+    generated content of known size (e.g. streamed ZIP archives). Body bytes
+    are counted under `metric_route` when given.
+    """
+    read_range = read_range or functools.partial(iter_file_range, file_path)
+    if metric_route:
+        read_range = counted_range_reader(read_range, metric_route)
+    etag = f'"{file_size:x}-{int(mtime * 1000):x}"'
+    last_modified = formatdate(mtime, usegmt=True)
+    headers = {
+        'Accept-Ranges': 'bytes',
+        'ETag': etag,
+        'Last-Modified': last_modified,
+        'Cache-Control': 'no-cache',
+        **(extra_headers or {})
+    }
+
+    # Conditional GET: let the client reuse what it already has
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match:
+        if etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*':
+            return Response(status_code=304, headers=headers)
+    else:
+        if_modified_since = request.headers.get('if-modified-since')
+        if if_modified_since:
+            try:
+                if int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp():
+                    return Response(status_code=304, headers=headers)
+            except (TypeError, ValueError):
+                pass
+
+    ranges = None
+    range_header = request.headers.get('range')
+    if range_header:
+        # If-Range: only honour the range if the client's copy is still current
+        if_range = request.headers.get('if-range')
+        if not if_range or if_range.strip() in (etag, last_modified):
+            ranges = parse_range_header(range_header, file_size)
+            if ranges == []:
+                return Response(
+                    status_code=416,
+                    headers={**headers, 'Content-Range': f'bytes */{file_size}'}
+                )
+
+    if not ranges:
+        headers['Content-Length'] = str(file_size)
+        if head:
+            return Response(status_code=200, headers=headers, media_type=media_type)
+        return StreamingResponse(
+            read_range(0, file_size - 1),
+            headers=headers,
+            media_type=media_type
+        )
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        headers['Content-Range'] = f'bytes {start}-{end}/{file_size}'
+        headers['Content-Length'] = str(end - start + 1)
+        if head:
+            return Response(status_code=206, headers=headers, media_type=media_type)
+        return StreamingResponse(
+            read_range(start, end),
+            status_code=206,
+            headers=headers,
+            media_type=media_type
+        )
+
+    # Multiple ranges: multipart/byteranges with an exact Content-Length
+    boundary = uuid.uuid4().hex
+    parts = []
+    content_length = 0
+    for start, end in ranges:
+        part_header = (
+            f'--{boundary}\r\n'
+            f'Content-Type: {media_type}\r\n'
+            f'Content-Range: bytes {start}-{end}/{file_size}\r\n\r\n'
+        ).encode()
+        parts.append((part_header, start, end))
+        content_length += len(part_header) + (end - start + 1) + 2
+    closing = f'--{boundary}--\r\n'.encode()
+    content_length += len(closing)
+
+    multipart_type = f'multipart/byteranges; boundary={boundary}'
+    headers['Content-Length'] = str(content_length)
+    if head:
+        return Response(status_code=206, headers=headers, media_type=multipart_type)
+
+    async def body():
+        async for chunk in iter_multipart_ranges(read_range, parts):
+            yield chunk
+        yield closing
+
+    return StreamingResponse(body(), status_code=206, headers=headers, media_type=multipart_type)
+
+# Streaming ZIP archives
+# Outputs are stored uncompressed (video does not deflate), so the archive
+# layout and total size are known before the first byte is sent. CRC-32s are
+# computed when a job completes and cached on its splits.
+ZIP_LIMIT = 0xFFFFFFFF
+
+def file_crc32(file_path: str) -> int:
+    crc = 0
+    with open(file_path, 'rb') as f:
+        while True:
+            chunk = f.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                return crc
+            crc = zlib.crc32(chunk, crc)
+
+def describe_output_file(file_path: str) -> Dict:
+    """Size, mtime and CRC-32 of an output file, as stored on the job's splits"""
+    stat = os.stat(file_path)
+    return {
+        'file': os.path.basename(file_path),
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+        'crc32': file_crc32(file_path)
+    }
+
+def dos_datetime(timestamp: float) -> tuple:
+    t = time.localtime(max(timestamp, 315532800))  # DOS dates start in 1980
+    return (
+        (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2),
+        ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    )
+
+def build_stored_zip(entries: List[Dict]) -> tuple:
+    """Lay out a STORED zip (ZIP64 when needed) for files with known sizes and CRCs.
+
+    Returns (parts, total_size), where each part is either bytes or a
+    (read_range, size) tuple whose content is streamed from the entry's reader.
+    """
+    parts = []
+    central = []
+    offset = 0
+
+    for entry in entries:
+        name = entry['file'].encode('utf-8')
+        size = entry['size']
+        dos_time, dos_date = dos_datetime(entry['mtime'])
+        zip64 = size >= ZIP_LIMIT or offset >= ZIP_LIMIT
+        version = 45 if zip64 else 20
+
+        local_extra = struct.pack('<HHQQ', 0x0001, 16, size, size) if size >= ZIP_LIMIT else b''
+        local_size = ZIP_LIMIT if size >= ZIP_LIMIT else size
+        local_header = struct.pack(
+            '<IHHHHHIIIHH', 0x04034b50, version, 0x0800, 0, dos_time, dos_date,
+            entry['crc32'], local_size, local_size, len(name), len(local_extra)
+        ) + name + local_extra
+
+        central_fields = []
+        if size >= ZIP_LIMIT:
+            central_fields += [size, size]
+        if offset >= ZIP_LIMIT:
+            central_fields.append(offset)
+        central_extra = (
+            struct.pack(f'<HH{len(central_fields)}Q', 0x0001, 8 * len(central_fields), *central_fields)
+            if central_fields else b''
+        )
+        central.append(struct.pack(
+            '<IHHHHHHIIIHHHHHII', 0x02014b50, (3 << 8) | version, version, 0x0800, 0,
+            dos_time, dos_date, entry['crc32'], local_size, local_size, len(name),
+            len(central_extra), 0, 0, 0, 0o100644 << 16, min(offset, ZIP_LIMIT)
+        ) + name + central_extra)
+
+        parts.append(local_header)
+        parts.append((entry['read_range'], size))
+        offset += len(local_header) + size
+
+    central_directory = b''.join(central)
+    central_offset = offset
+    count = len(entries)
+    tail = b''
+    if central_offset >= ZIP_LIMIT or len(central_directory) >= ZIP_LIMIT or count >= 0xFFFF:
+        zip64_end_offset = central_offset + len(central_directory)
+        tail += struct.pack(
+            '<IQHHIIQQQQ', 0x06064b50, 44, 45, 45, 0, 0,
+            count, count, len(central_directory), central_offset
         )
+        tail += struct.pack('<IIQI', 0x07064b50, 0, zip64_end_offset, 1)
+    tail += struct.pack(
+        '<IHHHHIIH', 0x06054b50, 0, 0, min(count, 0xFFFF), min(count, 0xFFFF),
+        min(len(central_directory), ZIP_LIMIT), min(central_offset, ZIP_LIMIT), 0
+    )
+    parts.append(central_directory + tail)
+
+    total = sum(len(part) if isinstance(part, bytes) else part[1] for part in parts)
+    return parts, total
+
+def zip_range_reader(parts: List):
+    """read_range(start, end) over the concatenated zip parts"""
+    async def read_range(start: int, end: int):
+        position = 0
+        for part in parts:
+            length = len(part) if isinstance(part, bytes) else part[1]
+            part_start, part_end = position, position + length - 1
+            position += length
+            if part_end < start or length == 0:
+                continue
+            if part_start > end:
+                break
+            lo, hi = max(start, part_start) - part_start, min(end, part_end) - part_start
+            if isinstance(part, bytes):
+                yield part[lo:hi + 1]
+            else:
+                async for chunk in part[0](lo, hi):
+                    yield chunk
+    return read_range
 
 # API Endpoints
 # Add your routes to the router instead of directly to app
@@ -532,23 +4031,63 @@ async def create_mock_job():
     
     return {"message": "Mock job created", "job_id": job_id, "streaming_url": f"/api/video-stream/{job_id}"}
 
+async def register_uploaded_video(
+    job_id: str,
+    filename: str,
+    file_path: Path,
+    total_size: int,
+    background_tasks: BackgroundTasks,
+    content_hash: Optional[str] = None
+) -> Dict:
+    """Probe a fully written upload, create its job record and queue indexing"""
+    # Header-only probe keeps the upload response fast; splitting does the full probe
+    video_info = await get_video_info(str(file_path), fast=True, content_hash=content_hash)
+
+    job = VideoProcessingJob(
+        id=job_id,
+        filename=filename,
+        original_size=total_size,
+        status="uploaded",
+        file_path=str(file_path),
+        video_info=video_info
+    )
+    job_record = job.dict()
+    job_record['last_accessed_at'] = job_record['created_at']
+    if content_hash:
+        job_record['content_hash'] = content_hash
+
+    # Publish before the job exists so any node can pick it up
+    await publish_file(file_path)
+
+    # Save to database
+    await db.video_jobs.insert_one(job_record)
+
+    # Index keyframes once so planning and previews never re-scan the file
+    background_tasks.add_task(index_uploaded_video, job_id, str(file_path))
+    background_tasks.add_task(prepare_thumbnails, job_id, str(file_path))
+    if PREVIEW_PROXY:
+        background_tasks.add_task(start_preview_proxy, job_id, str(file_path))
+
+    logger.info(f"Successfully uploaded video: {filename}, size: {total_size / 1024 / 1024:.1f} MB")
+
+    return {
+        "job_id": job_id,
+        "filename": filename,
+        "size": total_size,
+        "video_info": video_info
+    }
+
 @api_router.post("/upload-video")
-async def upload_video(file: UploadFile = File(...)):
+async def upload_video(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
     """Upload video file with support for large files"""
     logger.info(f"Upload attempt - filename: {file.filename}, content_type: {file.content_type}")
     
-    if not file.filename.lower().endswith(('.mp4', '.mkv', '.avi', '.mov', '.wmv', '.flv', '.webm')):
+    if not file.filename.lower().endswith(SUPPORTED_VIDEO_EXTENSIONS):
         logger.error(f"Unsupported format: {file.filename}")
         raise HTTPException(status_code=400, detail="Unsupported video format")
     
-    # Create job record
     job_id = str(uuid.uuid4())
-    job = VideoProcessingJob(
-        id=job_id,
-        filename=file.filename,
-        original_size=0,
-        status="uploading"
-    )
+    started = time.monotonic()
     
     # Save file with streaming to handle large files efficiently
     file_path = UPLOAD_DIR / f"{job_id}_{file.filename}"
@@ -565,26 +4104,9 @@ async def upload_video(file: UploadFile = File(...)):
                     break
                 await f.write(chunk)
                 total_size += len(chunk)
+        record_upload('upload-video', total_size, started)
         
-        job.original_size = total_size
-        job.file_path = str(file_path)
-        
-        # Get video info
-        video_info = await get_video_info(str(file_path))
-        job.video_info = video_info
-        job.status = "uploaded"
-        
-        # Save to database
-        await db.video_jobs.insert_one(job.dict())
-        
-        logger.info(f"Successfully uploaded video: {file.filename}, size: {total_size / 1024 / 1024:.1f} MB")
-        
-        return {
-            "job_id": job_id,
-            "filename": file.filename,
-            "size": job.original_size,
-            "video_info": video_info
-        }
+        return await register_uploaded_video(job_id, file.filename, file_path, total_size, background_tasks)
         
     except Exception as e:
         logger.error(f"Upload error: {e}")
@@ -593,13 +4115,277 @@ async def upload_video(file: UploadFile = File(...)):
             file_path.unlink()
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
+def record_upload(endpoint: str, size: int, started: float):
+    UPLOAD_BYTES.inc(size, endpoint=endpoint)
+    UPLOAD_SIZE.observe(size, endpoint=endpoint)
+    UPLOAD_SECONDS.observe(time.monotonic() - started, endpoint=endpoint)
+
+async def write_request_body(request: Request, fd: int, offset: int = 0, limit: Optional[int] = None):
+    """Stream a raw request body to `fd` starting at `offset`, hashing as it goes.
+
+    Incoming pieces are batched into UPLOAD_WRITE_BUFFER_SIZE writes so each
+    thread-pool hop moves a large block. Returns (bytes written, sha256).
+    """
+    digest = hashlib.sha256()
+    written = 0
+    buffer = bytearray()
+    async for data in request.stream():
+        if limit is not None and written + len(buffer) + len(data) > limit:
+            raise HTTPException(status_code=400, detail="Request body is larger than expected")
+        digest.update(data)
+        buffer += data
+        if len(buffer) >= UPLOAD_WRITE_BUFFER_SIZE:
+            await asyncio.to_thread(os.pwrite, fd, bytes(buffer), offset + written)
+            written += len(buffer)
+            buffer.clear()
+    if buffer:
+        await asyncio.to_thread(os.pwrite, fd, bytes(buffer), offset + written)
+        written += len(buffer)
+    return written, digest
+
+def preallocate_file(file_path: Path, size: int):
+    """Create `file_path` with `size` bytes reserved (sparse if fallocate is unavailable)"""
+    with open(file_path, 'wb') as f:
+        try:
+            os.posix_fallocate(f.fileno(), 0, size)
+        except (AttributeError, OSError):
+            f.truncate(size)
+
+@api_router.post("/upload-video-raw")
+async def upload_video_raw(filename: str, request: Request, background_tasks: BackgroundTasks):
+    """Upload a video as the raw request body, written once straight to its final location"""
+    filename = Path(filename).name
+    logger.info(f"Raw upload attempt - filename: {filename}")
+
+    if not filename.lower().endswith(SUPPORTED_VIDEO_EXTENSIONS):
+        logger.error(f"Unsupported format: {filename}")
+        raise HTTPException(status_code=400, detail="Unsupported video format")
+
+    content_length = request.headers.get('content-length')
+    expected = int(content_length) if content_length and content_length.isdigit() else None
+
+    job_id = str(uuid.uuid4())
+    file_path = UPLOAD_DIR / f"{job_id}_{filename}"
+    started = time.monotonic()
+
+    if expected:
+        try:
+            await storage_manager.ensure_space(expected)
+        except Exception as e:
+            raise HTTPException(status_code=507, detail=str(e))
+
+    try:
+        # Reserve the space up front so the file is laid out contiguously
+        if expected:
+            await asyncio.to_thread(preallocate_file, file_path, expected)
+        fd = os.open(file_path, os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            total_size, digest = await write_request_body(request, fd, 0, expected)
+            if expected is not None and total_size != expected:
+                raise Exception(f"Received {total_size} of {expected} bytes")
+            os.ftruncate(fd, total_size)
+        finally:
+            os.close(fd)
+        record_upload('upload-video-raw', total_size, started)
+
+        return await register_uploaded_video(
+            job_id, filename, file_path, total_size, background_tasks,
+            content_hash=f"sha256:{digest.hexdigest()}"
+        )
+
+    except HTTPException:
+        # Client errors (e.g. a body longer than Content-Length) keep their status
+        if file_path.exists():
+            file_path.unlink()
+        raise
+    except Exception as e:
+        logger.error(f"Upload error: {e}")
+        # Clean up partial file if upload failed
+        if file_path.exists():
+            file_path.unlink()
+        raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+
+# Resumable chunked uploads
+# The client creates a session, PUTs fixed-size chunks in any order and in
+# parallel, can ask which chunks are present, and then completes the session.
+# Chunks are written at their offset in the preallocated final file, so the
+# upload is never copied a second time.
+async def get_upload_session(upload_id: str) -> Dict:
+    session = await db.upload_sessions.find_one({"id": upload_id})
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return session
+
+def upload_session_status(session: Dict) -> Dict:
+    received = sorted(session.get('received', []))
+    return {
+        "upload_id": session['id'],
+        "filename": session['filename'],
+        "size": session['size'],
+        "chunk_size": session['chunk_size'],
+        "total_chunks": session['total_chunks'],
+        "received_chunks": received,
+        "missing_chunks": session['total_chunks'] - len(received),
+        "status": session['status'],
+        "job_id": session.get('job_id')
+    }
+
+@api_router.post("/uploads")
+async def create_upload_session(upload: UploadSessionRequest):
+    """Start a resumable chunked upload"""
+    filename = Path(upload.filename).name
+    if not filename.lower().endswith(SUPPORTED_VIDEO_EXTENSIONS):
+        raise HTTPException(status_code=400, detail="Unsupported video format")
+    if upload.size <= 0:
+        raise HTTPException(status_code=400, detail="Upload size must be positive")
+    if not MIN_UPLOAD_CHUNK_SIZE <= upload.chunk_size <= MAX_UPLOAD_CHUNK_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"chunk_size must be between {MIN_UPLOAD_CHUNK_SIZE} and {MAX_UPLOAD_CHUNK_SIZE} bytes"
+        )
+
+    upload_id = str(uuid.uuid4())
+    file_path = UPLOAD_DIR / f"{upload_id}_{filename}"
+
+    try:
+        await storage_manager.ensure_space(upload.size)
+    except Exception as e:
+        raise HTTPException(status_code=507, detail=str(e))
+
+    # Reserve the full size up front so chunks can land at any offset
+    await asyncio.to_thread(preallocate_file, file_path, upload.size)
+
+    session = {
+        "id": upload_id,
+        "filename": filename,
+        "size": upload.size,
+        "chunk_size": upload.chunk_size,
+        "total_chunks": (upload.size + upload.chunk_size - 1) // upload.chunk_size,
+        "received": [],
+        "chunk_hashes": {},
+        "file_path": str(file_path),
+        "status": "open",
+        "created_at": datetime.utcnow(),
+        "updated_at": datetime.utcnow()
+    }
+    await db.upload_sessions.insert_one(session)
+
+    return upload_session_status(session)
+
+@api_router.get("/uploads/{upload_id}")
+async def get_upload_status(upload_id: str):
+    """List the chunks the server already has, so clients can resume"""
+    return upload_session_status(await get_upload_session(upload_id))
+
+@api_router.put("/uploads/{upload_id}/chunks/{index}")
+async def upload_chunk(upload_id: str, index: int, request: Request):
+    """Write one chunk (raw request body) at its offset in the upload file"""
+    session = await get_upload_session(upload_id)
+    if session['status'] != 'open':
+        raise HTTPException(status_code=409, detail=f"Upload session is {session['status']}")
+    if not 0 <= index < session['total_chunks']:
+        raise HTTPException(status_code=400, detail="Chunk index out of range")
+
+    offset = index * session['chunk_size']
+    expected = min(session['chunk_size'], session['size'] - offset)
+
+    started = time.monotonic()
+    fd = os.open(session['file_path'], os.O_WRONLY)
+    try:
+        written, digest = await write_request_body(request, fd, offset, expected)
+    finally:
+        os.close(fd)
+    record_upload('upload-chunk', written, started)
+
+    if written != expected:
+        raise HTTPException(status_code=400, detail=f"Chunk {index} has {written} bytes, expected {expected}")
+
+    await db.upload_sessions.update_one(
+        {"id": upload_id},
+        {
+            '$addToSet': {'received': index},
+            '$set': {f'chunk_hashes.{index}': digest.hexdigest(), 'updated_at': datetime.utcnow()}
+        }
+    )
+
+    return {"upload_id": upload_id, "index": index, "size": written, "sha256": digest.hexdigest()}
+
+@api_router.post("/uploads/{upload_id}/complete")
+async def complete_upload_session(upload_id: str, background_tasks: BackgroundTasks):
+    """Finish a chunked upload: verify every chunk arrived, then register the video"""
+    session = await get_upload_session(upload_id)
+    if session['status'] == 'completed':
+        return upload_session_status(session)
+
+    status = upload_session_status(session)
+    if status['missing_chunks']:
+        raise HTTPException(status_code=409, detail={
+            "message": "Upload is incomplete",
+            "missing_chunks": status['missing_chunks']
+        })
+
+    # Chunks are hashed as they stream in; the upload hash combines them in order
+    combined = hashlib.sha256()
+    for index in range(session['total_chunks']):
+        combined.update(bytes.fromhex(session['chunk_hashes'][str(index)]))
+    content_hash = f"sha256-chunks-{session['chunk_size']}:{combined.hexdigest()}"
+
+    # Claim the transition so concurrent completes register the video only once
+    claimed = await db.upload_sessions.find_one_and_update(
+        {"id": upload_id, "status": "open"},
+        {'$set': {'status': 'completing', 'updated_at': datetime.utcnow()}}
+    )
+    if claimed is None:
+        raise HTTPException(status_code=409, detail="Upload session is already being completed")
+
+    try:
+        result = await register_uploaded_video(
+            upload_id,
+            session['filename'],
+            Path(session['file_path']),
+            session['size'],
+            background_tasks,
+            content_hash=content_hash
+        )
+    except Exception as e:
+        logger.error(f"Upload completion error: {e}")
+        # Let the client retry the completion
+        await db.upload_sessions.update_one(
+            {"id": upload_id, "status": "completing"}, {'$set': {'status': 'open'}}
+        )
+        raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+
+    await db.upload_sessions.update_one(
+        {"id": upload_id},
+        {'$set': {'status': 'completed', 'job_id': upload_id, 'content_hash': content_hash,
+                  'updated_at': datetime.utcnow()}}
+    )
+    return {**result, "content_hash": content_hash}
+
+@api_router.delete("/uploads/{upload_id}")
+async def abort_upload_session(upload_id: str):
+    """Abort a chunked upload and delete its partial file"""
+    session = await get_upload_session(upload_id)
+    if session['status'] == 'completed':
+        raise HTTPException(status_code=409, detail="Upload already completed; use /api/cleanup")
+    if session['status'] == 'completing':
+        raise HTTPException(status_code=409, detail="Upload session is being completed")
+    upload_path = Path(session['file_path'])
+    if upload_path.exists():
+        upload_path.unlink()
+    await db.upload_sessions.delete_one({"id": upload_id})
+    return {"message": "Upload aborted"}
+
 @api_router.post("/split-video/{job_id}")
 async def split_video(
     job_id: str, 
     config: SplitConfig,
-    background_tasks: BackgroundTasks
+    request: Request
 ):
-    """Start video splitting process"""
+    """Queue video splitting job"""
+    if config.profile and not profiling_authorized(request):
+        raise HTTPException(status_code=403, detail="Profiling not allowed")
+
     # Get job from database
     job = await db.video_jobs.find_one({"id": job_id})
     if not job:
@@ -608,10 +4394,147 @@ async def split_video(
     if job['status'] != 'uploaded':
         raise HTTPException(status_code=400, detail="Video not ready for processing")
     
-    # Start background processing
-    background_tasks.add_task(process_video_job, job_id, job['file_path'], config)
+    # Hand the job to the scheduler; a worker picks it up when a slot is free
+    if not await scheduler.enqueue(job_id, config, ['uploaded']):
+        raise HTTPException(status_code=409, detail="Video is already queued or processing")
+    job = await db.video_jobs.find_one({"id": job_id})
     
-    return {"message": "Video splitting started", "job_id": job_id}
+    return {
+        "message": "Video splitting queued",
+        "job_id": job_id,
+        "queue_position": await scheduler.queue_position(job)
+    }
+
+@api_router.post("/retry/{job_id}")
+async def retry_job(job_id: str, request: Request):
+    """Requeue a failed (or completed) split; segments with intact checkpoints are kept"""
+    job = await db.video_jobs.find_one({"id": job_id})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if not job.get('split_config'):
+        raise HTTPException(status_code=400, detail="Video has not been split yet")
+    if job['status'] not in ('failed', 'completed'):
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+
+    config = SplitConfig(**job['split_config'])
+    if config.profile and not profiling_authorized(request):
+        # Only whoever may profile gets the retry profiled as well
+        config = config.copy(update={'profile': False})
+
+    # A manual retry gets a fresh set of attempts
+    if not await scheduler.enqueue(job_id, config, ['failed', 'completed'], reset_attempts=True):
+        raise HTTPException(status_code=409, detail="Job is already queued or processing")
+    job = await db.video_jobs.find_one({"id": job_id})
+
+    return {
+        "message": "Video splitting requeued",
+        "job_id": job_id,
+        "checkpointed_segments": len(job.get('checkpoints') or {}),
+        "queue_position": await scheduler.queue_position(job)
+    }
+
+@api_router.post("/split-plan/{job_id}")
+async def split_plan(job_id: str, config: SplitConfig):
+    """Dry run: the segments a split would produce, with estimated sizes and times"""
+    job = await db.video_jobs.find_one({"id": job_id})
+    if not job or not job.get('file_path'):
+        raise HTTPException(status_code=404, detail="Video not found")
+    try:
+        await localize(job['file_path'])
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Video not found")
+
+    video_info = await get_video_info(job['file_path'])
+    try:
+        splits = await plan_splits(job['file_path'], video_info, config)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not splits:
+        raise HTTPException(status_code=400, detail="No valid splits generated")
+
+    estimate = await estimate_split_cost(job['file_path'], video_info, splits, config)
+    return {"job_id": job_id, "method": config.method, **estimate}
+
+@api_router.post("/encoder/calibrate")
+async def start_encoder_calibration(background_tasks: BackgroundTasks, duration: float = 5.0):
+    """Benchmark libx264 presets/threads on this host (runs in the background)"""
+    background_tasks.add_task(calibrate_encoder, duration)
+    return {"message": "Encoder calibration started", "host": os.uname().nodename}
+
+@api_router.get("/encoder/profile")
+async def get_encoder_profile_endpoint():
+    """Get this host's encoder throughput profile"""
+    profile = await get_encoder_profile()
+    if not profile:
+        raise HTTPException(status_code=404, detail="Encoder has not been calibrated on this host")
+    return profile
+
+@api_router.get("/keyframes/{job_id}")
+async def get_keyframes(
+    job_id: str,
+    start: float = 0.0,
+    end: Optional[float] = None,
+    max_points: Optional[int] = None
+):
+    """Get keyframe timestamps and byte positions from the upload's packet index"""
+    job = await db.video_jobs.find_one({"id": job_id})
+    if not job or not job.get('file_path'):
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    index = await load_packet_index(job['file_path'])
+    if index is None:
+        if job.get('packet_index') == 'building':
+            raise HTTPException(status_code=409, detail="Keyframe index is still being built")
+        raise HTTPException(status_code=404, detail="Keyframe index not available")
+
+    keyframes = index.keyframe_entries(start, end)
+    total = len(keyframes)
+
+    # Downsample evenly so the UI can request a bounded number of snap points
+    if max_points and 0 < max_points < total:
+        step = total / max_points
+        keyframes = [keyframes[int(i * step)] for i in range(max_points)]
+
+    return {
+        "job_id": job_id,
+        "start": start,
+        "end": end,
+        "total": total,
+        "downsampled": len(keyframes) < total,
+        "keyframes": keyframes
+    }
+
+PREVIEW_MEDIA_TYPES = {
+    '.jpg': 'image/jpeg',
+    '.vtt': 'text/vtt',
+    '.json': 'application/json'
+}
+
+def serve_located_file(request: Request, target: Dict, media_type: str, headers: Dict):
+    """FileResponse for this node's copy, a ranged stream for one in the store"""
+    if target['path']:
+        return FileResponse(target['path'], media_type=media_type, headers=headers)
+    return build_range_response(
+        request, None, target['size'], target['mtime'], media_type, headers, read_range=target['read_range']
+    )
+
+@api_router.get("/thumbnails/{job_id}/{filename}")
+async def get_thumbnails(job_id: str, filename: str, request: Request):
+    """Serve timeline sprite sheets and their thumbnails.vtt / thumbnails.json index"""
+    media_type = PREVIEW_MEDIA_TYPES.get(Path(filename).suffix)
+    if Path(filename).name != filename or not media_type:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    target = await locate_file(PREVIEW_DIR / job_id / filename)
+    if target is None:
+        job = await db.video_jobs.find_one({"id": job_id}, {'thumbnails': 1})
+        if job and job.get('thumbnails') == 'building':
+            raise HTTPException(status_code=409, detail="Thumbnails are still being generated")
+        raise HTTPException(status_code=404, detail="File not found")
+
+    # Sprite sets are written once per job and never change in place
+    storage_manager.touch(job_id)
+    return serve_located_file(request, target, media_type, {'Cache-Control': PREVIEW_CACHE_CONTROL, **STREAM_CORS_HEADERS})
 
 @api_router.get("/job-status/{job_id}")
 async def get_job_status(job_id: str):
@@ -625,67 +4548,186 @@ async def get_job_status(job_id: str):
         "filename": job['filename'],
         "status": job['status'],
         "progress": job['progress'],
+        "queue_position": await scheduler.queue_position(job),
+        "encode_speed": job.get('encode_speed'),
+        "segments_completed": job.get('segments_completed'),
+        "segments_checkpointed": len(job.get('checkpoints') or {}),
+        "thumbnails": job.get('thumbnails'),
+        "preview": job.get('preview'),
+        "storage_bytes": job.get('storage_bytes'),
         "splits": job.get('splits', []),
         "error_message": job.get('error_message'),
         "video_info": job.get('video_info')
     }
 
+async def job_event_stream(job_id: str):
+    """Yield the job's current state, then its events until it finishes"""
+    job = await db.video_jobs.find_one({"id": job_id}, {'video_info': 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    # Subscribe before sending the snapshot so no event falls in between
+    queue = job_events.subscribe(job_id)
+
+    async def events():
+        try:
+            snapshot = {'type': 'snapshot', **job_event_snapshot(job)}
+            yield snapshot
+            status = snapshot['status']
+            started = last_event = time.monotonic()
+            while status not in JOB_TERMINAL_STATUSES:
+                now = time.monotonic()
+                if now - started >= JOB_EVENT_MAX_DURATION:
+                    return
+                if now - last_event >= JOB_EVENT_IDLE_TIMEOUT:
+                    # Quiet for too long: the job may have ended where this
+                    # process could not see it (another node, a lost event)
+                    last_event = now
+                    current = await db.video_jobs.find_one({"id": job_id}, {'video_info': 0})
+                    if current is None:
+                        return
+                    if current.get('status') != status:
+                        status = current.get('status')
+                        yield {'type': 'snapshot', **job_event_snapshot(current)}
+                    continue
+                timeout = min(JOB_EVENT_HEARTBEAT, JOB_EVENT_IDLE_TIMEOUT - (now - last_event),
+                              JOB_EVENT_MAX_DURATION - (now - started))
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    yield None  # heartbeat
+                    continue
+                last_event = time.monotonic()
+                status = event.get('status', status)
+                yield event
+        finally:
+            job_events.unsubscribe(job_id, queue)
+
+    return events()
+
+@api_router.get("/job-events/{job_id}")
+async def job_events_sse(job_id: str):
+    """Push job status, progress and per-segment completion as Server-Sent Events"""
+    events = await job_event_stream(job_id)
+
+    async def sse():
+        async for event in events:
+            if event is None:
+                yield b': keep-alive\n\n'
+            else:
+                yield f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n".encode()
+
+    return StreamingResponse(
+        sse(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@api_router.websocket("/ws/job-events/{job_id}")
+async def job_events_ws(websocket: WebSocket, job_id: str):
+    """Push job events over a WebSocket (same payloads as the SSE endpoint)"""
+    await websocket.accept()
+    try:
+        events = await job_event_stream(job_id)
+    except HTTPException as e:
+        await websocket.close(code=4404, reason=e.detail)
+        return
+    try:
+        async for event in events:
+            if event is not None:
+                await websocket.send_text(json.dumps(event, default=str))
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+
 @api_router.get("/download/{job_id}/{filename}")
-async def download_split(job_id: str, filename: str):
-    """Download split video file"""
+async def download_split(job_id: str, filename: str, request: Request):
+    """Download split video file (supports Range resume)"""
+    if Path(filename).name != filename:
+        raise HTTPException(status_code=404, detail="File not found")
+
     job = await db.video_jobs.find_one({"id": job_id})
     if not job or job['status'] != 'completed':
         raise HTTPException(status_code=404, detail="Job not found or not completed")
     
-    file_path = OUTPUT_DIR / job_id / filename
-    if not file_path.exists():
+    target = await locate_file(OUTPUT_DIR / job_id / filename)
+    if target is None:
         raise HTTPException(status_code=404, detail="File not found")
-    
-    return FileResponse(
-        file_path,
-        media_type='application/octet-stream',
-        filename=filename
+
+    storage_manager.touch(job_id)
+    return build_range_response(
+        request,
+        target['path'],
+        target['size'],
+        target['mtime'],
+        'application/octet-stream',
+        {'Content-Disposition': f'attachment; filename="{filename}"'},
+        read_range=target['read_range'],
+        metric_route='download'
+    )
+
+@api_router.get("/download-all/{job_id}")
+async def download_all(job_id: str, request: Request):
+    """Download every output of a job as one uncompressed ZIP, streamed on the fly"""
+    job = await db.video_jobs.find_one({"id": job_id})
+    if not job or job['status'] != 'completed':
+        raise HTTPException(status_code=404, detail="Job not found or not completed")
+
+    output_dir = OUTPUT_DIR / job_id
+    entries = []
+    refreshed = False
+
+    async def current(described: Dict) -> Dict:
+        nonlocal refreshed
+        file_path = output_dir / described['file']
+        target = await locate_file(file_path)
+        if target is None:
+            raise HTTPException(status_code=404, detail=f"File not found: {described['file']}")
+        if target['path'] is None:
+            # Stored objects get their own mtime, so only the size can vouch for the CRC
+            if described.get('crc32') is not None and described.get('size') == target['size']:
+                entries.append({**described, 'read_range': target['read_range']})
+                return described
+            await localize(file_path)
+            target = await locate_file(file_path)
+        # Reuse the CRC recorded at completion unless the file changed since
+        if described.get('crc32') is None or described.get('size') != target['size'] or described.get('mtime') != target['mtime']:
+            described = await asyncio.to_thread(describe_output_file, str(file_path))
+            refreshed = True
+        entries.append({**described, 'read_range': functools.partial(iter_file_range, str(file_path))})
+        return described
+
+    splits = []
+    for split in job.get('splits', []):
+        video = await current({key: value for key, value in split.items() if key != 'subtitles'})
+        # Sidecar subtitles follow their segment in the archive
+        subtitles = [await current(sidecar) for sidecar in split.get('subtitles', [])]
+        splits.append({**video, 'subtitles': subtitles} if subtitles else video)
+
+    if refreshed:
+        await db.video_jobs.update_one({'id': job_id}, {'$set': {'splits': splits}})
+
+    storage_manager.touch(job_id)
+    parts, total_size = build_stored_zip(entries)
+    archive_name = f"{Path(job['filename']).stem}_splits.zip"
+    return build_range_response(
+        request,
+        None,
+        total_size,
+        max((entry['mtime'] for entry in entries), default=0.0),
+        'application/zip',
+        {'Content-Disposition': f'attachment; filename="{archive_name}"'},
+        read_range=zip_range_reader(parts),
+        metric_route='download-all'
     )
 
 @api_router.head("/video-stream/{job_id}")
-async def video_stream_head(job_id: str):
+async def video_stream_head(job_id: str, request: Request):
     """Handle HEAD requests for video streaming"""
-    job = await db.video_jobs.find_one({"id": job_id})
-    if not job or not job.get('file_path'):
-        raise HTTPException(status_code=404, detail="Video not found")
-    
-    file_path = Path(job['file_path'])
-    if not file_path.exists():
-        raise HTTPException(status_code=404, detail="Video file not found")
-    
-    # Determine media type based on file extension
-    file_ext = file_path.suffix.lower()
-    media_type_map = {
-        '.mp4': 'video/mp4',
-        '.mkv': 'video/x-matroska',
-        '.avi': 'video/x-msvideo',
-        '.mov': 'video/quicktime',
-        '.wmv': 'video/x-ms-wmv',
-        '.flv': 'video/x-flv',
-        '.webm': 'video/webm',
-        '.gif': 'image/gif'
-    }
-    media_type = media_type_map.get(file_ext, 'video/mp4')
-    
-    # Get file size
-    file_size = file_path.stat().st_size
-    
-    return JSONResponse(
-        content={},
-        headers={
-            'Accept-Ranges': 'bytes',
-            'Content-Length': str(file_size),
-            'Content-Type': media_type,
-            'Cache-Control': 'no-cache',
-            'Access-Control-Allow-Origin': '*',
-            'Access-Control-Allow-Methods': 'GET, HEAD, OPTIONS',
-            'Access-Control-Allow-Headers': 'Range'
-        }
+    target = await get_stream_target(job_id)
+    return build_range_response(
+        request, target['path'], target['size'], target['mtime'], target['media_type'],
+        STREAM_CORS_HEADERS, head=True, read_range=target['read_range']
     )
 
 @api_router.options("/video-stream/{job_id}")
@@ -696,7 +4738,7 @@ async def video_stream_options(job_id: str):
         headers={
             'Access-Control-Allow-Origin': '*',
             'Access-Control-Allow-Methods': 'GET, HEAD, OPTIONS',
-            'Access-Control-Allow-Headers': 'Range, Content-Type',
+            'Access-Control-Allow-Headers': 'Range, Content-Type, If-Range, If-None-Match, If-Modified-Since',
             'Access-Control-Max-Age': '3600'
         }
     )
@@ -704,79 +4746,59 @@ async def video_stream_options(job_id: str):
 @api_router.get("/video-stream/{job_id}")
 async def stream_video(job_id: str, request: Request):
     """Stream video file for preview with proper headers"""
+    target = await get_stream_target(job_id)
+    storage_manager.touch(job_id)
+    return build_range_response(
+        request, target['path'], target['size'], target['mtime'], target['media_type'],
+        STREAM_CORS_HEADERS, read_range=target['read_range'], metric_route='video-stream'
+    )
+
+@api_router.post("/video-preview/{job_id}")
+async def create_video_preview(job_id: str):
+    """Start building the low-bitrate HLS preview for an upload (no-op if it exists)"""
     job = await db.video_jobs.find_one({"id": job_id})
-    
-    if not job or not job.get('file_path'):
+    if not job or not job.get('file_path') or not await is_stored(job['file_path']):
         raise HTTPException(status_code=404, detail="Video not found")
-    
-    file_path = Path(job['file_path'])
-    
-    if not file_path.exists():
-        raise HTTPException(status_code=404, detail="Video file not found")
-    
-    # Determine media type based on file extension
-    file_ext = file_path.suffix.lower()
-    media_type_map = {
-        '.mp4': 'video/mp4',
-        '.mkv': 'video/x-matroska',
-        '.avi': 'video/x-msvideo',
-        '.mov': 'video/quicktime',
-        '.wmv': 'video/x-ms-wmv',
-        '.flv': 'video/x-flv',
-        '.webm': 'video/webm',
-        '.gif': 'image/gif'
-    }
-    media_type = media_type_map.get(file_ext, 'video/mp4')
-    
-    # Get file size
-    file_size = file_path.stat().st_size
-    
-    # Handle range requests for video streaming
-    range_header = request.headers.get('range')
-    if range_header:
-        # Parse range header
-        range_match = re.match(r'bytes=(\d+)-(\d*)', range_header)
-        if range_match:
-            start = int(range_match.group(1))
-            end = int(range_match.group(2)) if range_match.group(2) else file_size - 1
-            
-            # Read the requested range
-            with open(file_path, 'rb') as f:
-                f.seek(start)
-                data = f.read(end - start + 1)
-            
-            return StreamingResponse(
-                BytesIO(data),
-                status_code=206,
-                headers={
-                    'Accept-Ranges': 'bytes',
-                    'Content-Range': f'bytes {start}-{end}/{file_size}',
-                    'Content-Length': str(end - start + 1),
-                    'Content-Type': media_type,
-                    'Cache-Control': 'no-cache',
-                    'Access-Control-Allow-Origin': '*',
-                    'Access-Control-Allow-Methods': 'GET, HEAD, OPTIONS',
-                    'Access-Control-Allow-Headers': 'Range'
-                },
-                media_type=media_type
-            )
-    
-    # Return full file for non-range requests
-    return FileResponse(
-        file_path,
-        media_type=media_type,
-        filename=job['filename'],
-        headers={
-            'Accept-Ranges': 'bytes',
-            'Content-Length': str(file_size),
-            'Cache-Control': 'no-cache, no-store, must-revalidate',
-            'Pragma': 'no-cache',
-            'Expires': '0',
-            'Access-Control-Allow-Origin': '*',
-            'Access-Control-Allow-Methods': 'GET, HEAD, OPTIONS',
-            'Access-Control-Allow-Headers': 'Range, Content-Type',
-            'Access-Control-Expose-Headers': 'Content-Length, Content-Range, Accept-Ranges'
-        }
+
+    preview = job.get('preview')
+    if preview in (None, 'failed'):
+        await start_preview_proxy(job_id, job['file_path'])
+        preview = 'queued'
+
+    return {"preview": preview, "playlist_url": f"/api/video-preview/{job_id}/index.m3u8"}
+
+@api_router.get("/video-preview/{job_id}/{filename}")
+async def get_video_preview(job_id: str, filename: str, request: Request):
+    """Serve the preview HLS playlist and its segments (playable while still encoding)"""
+    if Path(filename).name != filename or Path(filename).suffix not in ('.m3u8', '.ts'):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    # While encoding, only the building node has the files; once ready, every node can serve them
+    target = await locate_file(PROXY_DIR / job_id / filename)
+    if filename.endswith('.m3u8'):
+        if target is None:
+            job = await db.video_jobs.find_one({"id": job_id}, {'preview': 1})
+            if job and job.get('preview') in ('queued', 'building'):
+                # First segment not written yet; HLS players retry the manifest
+                raise HTTPException(
+                    status_code=503,
+                    detail="Preview is being generated",
+                    headers={'Retry-After': str(PREVIEW_SEGMENT_SECONDS)}
+                )
+            raise HTTPException(status_code=404, detail="Preview not available")
+
+        # The playlist grows while the proxy encodes, so it must be revalidated
+        storage_manager.touch(job_id)
+        return serve_located_file(
+            request, target, 'application/vnd.apple.mpegurl', {'Cache-Control': 'no-cache', **STREAM_CORS_HEADERS}
+        )
+
+    if target is None:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    # Segments are only listed once complete and never rewritten
+    return serve_located_file(
+        request, target, 'video/mp2t', {'Cache-Control': PREVIEW_CACHE_CONTROL, **STREAM_CORS_HEADERS}
     )
 
 @api_router.get("/download-source")
@@ -812,24 +4834,52 @@ async def download_source():
         filename='VideoSplitter.zip'
     )
 
+async def get_profile_record(profile_id: str, request: Request, fields: Optional[Dict] = None) -> Dict:
+    require_profiling(request)
+    profile = await db.profiles.find_one({'id': profile_id}, {'_id': 0, **(fields or {})})
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile
+
+@api_router.get("/job-profiles/{job_id}")
+async def list_job_profiles(job_id: str, request: Request):
+    """Profiles recorded for a job or for requests made against it"""
+    require_profiling(request)
+    job = await db.video_jobs.find_one({"id": job_id}, {'profiles': 1})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"job_id": job_id, "profiles": job.get('profiles', [])}
+
+@api_router.get("/profiles/{profile_id}")
+async def get_profile(profile_id: str, request: Request):
+    """Profile summary with its top allocation sites"""
+    return await get_profile_record(profile_id, request, {'folded': 0})
+
+@api_router.get("/profiles/{profile_id}/flamegraph")
+async def download_profile_flamegraph(profile_id: str, request: Request):
+    """CPU samples as folded stacks (flamegraph.pl, speedscope, inferno)"""
+    profile = await get_profile_record(profile_id, request, {'folded': 1, 'id': 1})
+    return Response(
+        profile['folded'],
+        media_type='text/plain; charset=utf-8',
+        headers={'Content-Disposition': f'attachment; filename="profile-{profile_id}.folded"'}
+    )
+
+@api_router.get("/storage")
+async def get_storage_stats():
+    """Disk usage of TEMP_BASE, reservations, watermarks and bytes held per job status"""
+    return await storage_manager.stats()
+
 @api_router.delete("/cleanup/{job_id}")
 async def cleanup_job(job_id: str):
     """Clean up job files"""
     try:
-        # Remove upload file
         job = await db.video_jobs.find_one({"id": job_id})
-        if job and job.get('file_path'):
-            upload_path = Path(job['file_path'])
-            if upload_path.exists():
-                upload_path.unlink()
-        
-        # Remove output directory
-        output_dir = OUTPUT_DIR / job_id
-        if output_dir.exists():
-            shutil.rmtree(output_dir)
+        await remove_job_files(job_id, job)
         
         # Remove job from database
         await db.video_jobs.delete_one({"id": job_id})
+        await db.upload_sessions.delete_one({"id": job_id})
         
         return {"message": "Job cleaned up successfully"}
     
@@ -837,6 +4887,21 @@ async def cleanup_job(job_id: str):
         logger.error(f"Cleanup error: {e}")
         raise HTTPException(status_code=500, detail=f"Cleanup failed: {str(e)}")
 
+@api_router.get("/metrics")
+async def metrics():
+    """Prometheus metrics (text exposition format)"""
+    QUEUE_DEPTH.set(await db.video_jobs.count_documents({'status': 'queued'}))
+    ACTIVE_JOBS.set(len(scheduler.active))
+    for name, path in (
+        ('uploads', UPLOAD_DIR), ('processing', PROCESS_DIR), ('outputs', OUTPUT_DIR),
+        ('previews', PREVIEW_DIR), ('proxies', PROXY_DIR)
+    ):
+        STORAGE_BYTES.set(await asyncio.to_thread(directory_size, path), directory=name)
+    disk = shutil.disk_usage(TEMP_BASE)
+    VOLUME_BYTES.set(disk.used, state='used')
+    VOLUME_BYTES.set(disk.free, state='free')
+    return Response(render_metrics(), media_type='text/plain; version=0.0.4; charset=utf-8')
+
 # Add CORS middleware before including routes
 app.add_middleware(
     CORSMiddleware,
@@ -856,6 +4921,47 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def ensure_indexes():
+    await db.probe_cache.create_index('path', unique=True)
+    await db.probe_cache.create_index('content_hash', sparse=True)
+    await db.upload_sessions.create_index('id', unique=True)
+    await db.encoder_profiles.create_index('host', unique=True)
+    await db.throughput_history.create_index([('host', 1), ('mode', 1), ('created_at', -1)])
+    await db.throughput_history.create_index('created_at', expireAfterSeconds=30 * 86400)
+    await db.profiles.create_index('id', unique=True)
+    await db.video_jobs.create_index([('status', 1), ('priority', -1), ('queued_at', 1)])
+    await db.video_jobs.create_index([('status', 1), ('lease_expires_at', 1)])
+    await db.video_jobs.create_index('updated_at')
+    await db.video_jobs.create_index([('status', 1), ('last_accessed_at', 1)])
+    # Expired job records are removed by Mongo once their files are long gone
+    await db.video_jobs.create_index('expired_at', expireAfterSeconds=int(JOB_RECORD_TTL_DAYS * 86400))
+    try:
+        await db.video_jobs.create_index('id', unique=True)
+    except Exception as e:
+        # Duplicate ids from older deployments must be cleaned up by hand
+        logger.error(f"Could not create unique index on video_jobs.id: {e}")
+        await db.video_jobs.create_index('id')
+
+@app.on_event("startup")
+async def start_scheduler():
+    progress_writer.start()
+    storage_manager.start()
+    await scheduler.start()
+
+@app.on_event("startup")
+async def start_job_change_relay():
+    if JOB_EVENTS_SOURCE == 'changestream':
+        app.state.job_change_relay = asyncio.create_task(relay_job_changes())
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await scheduler.stop()
+    await progress_writer.stop()
+    await storage_manager.stop()
+    relay = getattr(app.state, 'job_change_relay', None)
+    if relay:
+        relay.cancel()
+    for task in list(preview_proxy_tasks.values()):
+        task.cancel()
     client.close()
\ No newline at end of file
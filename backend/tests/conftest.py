@@ -0,0 +1,100 @@
+import asyncio
+import os
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+import httpx
+import pytest
+
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'video_splitter_test')
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import server  # noqa: E402
+
+requires_ffmpeg = pytest.mark.skipif(
+    not (shutil.which('ffmpeg') and shutil.which('ffprobe')), reason="ffmpeg is not installed"
+)
+
+
+@pytest.fixture
+def db(monkeypatch):
+    """server.db backed by mongomock instead of a live MongoDB"""
+    mongomock_motor = pytest.importorskip('mongomock_motor')
+    import mongomock.collection
+
+    # pymongo's UpdateOne passes sort=, which mongomock's bulk builder does not know
+    add_update = mongomock.collection.BulkOperationBuilder.add_update
+
+    def add_update_without_sort(self, *args, sort=None, **kwargs):
+        return add_update(self, *args, **kwargs)
+
+    monkeypatch.setattr(mongomock.collection.BulkOperationBuilder, 'add_update', add_update_without_sort)
+    database = mongomock_motor.AsyncMongoMockClient()['video_splitter_test']
+    monkeypatch.setattr(server, 'db', database)
+    return database
+
+
+@pytest.fixture
+def temp_base(tmp_path, monkeypatch):
+    """Point TEMP_BASE and its subdirectories (and the local object store) at tmp_path"""
+    base = tmp_path / 'video_splitter'
+    for name, sub in [('UPLOAD_DIR', 'uploads'), ('PROCESS_DIR', 'processing'), ('OUTPUT_DIR', 'outputs'),
+                      ('PREVIEW_DIR', 'previews'), ('PROXY_DIR', 'proxies')]:
+        (base / sub).mkdir(parents=True)
+        monkeypatch.setattr(server, name, base / sub)
+    monkeypatch.setattr(server, 'TEMP_BASE', base)
+    monkeypatch.setattr(server, 'object_store', server.LocalObjectStore(base))
+    return base
+
+
+@pytest.fixture
+def shared_store(temp_base, tmp_path, monkeypatch):
+    """A local object store outside TEMP_BASE, as another node would see it"""
+    store = server.LocalObjectStore(tmp_path / 'store')
+    monkeypatch.setattr(server, 'object_store', store)
+    return store
+
+
+def make_video(path: Path, duration: float = 10, gop: int = 25, extra_args=(), audio_duration=None):
+    """H.264/AAC test clip at 25 fps with a keyframe every `gop` frames"""
+    subprocess.run(
+        ['ffmpeg', '-v', 'error', '-y',
+         '-f', 'lavfi', '-i', f'testsrc2=s=320x240:r=25:d={duration}',
+         '-f', 'lavfi', '-i', f'sine=frequency=440:d={audio_duration or duration}',
+         '-c:v', 'libx264', '-preset', 'ultrafast', '-g', str(gop), '-keyint_min', str(gop),
+         '-pix_fmt', 'yuv420p', *extra_args, '-c:a', 'aac', *([] if audio_duration else ['-shortest']), str(path)],
+        check=True,
+    )
+    return path
+
+
+@pytest.fixture(scope='session')
+def sample_video(tmp_path_factory):
+    if not (shutil.which('ffmpeg') and shutil.which('ffprobe')):
+        pytest.skip("ffmpeg is not installed")
+    return make_video(tmp_path_factory.mktemp('media') / 'sample.mp4')
+
+
+def api_client() -> httpx.AsyncClient:
+    """Client that talks to the app in-process (startup hooks do not run)"""
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url='http://testserver')
+
+
+def api_request(method: str, url: str, **kwargs) -> httpx.Response:
+    async def send():
+        async with api_client() as client:
+            return await client.request(method, url, **kwargs)
+    return asyncio.run(send())
+
+
+@pytest.fixture
+def no_upload_indexing(monkeypatch):
+    """Skip the packet index, thumbnails and preview proxy queued for new uploads"""
+    async def skip(job_id, file_path):
+        pass
+
+    for name in ('index_uploaded_video', 'prepare_thumbnails', 'start_preview_proxy'):
+        monkeypatch.setattr(server, name, skip)
@@ -0,0 +1,90 @@
+import asyncio
+import shutil
+
+import server
+from conftest import requires_ffmpeg
+
+VIDEO_INFO = {'size': 1000, 'duration': 10.0}
+SPLIT = {'start': 0.0, 'end': 5.0}
+
+
+def test_segment_spec_tracks_what_shapes_the_output():
+    config = server.SplitConfig(method='intervals', interval_duration=5)
+    spec = server.segment_spec(SPLIT, config, VIDEO_INFO)
+
+    assert spec == server.segment_spec(dict(SPLIT), config.copy(update={'priority': 5, 'profile': True}), VIDEO_INFO)
+    assert spec != server.segment_spec({'start': 0.0, 'end': 5.5}, config, VIDEO_INFO)
+    assert spec != server.segment_spec(SPLIT, config.copy(update={'output_format': 'mkv'}), VIDEO_INFO)
+    assert spec != server.segment_spec(SPLIT, config, {'size': 1001, 'duration': 10.0})
+
+
+def write_segment(temp_base, name='clip_part_001', data=b'segment data'):
+    output_dir = temp_base / 'outputs' / 'job'
+    output_dir.mkdir(exist_ok=True)
+    (output_dir / f'{name}.mp4').write_bytes(data)
+    return output_dir / f'{name}.mp4'
+
+
+def test_checkpoint_records_segment_and_sidecars(db, temp_base):
+    asyncio.run(db.video_jobs.insert_one({'id': 'job'}))
+    output = write_segment(temp_base)
+    (output.parent / 'clip_part_001.eng.srt').write_text('1\n00:00:00,000 --> 00:00:01,000\nhi\n')
+    write_segment(temp_base, 'clip_part_0011')
+
+    checkpoint = asyncio.run(server.save_checkpoint('job', 0, SPLIT, 'spec', str(output)))
+
+    assert (checkpoint['path'], checkpoint['size'], checkpoint['spec']) == ('outputs/job/clip_part_001.mp4', 12, 'spec')
+    assert [sidecar['file'] for sidecar in checkpoint['subtitles']] == ['clip_part_001.eng.srt']
+    stored = asyncio.run(db.video_jobs.find_one({'id': 'job'}))['checkpoints']
+    assert stored['0']['crc32'] == checkpoint['crc32']
+    assert server.checkpoint_output(checkpoint) == {
+        'file': 'clip_part_001.mp4', 'size': 12, 'mtime': checkpoint['mtime'], 'crc32': checkpoint['crc32'],
+        'subtitles': [{field: checkpoint['subtitles'][0][field] for field in ('file', 'size', 'mtime', 'crc32')}]
+    }
+
+
+def test_only_intact_matching_checkpoints_are_reused(db, temp_base):
+    asyncio.run(db.video_jobs.insert_one({'id': 'job'}))
+    checkpoints = {}
+    for i in range(4):
+        output = write_segment(temp_base, f'clip_part_00{i + 1}')
+        checkpoints[str(i)] = asyncio.run(server.save_checkpoint('job', i, SPLIT, f'spec{i}', str(output)))
+
+    # Same size, different bytes
+    write_segment(temp_base, 'clip_part_002', b'segment DATA')
+    (temp_base / 'outputs' / 'job' / 'clip_part_003.mp4').unlink()
+
+    valid = asyncio.run(server.verified_checkpoints(checkpoints, ['spec0', 'spec1', 'spec2']))
+    assert list(valid) == [0]
+    assert not asyncio.run(server.verify_checkpoint(checkpoints['0'], 'other spec'))
+
+
+@requires_ffmpeg
+def test_retry_reruns_only_broken_segments(sample_video, db, temp_base, monkeypatch):
+    upload = temp_base / 'uploads' / 'job_sample.mp4'
+    shutil.copy(sample_video, upload)
+    asyncio.run(db.video_jobs.insert_one({'id': 'job', 'filename': 'sample.mp4', 'file_path': str(upload),
+                                          'status': 'processing'}))
+    config = server.SplitConfig(method='intervals', interval_duration=4)
+    encoded = []
+    run_ffmpeg_async = server.run_ffmpeg_async
+
+    async def recording_run(stream, on_progress=None):
+        encoded.append(next(arg for arg in stream.compile() if arg.endswith('.mp4') and '_part_' in arg))
+        await run_ffmpeg_async(stream, on_progress)
+
+    monkeypatch.setattr(server, 'run_ffmpeg_async', recording_run)
+
+    asyncio.run(server.process_video_job('job', str(upload), config))
+    first = asyncio.run(db.video_jobs.find_one({'id': 'job'}))
+    assert first['status'] == 'completed' and len(encoded) == 3
+
+    encoded.clear()
+    broken = temp_base / 'outputs' / 'job' / 'job_sample_part_002.mp4'
+    broken.write_bytes(b'\0' * broken.stat().st_size)
+    asyncio.run(server.process_video_job('job', str(upload), config))
+
+    second = asyncio.run(db.video_jobs.find_one({'id': 'job'}))
+    assert second['status'] == 'completed'
+    assert [path.rsplit('/', 1)[-1] for path in encoded] == ['job_sample_part_002.mp4']
+    assert [split['crc32'] for split in second['splits']] == [split['crc32'] for split in first['splits']]
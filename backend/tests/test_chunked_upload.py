@@ -0,0 +1,114 @@
+import asyncio
+import hashlib
+
+import pytest
+
+import server
+from conftest import api_client, api_request, requires_ffmpeg
+
+CHUNK_SIZE = 64 * 1024
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(server, 'MIN_UPLOAD_CHUNK_SIZE', 1024)
+
+
+def create_session(size: int, filename: str = 'movie.mp4') -> dict:
+    response = api_request('POST', '/api/uploads', json={'filename': filename, 'size': size, 'chunk_size': CHUNK_SIZE})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+@requires_ffmpeg
+def test_chunks_uploaded_out_of_order_assemble_the_file(
+        sample_video, db, temp_base, small_chunks, no_upload_indexing):
+    data = sample_video.read_bytes()
+    session = create_session(len(data))
+    upload_id = session['upload_id']
+    chunks = [data[i:i + CHUNK_SIZE] for i in range(0, len(data), CHUNK_SIZE)]
+    assert session['total_chunks'] == len(chunks) > 2
+
+    async def upload_all():
+        async with api_client() as client:
+            responses = await asyncio.gather(*(
+                client.put(f'/api/uploads/{upload_id}/chunks/{index}', content=chunks[index])
+                for index in reversed(range(len(chunks)))
+            ))
+            return [response.json() for response in responses]
+
+    results = asyncio.run(upload_all())
+    assert sorted(result['index'] for result in results) == list(range(len(chunks)))
+    assert all(result['sha256'] == hashlib.sha256(chunks[result['index']]).hexdigest() for result in results)
+    assert api_request('GET', f'/api/uploads/{upload_id}').json()['missing_chunks'] == 0
+
+    response = api_request('POST', f'/api/uploads/{upload_id}/complete')
+
+    assert response.status_code == 200, response.text
+    combined = hashlib.sha256(b''.join(hashlib.sha256(chunk).digest() for chunk in chunks)).hexdigest()
+    assert response.json()['content_hash'] == f'sha256-chunks-{CHUNK_SIZE}:{combined}'
+    job = asyncio.run(db.video_jobs.find_one({'id': upload_id}))
+    assert job['status'] == 'uploaded'
+    with open(job['file_path'], 'rb') as f:
+        assert f.read() == data
+    # Completing twice is harmless
+    assert api_request('POST', f'/api/uploads/{upload_id}/complete').json()['status'] == 'completed'
+
+
+def test_incomplete_upload_cannot_be_completed(db, temp_base, small_chunks):
+    session = create_session(3 * CHUNK_SIZE)
+    upload_id = session['upload_id']
+    api_request('PUT', f'/api/uploads/{upload_id}/chunks/1', content=b'x' * CHUNK_SIZE)
+
+    response = api_request('POST', f'/api/uploads/{upload_id}/complete')
+
+    assert response.status_code == 409
+    assert response.json()['detail']['missing_chunks'] == 2
+    assert api_request('GET', f'/api/uploads/{upload_id}').json()['received_chunks'] == [1]
+
+
+def test_chunks_must_have_the_expected_size(db, temp_base, small_chunks):
+    upload_id = create_session(CHUNK_SIZE + 10)['upload_id']
+
+    assert api_request('PUT', f'/api/uploads/{upload_id}/chunks/1', content=b'x' * 9).status_code == 400
+    assert api_request('PUT', f'/api/uploads/{upload_id}/chunks/1', content=b'x' * 11).status_code == 400
+    assert api_request('PUT', f'/api/uploads/{upload_id}/chunks/2', content=b'x').status_code == 400
+    assert api_request('PUT', f'/api/uploads/{upload_id}/chunks/1', content=b'x' * 10).status_code == 200
+
+
+def test_session_validation_and_abort(db, temp_base, small_chunks):
+    assert api_request('POST', '/api/uploads', json={'filename': 'notes.txt', 'size': 10}).status_code == 400
+    assert api_request('POST', '/api/uploads', json={
+        'filename': 'movie.mp4', 'size': 10, 'chunk_size': 10
+    }).status_code == 400
+
+    session = create_session(CHUNK_SIZE)
+    upload_path = next((temp_base / 'uploads').iterdir())
+    assert upload_path.stat().st_size == CHUNK_SIZE
+
+    assert api_request('DELETE', f"/api/uploads/{session['upload_id']}").status_code == 200
+    assert not upload_path.exists()
+    assert api_request('GET', f"/api/uploads/{session['upload_id']}").status_code == 404
+
+
+def test_concurrent_completes_register_the_video_once(db, temp_base, small_chunks, monkeypatch):
+    upload_id = create_session(CHUNK_SIZE)['upload_id']
+    api_request('PUT', f'/api/uploads/{upload_id}/chunks/0', content=b'x' * CHUNK_SIZE)
+    registered = []
+
+    async def fake_register_uploaded_video(job_id, filename, file_path, size, background_tasks, content_hash=None):
+        registered.append(job_id)
+        await asyncio.sleep(0.05)
+        return {'job_id': job_id}
+
+    monkeypatch.setattr(server, 'register_uploaded_video', fake_register_uploaded_video)
+
+    async def complete_twice():
+        async with api_client() as client:
+            return await asyncio.gather(*(client.post(f'/api/uploads/{upload_id}/complete') for _ in range(2)))
+
+    responses = asyncio.run(complete_twice())
+
+    assert sorted(response.status_code for response in responses) == [200, 409]
+    assert registered == [upload_id]
+    assert api_request('GET', f'/api/uploads/{upload_id}').json()['status'] == 'completed'
@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+
+import server
+from conftest import api_request, requires_ffmpeg
+
+PROFILE = {
+    'host': 'test', 'cores': 8, 'width': 1280, 'height': 720,
+    'results': [
+        {'preset': preset, 'threads': threads, 'fps': fps * threads}
+        for preset, fps in [('ultrafast', 400), ('veryfast', 100), ('medium', 40), ('slow', 10)]
+        for threads in (1, 4, 8)
+    ],
+}
+
+
+def video_info(width, height, fps):
+    return {'video_streams': [{'width': width, 'height': height, 'fps': fps}]}
+
+
+@pytest.fixture
+def eight_cores(monkeypatch):
+    monkeypatch.setattr(server.os, 'cpu_count', lambda: 8)
+
+
+def test_speed_tiers_map_to_presets(eight_cores):
+    for tier, preset in [(None, 'medium'), ('fastest', 'veryfast'), ('balanced', 'medium'), ('archival', 'slow')]:
+        config = server.SplitConfig(method='time_based', speed_tier=tier, preserve_quality=False)
+        assert server.resolve_encoder_settings(config) == {'preset': preset, 'crf': '23', 'threads': 8}
+
+
+def test_parallel_segments_split_the_cores(eight_cores):
+    config = server.SplitConfig(method='time_based', preserve_quality=False)
+
+    assert server.resolve_encoder_settings(config, parallel=3)['threads'] == 2
+    assert server.resolve_encoder_settings(config, parallel=16)['threads'] == 1
+    args = server.build_segment_output_args(config, server.resolve_encoder_settings(config, parallel=4))
+    assert args['threads'] == 2
+
+
+def test_target_realtime_factor_picks_slowest_preset_that_keeps_up(eight_cores):
+    config = server.SplitConfig(method='time_based', target_realtime_factor=2.0)
+
+    # 720p30 at 2x needs 60 calibration fps; two segments in parallel get 4 threads each
+    settings = server.resolve_encoder_settings(config, video_info(1280, 720, 30), parallel=2, profile=PROFILE)
+    assert settings == {'preset': 'medium', 'crf': '18', 'threads': 4}
+
+    # 1440p has 4x the pixels, so only veryfast keeps up
+    settings = server.resolve_encoder_settings(config, video_info(2560, 1440, 30), parallel=2, profile=PROFILE)
+    assert settings['preset'] == 'veryfast'
+
+
+def test_unreachable_target_falls_back_to_fastest_preset(eight_cores):
+    config = server.SplitConfig(method='time_based', target_realtime_factor=100.0)
+
+    settings = server.resolve_encoder_settings(config, video_info(3840, 2160, 60), parallel=8, profile=PROFILE)
+
+    assert settings == {'preset': 'ultrafast', 'crf': '18', 'threads': 1}
+
+
+def test_target_without_profile_keeps_the_tier():
+    config = server.SplitConfig(method='time_based', speed_tier='archival', target_realtime_factor=2.0)
+    assert server.resolve_encoder_settings(config, video_info(1280, 720, 30), profile=None)['preset'] == 'slow'
+
+
+def test_segment_output_args_carry_encoder_settings():
+    config = server.SplitConfig(method='time_based', preserve_quality=False, force_keyframes=True, keyframe_interval=2.0)
+
+    args = server.build_segment_output_args(config, {'preset': 'fast', 'crf': '23', 'threads': 2}, fps=25)
+
+    assert args == {'c:v': 'libx264', 'c:a': 'aac', 'g': 50, 'keyint_min': 50, 'sc_threshold': '0',
+                    'crf': '23', 'preset': 'fast', 'threads': 2}
+
+
+def test_segment_parallelism():
+    assert server.segment_parallelism(server.SplitConfig(method='time_based', max_parallel_segments=3), 10) == 3
+    assert server.segment_parallelism(server.SplitConfig(method='time_based', max_parallel_segments=3), 2) == 2
+    assert server.segment_parallelism(server.SplitConfig(method='time_based', engine='segment_muxer'), 10) == 1
+
+
+@requires_ffmpeg
+def test_calibration_stores_profile(db, monkeypatch):
+    monkeypatch.setattr(server, 'CALIBRATION_PRESETS', ['ultrafast', 'veryfast'])
+    monkeypatch.setattr(server, 'CALIBRATION_SIZE', (160, 120))
+    monkeypatch.setattr(server, 'encoder_profile', None)
+
+    profile = asyncio.run(server.calibrate_encoder(duration=0.2, thread_counts=[1]))
+
+    assert [(row['preset'], row['threads']) for row in profile['results']] == [('ultrafast', 1), ('veryfast', 1)]
+    assert all(row['fps'] > 0 for row in profile['results'])
+    monkeypatch.setattr(server, 'encoder_profile', None)
+    assert api_request('GET', '/api/encoder/profile').json()['results'] == profile['results']
+
+
+def test_encoder_profile_404_before_calibration(db, monkeypatch):
+    monkeypatch.setattr(server, 'encoder_profile', None)
+    assert api_request('GET', '/api/encoder/profile').status_code == 404
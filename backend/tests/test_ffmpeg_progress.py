@@ -0,0 +1,66 @@
+import asyncio
+
+import ffmpeg
+import pytest
+
+import server
+from conftest import requires_ffmpeg
+
+
+def test_parse_ffmpeg_progress_converts_units():
+    progress = server.parse_ffmpeg_progress({
+        'out_time_us': '2500000', 'fps': '48.5', 'speed': '1.94x', 'progress': 'continue'
+    })
+    assert progress == {'out_time': 2.5, 'fps': 48.5, 'speed': 1.94, 'finished': False}
+
+
+def test_parse_ffmpeg_progress_tolerates_missing_values():
+    progress = server.parse_ffmpeg_progress({'out_time_us': 'N/A', 'speed': 'N/A', 'progress': 'end'})
+    assert progress == {'out_time': None, 'fps': None, 'speed': None, 'finished': True}
+
+
+@requires_ffmpeg
+def test_run_ffmpeg_async_reports_progress(tmp_path):
+    updates = []
+
+    async def on_progress(progress):
+        updates.append(progress)
+
+    stream = ffmpeg.input('testsrc2=s=160x120:r=25:d=2', f='lavfi').output(
+        str(tmp_path / 'out.mp4'), vcodec='libx264', preset='ultrafast'
+    ).overwrite_output()
+    asyncio.run(server.run_ffmpeg_async(stream, on_progress))
+
+    assert (tmp_path / 'out.mp4').stat().st_size > 0
+    assert updates[-1]['finished']
+    assert updates[-1]['out_time'] == pytest.approx(2.0, abs=0.1)
+
+
+@requires_ffmpeg
+def test_run_ffmpeg_async_raises_with_stderr(tmp_path):
+    stream = ffmpeg.input(str(tmp_path / 'missing.mp4')).output(str(tmp_path / 'out.mp4'))
+    with pytest.raises(ffmpeg.Error) as excinfo:
+        asyncio.run(server.run_ffmpeg_async(stream))
+    assert b'missing.mp4' in excinfo.value.stderr
+
+
+def test_progress_tracker_weights_segments_by_duration(monkeypatch):
+    writes = []
+
+    async def fake_update_job_progress(job_id, progress, extra=None, **kwargs):
+        writes.append((progress, extra))
+
+    monkeypatch.setattr(server, 'update_job_progress', fake_update_job_progress)
+    tracker = server.JobProgressTracker('job', [10.0, 30.0], min_interval=0)
+
+    async def run():
+        await tracker.update_segment(1, {'out_time': 15.0, 'speed': 2.0})
+        await tracker.complete_segment(0)
+        # A late tick for a finished range never moves progress backwards
+        await tracker.update_segment(1, {'out_time': 3.0, 'speed': None})
+
+    asyncio.run(run())
+
+    assert writes[0] == (37.5, {'segments_completed': 0, 'encode_speed': 2.0})
+    assert writes[1][0] == 62.5
+    assert writes[2][0] == 62.5
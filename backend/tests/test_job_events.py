@@ -0,0 +1,74 @@
+import asyncio
+import json
+
+import pytest
+
+import server
+from conftest import api_request
+
+
+@pytest.fixture
+def job(db, monkeypatch):
+    monkeypatch.setattr(server, 'JOB_EVENTS_SOURCE', 'local')
+    monkeypatch.setattr(server, 'JOB_EVENT_HEARTBEAT', 0.02)
+    asyncio.run(db.video_jobs.insert_one({'id': 'job', 'status': 'processing', 'progress': 10.0}))
+    return 'job'
+
+
+def collect(job_id, during=None):
+    """Run a job's event stream to its end, calling `during()` once it is subscribed"""
+    async def run():
+        events = await server.job_event_stream(job_id)
+        received = [await events.__anext__()]
+        if during:
+            await during()
+        async for event in events:
+            received.append(event)
+        return received
+
+    return asyncio.run(asyncio.wait_for(run(), 5))
+
+
+def test_stream_ends_on_terminal_events(job):
+    async def finish():
+        server.publish_job_event(job, 'progress', {'progress': 50.0})
+        server.publish_job_event(job, 'expired', {'status': 'expired'})
+
+    events = [event for event in collect(job, finish) if event is not None]
+
+    assert [event['type'] for event in events] == ['snapshot', 'progress', 'expired']
+    assert events[0]['progress'] == 10.0
+
+
+def test_idle_stream_rereads_the_job(job, db, monkeypatch):
+    monkeypatch.setattr(server, 'JOB_EVENT_IDLE_TIMEOUT', 0.05)
+
+    async def finish_elsewhere():
+        # e.g. finished by another node: no event reaches this process
+        await db.video_jobs.update_one({'id': job}, {'$set': {'status': 'completed', 'progress': 100.0}})
+
+    events = [event for event in collect(job, finish_elsewhere) if event is not None]
+
+    assert [(event['type'], event['status']) for event in events] == [('snapshot', 'processing'), ('snapshot', 'completed')]
+
+
+def test_stream_closes_after_max_duration(job, monkeypatch):
+    monkeypatch.setattr(server, 'JOB_EVENT_MAX_DURATION', 0.1)
+
+    events = collect(job)
+
+    assert events[0]['type'] == 'snapshot'
+    assert None in events  # heartbeats were sent meanwhile
+    assert not server.job_events.subscribers
+
+
+def test_sse_endpoint_sends_snapshot_of_finished_job(db):
+    asyncio.run(db.video_jobs.insert_one({'id': 'done', 'status': 'expired', 'progress': 100.0}))
+
+    response = api_request('GET', '/api/job-events/done')
+
+    assert response.headers['content-type'].startswith('text/event-stream')
+    event, data = response.text.strip().split('\n')
+    assert event == 'event: snapshot'
+    assert json.loads(data.removeprefix('data: '))['status'] == 'expired'
+    assert api_request('GET', '/api/job-events/missing').status_code == 404
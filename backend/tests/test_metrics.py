@@ -0,0 +1,83 @@
+import asyncio
+import shutil
+from types import SimpleNamespace
+
+import server
+from conftest import api_request, requires_ffmpeg
+
+
+def observations(histogram, **labels) -> int:
+    counts, _ = histogram.values.get(histogram.key(labels), ([0], 0.0))
+    return sum(counts)
+
+
+def test_metrics_render_in_text_exposition_format(monkeypatch):
+    monkeypatch.setattr(server, 'METRICS', [])
+    requests = server.Counter('test_requests_total', 'Requests', ('route',))
+    running = server.Gauge('test_running', 'Running things')
+    latency = server.Histogram('test_seconds', 'Latency', ('route',), (1, 0.5))
+
+    requests.inc(route='a"b\\c\n')
+    requests.inc(2, route='a"b\\c\n')
+    running.inc()
+    running.inc(3)
+    running.dec()
+    for value in (0.2, 0.5, 0.7, 3):
+        latency.observe(value, route='x')
+
+    assert server.render_metrics() == '\n'.join([
+        '# HELP test_requests_total Requests',
+        '# TYPE test_requests_total counter',
+        'test_requests_total{route="a\\"b\\\\c\\n"} 3',
+        '# HELP test_running Running things',
+        '# TYPE test_running gauge',
+        'test_running 3',
+        '# HELP test_seconds Latency',
+        '# TYPE test_seconds histogram',
+        'test_seconds_bucket{route="x",le="0.5"} 2',
+        'test_seconds_bucket{route="x",le="1"} 3',
+        'test_seconds_bucket{route="x",le="+Inf"} 4',
+        'test_seconds_sum{route="x"} 4.4',
+        'test_seconds_count{route="x"} 4',
+    ]) + '\n'
+
+
+def test_mongo_commands_are_timed():
+    listener = server.MongoCommandMetrics()
+    before = observations(server.MONGO_SECONDS, command='test_find')
+    failures = server.MONGO_FAILURES.values.get(('test_find',), 0)
+
+    listener.succeeded(SimpleNamespace(duration_micros=1500, command_name='test_find'))
+    listener.failed(SimpleNamespace(duration_micros=900, command_name='test_find'))
+
+    assert observations(server.MONGO_SECONDS, command='test_find') == before + 2
+    assert server.MONGO_FAILURES.values[('test_find',)] == failures + 1
+
+
+@requires_ffmpeg
+def test_every_ffprobe_run_is_timed(sample_video, tmp_path, db):
+    source = tmp_path / 'sample.mp4'
+    shutil.copy(sample_video, source)
+    before = observations(server.FFPROBE_SECONDS)
+
+    asyncio.run(server.probe_keyframes(str(source), 0.0, 5.0))
+    asyncio.run(server.build_packet_index(str(source)))
+    asyncio.run(server.get_video_info(str(source)))
+
+    assert observations(server.FFPROBE_SECONDS) == before + 3
+    server.close_packet_index(str(source))
+
+
+def test_metrics_endpoint_reports_queue_and_storage(db, temp_base):
+    asyncio.run(db.video_jobs.insert_many([{'id': str(n), 'status': 'queued'} for n in range(3)]))
+    (temp_base / 'outputs' / 'job').mkdir()
+    (temp_base / 'outputs' / 'job' / 'part.mp4').write_bytes(bytes(1234))
+
+    response = api_request('GET', '/api/metrics')
+
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/plain; version=0.0.4')
+    lines = response.text.splitlines()
+    assert 'video_splitter_queue_depth 3' in lines
+    assert 'video_splitter_storage_bytes{directory="outputs"} 1234' in lines
+    assert '# TYPE video_splitter_ffprobe_seconds histogram' in lines
@@ -0,0 +1,79 @@
+import asyncio
+import shutil
+
+import pytest
+
+import server
+from conftest import requires_ffmpeg
+
+
+def read(store, key, start, end) -> bytes:
+    async def collect():
+        return b''.join([chunk async for chunk in store.read_range(key, start, end)])
+    return asyncio.run(collect())
+
+
+def test_shared_local_store_round_trip(shared_store, temp_base, tmp_path):
+    source = temp_base / 'outputs' / 'job' / 'part.mp4'
+    source.parent.mkdir()
+    source.write_bytes(b'0123456789')
+
+    asyncio.run(server.publish_file(source))
+
+    assert not shared_store.local
+    assert asyncio.run(shared_store.stat('outputs/job/part.mp4'))['size'] == 10
+    assert read(shared_store, 'outputs/job/part.mp4', 2, 5) == b'2345'
+    source.unlink()
+    assert asyncio.run(server.is_stored(source))
+    assert asyncio.run(server.localize(source)) is True
+    assert source.read_bytes() == b'0123456789'
+    assert asyncio.run(server.localize(source)) is False
+
+    asyncio.run(shared_store.delete('outputs/job'))
+    assert asyncio.run(shared_store.stat('outputs/job/part.mp4')) is None
+
+
+def test_store_rooted_at_temp_base_is_the_local_disk(temp_base):
+    store = server.object_store
+    upload = temp_base / 'uploads' / 'job_clip.mp4'
+    upload.write_bytes(b'video')
+
+    asyncio.run(server.publish_file(upload))
+
+    assert store.local
+    assert asyncio.run(store.stat('uploads/job_clip.mp4'))['size'] == 5
+    with pytest.raises(FileNotFoundError):
+        asyncio.run(store.fetch('uploads/missing.mp4', temp_base / 'uploads' / 'missing.mp4'))
+
+
+def test_locate_file_prefers_the_local_copy(shared_store, temp_base):
+    path = temp_base / 'previews' / 'job' / 'thumbnails.json'
+    path.parent.mkdir()
+    path.write_text('{}')
+    asyncio.run(server.publish_file(path))
+
+    assert asyncio.run(server.locate_file(path))['path'] == str(path)
+    path.unlink()
+    stored = asyncio.run(server.locate_file(path))
+    assert stored['path'] is None and stored['size'] == 2
+    assert asyncio.run(server.locate_file(path.with_name('missing.json'))) is None
+
+
+@requires_ffmpeg
+def test_job_runs_on_a_node_without_the_upload(sample_video, db, shared_store, temp_base):
+    upload = temp_base / 'uploads' / 'job_sample.mp4'
+    shutil.copy(sample_video, upload)
+    asyncio.run(server.publish_file(upload))
+    upload.unlink()
+    asyncio.run(db.video_jobs.insert_one({'id': 'job', 'filename': 'sample.mp4', 'file_path': str(upload),
+                                          'status': 'processing'}))
+    config = server.SplitConfig(method='intervals', interval_duration=5)
+
+    asyncio.run(server.process_video_job('job', str(upload), config))
+
+    job = asyncio.run(db.video_jobs.find_one({'id': 'job'}))
+    assert job['status'] == 'completed', job.get('error_message')
+    for split in job['splits']:
+        assert asyncio.run(shared_store.stat(f"outputs/job/{split['file']}"))['size'] == split['size']
+    # Only a scratch copy was fetched; the origin keeps the upload
+    assert not upload.exists()
@@ -0,0 +1,76 @@
+import asyncio
+import shutil
+
+import server
+from conftest import api_request, requires_ffmpeg
+
+
+@requires_ffmpeg
+def test_packet_index_lists_packets_and_keyframes(sample_video, tmp_path):
+    source = shutil.copy(sample_video, tmp_path / 'source.mp4')
+    index_path = asyncio.run(server.build_packet_index(str(source)))
+    try:
+        assert index_path == f"{source}.pktidx"
+        index = server.open_packet_index(str(source))
+        assert index.count == 250
+        assert list(index.pts) == sorted(index.pts)
+        assert [round(t, 2) for t in index.keyframes()] == [float(s) for s in range(10)]
+        assert [round(t, 2) for t in index.keyframes(2.5, 5.0)] == [3.0, 4.0, 5.0]
+        assert all(entry['pos'] > 0 for entry in index.keyframe_entries())
+        assert 0 < index.byte_range(0.0, 5.0) < index.byte_range(0.0, 10.0)
+    finally:
+        server.close_packet_index(str(source))
+
+
+def test_open_packet_index_ignores_foreign_files(tmp_path):
+    source = tmp_path / 'source.mp4'
+    (tmp_path / 'source.mp4.pktidx').write_bytes(b'not an index at all, just some bytes')
+    assert server.open_packet_index(str(source)) is None
+
+
+@requires_ffmpeg
+def test_keyframes_endpoint_downsamples(sample_video, tmp_path, db):
+    source = shutil.copy(sample_video, tmp_path / 'source.mp4')
+    asyncio.run(server.build_packet_index(str(source)))
+    asyncio.run(db.video_jobs.insert_one({'id': 'job', 'file_path': str(source), 'packet_index': 'ready'}))
+    try:
+        response = api_request('GET', '/api/keyframes/job', params={'start': 1.0, 'max_points': 4})
+    finally:
+        server.close_packet_index(str(source))
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body['total'] == 9 and body['downsampled']
+    assert [round(k['time']) for k in body['keyframes']] == [1, 3, 5, 7]
+
+
+def test_keyframes_endpoint_reports_index_being_built(tmp_path, db):
+    asyncio.run(db.video_jobs.insert_one(
+        {'id': 'job', 'file_path': str(tmp_path / 'source.mp4'), 'packet_index': 'building'}
+    ))
+    assert api_request('GET', '/api/keyframes/job').status_code == 409
+    assert api_request('GET', '/api/keyframes/other').status_code == 404
+
+
+@requires_ffmpeg
+def test_index_is_published_for_other_nodes(sample_video, db, shared_store, temp_base):
+    source = temp_base / 'uploads' / 'job_source.mp4'
+    shutil.copy(sample_video, source)
+    asyncio.run(db.video_jobs.insert_one({'id': 'job', 'file_path': str(source)}))
+
+    asyncio.run(server.index_uploaded_video('job', str(source)))
+
+    assert asyncio.run(shared_store.stat('uploads/job_source.mp4.pktidx')) is not None
+    # Another node has neither the upload nor its index on disk
+    server.close_packet_index(str(source))
+    source.unlink()
+    (temp_base / 'uploads' / 'job_source.mp4.pktidx').unlink()
+    try:
+        response = api_request('GET', '/api/keyframes/job')
+        assert response.status_code == 200 and response.json()['total'] == 10
+        assert [round(t) for t in asyncio.run(server.probe_keyframes(str(source), 2.5, 5.0))] == [3, 4, 5]
+    finally:
+        server.close_packet_index(str(source))
+
+    asyncio.run(server.remove_job_files('job', {'file_path': str(source)}))
+    assert asyncio.run(shared_store.stat('uploads/job_source.mp4.pktidx')) is None
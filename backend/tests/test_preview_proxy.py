@@ -0,0 +1,98 @@
+import asyncio
+import shutil
+
+import pytest
+
+import server
+from conftest import api_request, requires_ffmpeg
+
+
+@pytest.fixture
+def proxy_state(monkeypatch):
+    monkeypatch.setattr(server, 'preview_proxy_slots', None)
+    monkeypatch.setattr(server, 'preview_proxy_tasks', {})
+
+
+def insert_job(db, file_path, **fields):
+    asyncio.run(db.video_jobs.insert_one({'id': 'job', 'status': 'uploaded', 'file_path': str(file_path), **fields}))
+
+
+@requires_ffmpeg
+def test_proxy_is_segmented_hls_published_to_the_store(sample_video, db, shared_store, temp_base, proxy_state,
+                                                       monkeypatch):
+    monkeypatch.setattr(server, 'PREVIEW_HEIGHT', 120)
+    insert_job(db, sample_video)
+
+    asyncio.run(server.prepare_preview_proxy('job', str(sample_video)))
+
+    assert asyncio.run(db.video_jobs.find_one({'id': 'job'}))['preview'] == 'ready'
+    playlist = (temp_base / 'proxies' / 'job' / 'index.m3u8').read_text()
+    assert '#EXT-X-PLAYLIST-TYPE:EVENT' in playlist and '#EXT-X-ENDLIST' in playlist
+    segments = [line for line in playlist.splitlines() if line.endswith('.ts')]
+    assert segments == ['segment_00000.ts', 'segment_00001.ts', 'segment_00002.ts']
+    for name in ['index.m3u8', *segments]:
+        assert asyncio.run(shared_store.stat(f'proxies/job/{name}')) is not None
+
+    # Another node serves the finished rendition from the store
+    shutil.rmtree(temp_base / 'proxies' / 'job')
+    response = api_request('GET', '/api/video-preview/job/index.m3u8')
+    assert response.status_code == 200
+    assert response.headers['cache-control'] == 'no-cache'
+    assert response.text == playlist
+    segment = api_request('GET', '/api/video-preview/job/segment_00000.ts')
+    assert segment.headers['content-type'] == 'video/mp2t'
+    assert segment.headers['cache-control'] == server.PREVIEW_CACHE_CONTROL
+
+
+def test_proxies_are_built_one_at_a_time(db, temp_base, proxy_state, monkeypatch):
+    monkeypatch.setattr(server, 'PREVIEW_PROXY_CONCURRENCY', 1)
+    running = 0
+    peak = 0
+
+    async def fake_build(job_id, file_path):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    monkeypatch.setattr(server, 'build_preview_proxy', fake_build)
+    monkeypatch.setattr(server, 'localize', lambda file_path: asyncio.sleep(0))
+
+    async def run():
+        await asyncio.gather(*(server.prepare_preview_proxy(f'job{i}', f'/uploads/{i}.mp4') for i in range(3)))
+
+    asyncio.run(run())
+
+    assert peak == 1
+    assert server.preview_proxy_tasks == {}
+
+
+def test_playlist_is_retried_while_the_proxy_builds(db, temp_base, tmp_path):
+    insert_job(db, tmp_path / 'source.mp4', preview='building')
+
+    response = api_request('GET', '/api/video-preview/job/index.m3u8')
+
+    assert response.status_code == 503
+    assert response.headers['retry-after'] == str(server.PREVIEW_SEGMENT_SECONDS)
+    assert api_request('GET', '/api/video-preview/job/segment_00000.ts').status_code == 404
+    assert api_request('GET', '/api/video-preview/job/server.py').status_code == 404
+
+
+def test_create_preview_starts_a_missing_or_failed_proxy(db, temp_base, monkeypatch):
+    source = temp_base / 'uploads' / 'job.mp4'
+    source.write_bytes(b'video')
+    insert_job(db, source, preview='failed')
+    started = []
+
+    async def fake_start(job_id, file_path):
+        started.append(job_id)
+
+    monkeypatch.setattr(server, 'start_preview_proxy', fake_start)
+
+    response = api_request('POST', '/api/video-preview/job')
+
+    assert response.json() == {'preview': 'queued', 'playlist_url': '/api/video-preview/job/index.m3u8'}
+    assert started == ['job']
+    source.unlink()
+    assert api_request('POST', '/api/video-preview/job').status_code == 404
@@ -0,0 +1,81 @@
+import asyncio
+import os
+import shutil
+from collections import OrderedDict
+
+import pytest
+
+import server
+from conftest import requires_ffmpeg
+
+
+@pytest.fixture
+def probes(db, monkeypatch):
+    """Count the ffprobe runs behind get_video_info"""
+    calls = []
+    run_ffprobe_async = server.run_ffprobe_async
+
+    async def counting_run_ffprobe_async(file_path, *extra_args):
+        calls.append((file_path, extra_args))
+        return await run_ffprobe_async(file_path, *extra_args)
+
+    monkeypatch.setattr(server, 'run_ffprobe_async', counting_run_ffprobe_async)
+    monkeypatch.setattr(server, 'probe_cache', OrderedDict())
+    return calls
+
+
+@requires_ffmpeg
+def test_repeated_probes_are_served_from_cache(sample_video, tmp_path, probes):
+    source = shutil.copy(sample_video, tmp_path / 'source.mp4')
+
+    first = asyncio.run(server.get_video_info(source))
+    second = asyncio.run(server.get_video_info(source))
+
+    assert first == second
+    assert first['video_streams'][0]['codec'] == 'h264'
+    assert len(probes) == 1
+
+
+@requires_ffmpeg
+def test_cache_survives_restart_through_mongo(sample_video, tmp_path, probes, monkeypatch):
+    source = shutil.copy(sample_video, tmp_path / 'source.mp4')
+    asyncio.run(server.get_video_info(source))
+
+    monkeypatch.setattr(server, 'probe_cache', OrderedDict())
+    asyncio.run(server.get_video_info(source))
+
+    assert len(probes) == 1
+
+
+@requires_ffmpeg
+def test_changed_file_is_probed_again(sample_video, tmp_path, probes):
+    source = shutil.copy(sample_video, tmp_path / 'source.mp4')
+    asyncio.run(server.get_video_info(source))
+
+    stat = os.stat(source)
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    asyncio.run(server.get_video_info(source))
+
+    assert len(probes) == 2
+
+
+@requires_ffmpeg
+def test_fast_probe_does_not_satisfy_full_requests(sample_video, tmp_path, probes):
+    source = shutil.copy(sample_video, tmp_path / 'source.mp4')
+
+    asyncio.run(server.get_video_info(source, fast=True))
+    asyncio.run(server.get_video_info(source))
+    asyncio.run(server.get_video_info(source, fast=True))
+
+    assert [bool(extra_args) for _, extra_args in probes] == [True, False]
+
+
+@requires_ffmpeg
+def test_identical_content_is_found_by_hash(sample_video, tmp_path, probes):
+    first = shutil.copy(sample_video, tmp_path / 'first.mp4')
+    second = shutil.copy(sample_video, tmp_path / 'second.mp4')
+
+    asyncio.run(server.get_video_info(first, content_hash='abc123'))
+    asyncio.run(server.get_video_info(second, content_hash='abc123'))
+
+    assert [path for path, _ in probes] == [first]
@@ -0,0 +1,126 @@
+import asyncio
+import time
+import uuid
+
+import pytest
+
+import server
+from conftest import api_request
+
+TOKEN = 'secret'
+
+
+@pytest.fixture
+def token(monkeypatch):
+    monkeypatch.setattr(server, 'PROFILING_TOKEN', TOKEN)
+
+
+@pytest.fixture
+def job_id(db):
+    job_id = str(uuid.uuid4())
+    asyncio.run(db.video_jobs.insert_one({
+        'id': job_id, 'filename': 'clip.mp4', 'file_path': '/uploads/clip.mp4', 'status': 'uploaded', 'progress': 0.0
+    }))
+    return job_id
+
+
+def profile_count(db) -> int:
+    return asyncio.run(db.profiles.count_documents({}))
+
+
+def test_requests_pass_through_without_a_token(db, job_id):
+    response = api_request('GET', f'/api/job-status/{job_id}', headers={'X-Profile': '1', 'X-Profile-Token': ''})
+
+    assert response.status_code == 200
+    assert 'x-profile-id' not in response.headers
+    assert profile_count(db) == 0
+
+
+def test_requests_with_a_wrong_token_are_not_profiled(db, job_id, token):
+    response = api_request('GET', f'/api/job-status/{job_id}', headers={'X-Profile': '1', 'X-Profile-Token': 'guess'})
+
+    assert response.status_code == 200
+    assert 'x-profile-id' not in response.headers
+    assert profile_count(db) == 0
+
+
+def test_authorized_request_is_profiled(db, job_id, token):
+    headers = {'X-Profile': '1', 'X-Profile-Token': TOKEN}
+
+    response = api_request('GET', f'/api/job-status/{job_id}', headers=headers)
+
+    assert response.status_code == 200
+    profile = asyncio.run(db.profiles.find_one({'id': response.headers['x-profile-id']}))
+    assert (profile['kind'], profile['job_id'], profile['label']) == ('request', job_id, f'GET /api/job-status/{job_id}')
+    job = api_request('GET', f'/api/job-profiles/{job_id}', headers=headers).json()
+    assert [summary['id'] for summary in job['profiles']] == [profile['id']]
+
+
+def test_profile_endpoints_are_hidden_without_a_token(db, job_id):
+    assert api_request('GET', f'/api/job-profiles/{job_id}').status_code == 404
+    assert api_request('GET', '/api/profiles/anything').status_code == 404
+    assert api_request('GET', '/api/profiles/anything/flamegraph').status_code == 404
+
+
+def test_profile_endpoints_need_the_token(db, job_id, token):
+    assert api_request('GET', f'/api/job-profiles/{job_id}').status_code == 403
+    assert api_request('GET', '/api/profiles/anything', headers={'X-Profile-Token': 'guess'}).status_code == 403
+    assert api_request('GET', '/api/profiles/anything', headers={'X-Profile-Token': TOKEN}).status_code == 404
+
+
+def test_job_profile_records_stacks_and_allocations(db, job_id, token, monkeypatch):
+    monkeypatch.setattr(server, 'PROFILE_SAMPLE_INTERVAL', 0.001)
+    profile = server.Profile('job', job_id, 'split intervals (per_segment)')
+
+    async def run():
+        profile.start()
+        retained = [bytearray(1024) for _ in range(2000)]
+        deadline = time.monotonic() + 0.05
+        while time.monotonic() < deadline:
+            sum(range(1000))
+        await profile.save()
+        return retained
+
+    asyncio.run(run())
+
+    stored = asyncio.run(db.profiles.find_one({'id': profile.id}))
+    assert stored['samples'] > 0 and stored['folded']
+    assert any('test_profiling.py' in allocation['location'] for allocation in stored['allocations'])
+    flamegraph = api_request('GET', f'/api/profiles/{profile.id}/flamegraph', headers={'X-Profile-Token': TOKEN})
+    assert flamegraph.text == stored['folded']
+    assert 'folded' not in api_request('GET', f'/api/profiles/{profile.id}', headers={'X-Profile-Token': TOKEN}).json()
+
+
+def test_profiled_splits_need_the_token(db, job_id, token):
+    config = {'method': 'intervals', 'interval_duration': 5, 'profile': True}
+
+    assert api_request('POST', f'/api/split-video/{job_id}', json=config).status_code == 403
+    response = api_request('POST', f'/api/split-video/{job_id}', json=config, headers={'X-Profile-Token': TOKEN})
+
+    assert response.status_code == 200
+    assert asyncio.run(db.video_jobs.find_one({'id': job_id}))['split_config']['profile'] is True
+
+
+def test_unauthorized_retry_drops_profiling(db, job_id, token):
+    split_config = server.SplitConfig(method='intervals', interval_duration=5, profile=True).dict()
+    asyncio.run(db.video_jobs.update_one({'id': job_id}, {'$set': {'status': 'failed', 'split_config': split_config}}))
+
+    assert api_request('POST', f'/api/retry/{job_id}').status_code == 200
+
+    job = asyncio.run(db.video_jobs.find_one({'id': job_id}))
+    assert (job['status'], job['split_config']['profile']) == ('queued', False)
+
+
+def test_overlapping_profiles_keep_tracing_until_the_last_one_stops():
+    profiles = [server.Profile('request', None, f'GET /{n}') for n in range(4)]
+    for profile in profiles:
+        profile.start()
+
+    async def stop(batch):
+        await asyncio.gather(*(asyncio.to_thread(profile.stop) for profile in batch))
+
+    asyncio.run(stop(profiles[:3]))
+    assert server.tracemalloc.is_tracing() and server.tracemalloc_users == 1
+
+    asyncio.run(stop(profiles[3:]))
+    assert not server.tracemalloc.is_tracing() and server.tracemalloc_users == 0
@@ -0,0 +1,104 @@
+import asyncio
+
+import server
+
+
+def insert_job(db, status='processing', progress=0.0):
+    asyncio.run(db.video_jobs.insert_one({'id': 'job', 'status': status, 'progress': progress}))
+
+
+def stored(db) -> dict:
+    return asyncio.run(db.video_jobs.find_one({'id': 'job'}))
+
+
+def test_small_ticks_wait_for_the_next_status_change(db):
+    insert_job(db)
+    writer = server.ProgressWriter(interval=60)
+
+    async def run():
+        await writer.write('job', {'progress': 10.0}, flush=True)
+        await writer.write('job', {'progress': 10.2}, flush=True)
+        assert writer.pending == {'job': {'progress': 10.2}}
+        await writer.write('job', {'status': 'completed', 'progress': 100.0}, flush=True)
+
+    asyncio.run(run())
+
+    assert stored(db)['status'] == 'completed' and stored(db)['progress'] == 100.0
+    assert writer.pending == {} and writer.written == {}
+
+
+def test_ticks_with_new_counters_bypass_the_delta_gate(db):
+    insert_job(db)
+    writer = server.ProgressWriter(interval=60)
+
+    async def run():
+        await writer.write('job', {'progress': 10.0, 'segments_completed': 0}, flush=True)
+        await writer.write('job', {'progress': 10.1, 'segments_completed': 1}, flush=True)
+        await writer.write('job', {'progress': 10.2, 'segments_completed': 1, 'encode_speed': 2.5}, flush=True)
+        await writer.write('job', {'progress': 10.3, 'segments_completed': 1, 'encode_speed': 2.5}, flush=True)
+
+    asyncio.run(run())
+
+    job = stored(db)
+    assert (job['progress'], job['segments_completed'], job['encode_speed']) == (10.2, 1, 2.5)
+    assert writer.pending['job']['progress'] == 10.3
+
+
+def test_ticks_never_touch_a_job_that_left_processing(db):
+    insert_job(db, status='queued', progress=0.0)
+    writer = server.ProgressWriter(interval=60)
+
+    asyncio.run(writer.write('job', {'progress': 60.0}, flush=True))
+
+    assert stored(db)['progress'] == 0.0
+
+
+def test_cancelled_job_drops_its_pending_ticks(db, monkeypatch):
+    insert_job(db)
+    monkeypatch.setattr(server, 'PROGRESS_MIN_DELTA', 100.0)
+    started = asyncio.Event()
+
+    async def stalled_localize(file_path):
+        await server.update_job_progress('job', 42.0)
+        started.set()
+        await asyncio.sleep(60)
+
+    monkeypatch.setattr(server, 'localize', stalled_localize)
+
+    async def run():
+        task = asyncio.create_task(server.process_video_job('job', '/missing.mp4', server.SplitConfig(method='time_based')))
+        await started.wait()
+        assert 'job' in server.progress_writer.pending
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await server.progress_writer.flush()
+
+    asyncio.run(run())
+
+    assert 'job' not in server.progress_writer.pending
+    assert stored(db)['progress'] == 0
+
+
+def test_failed_flush_is_retried_on_the_next_flush(db, monkeypatch):
+    insert_job(db)
+    writer = server.ProgressWriter(interval=60)
+    collection = type(db.video_jobs)
+    bulk_write = collection.bulk_write
+    failures = [RuntimeError("primary stepped down")]
+
+    async def flaky_bulk_write(self, operations, **kwargs):
+        if failures:
+            raise failures.pop()
+        return await bulk_write(self, operations, **kwargs)
+
+    monkeypatch.setattr(collection, 'bulk_write', flaky_bulk_write)
+
+    async def run():
+        await writer.write('job', {'progress': 30.0}, flush=True)
+        assert writer.written == {} and writer.pending == {'job': {'progress': 30.0}}
+        await writer.flush()
+
+    asyncio.run(run())
+
+    assert stored(db)['progress'] == 30.0
+    assert writer.pending == {} and writer.written == {'job': {'progress': 30.0}}
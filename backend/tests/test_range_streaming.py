@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+
+import server
+from conftest import api_request
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('bytes=0-99', [(0, 99)]),
+    ('bytes=900-', [(900, 999)]),
+    ('bytes=-100', [(900, 999)]),
+    ('bytes=950-2000', [(950, 999)]),
+    ('bytes=0-0,-1', [(0, 0), (999, 999)]),
+    ('bytes=1000-1200', []),
+    ('bytes=-0', []),
+    ('bytes=5-1', None),
+    ('bytes=abc', None),
+    ('items=0-10', None),
+])
+def test_parse_range_header(header, expected):
+    assert server.parse_range_header(header, 1000) == expected
+
+
+def test_parse_range_header_coalesces_overlapping_and_adjacent_ranges():
+    header = 'bytes=500-599,0-99,50-149,150-199,-100,980-'
+    assert server.parse_range_header(header, 1000) == [(0, 199), (500, 599), (900, 999)]
+
+
+def test_parse_range_header_ignores_too_many_ranges(monkeypatch):
+    monkeypatch.setattr(server, 'STREAM_MAX_RANGES', 16)
+    allowed = 'bytes=' + ','.join(f'{i * 10}-{i * 10 + 4}' for i in range(16))
+    too_many = 'bytes=' + ','.join('0-' for _ in range(17))
+
+    assert len(server.parse_range_header(allowed, 1000)) == 16
+    assert server.parse_range_header(too_many, 1000) is None
+
+
+@pytest.fixture
+def stream_job(tmp_path, db, monkeypatch):
+    monkeypatch.setattr(server, 'stream_targets', {})
+    source = tmp_path / 'video.mp4'
+    source.write_bytes(bytes(range(256)) * 4)
+    asyncio.run(db.video_jobs.insert_one({'id': 'job', 'file_path': str(source), 'filename': 'video.mp4'}))
+    return source.read_bytes()
+
+
+def test_stream_serves_single_range(stream_job):
+    response = api_request('GET', '/api/video-stream/job', headers={'Range': 'bytes=100-199'})
+
+    assert response.status_code == 206
+    assert response.headers['content-range'] == 'bytes 100-199/1024'
+    assert response.content == stream_job[100:200]
+
+
+def test_stream_merges_overlapping_ranges_into_one_part(stream_job):
+    response = api_request('GET', '/api/video-stream/job', headers={'Range': 'bytes=0-9,5-19,20-29'})
+
+    assert response.status_code == 206
+    assert response.headers['content-range'] == 'bytes 0-29/1024'
+    assert response.content == stream_job[:30]
+
+
+def test_stream_serves_multipart_ranges(stream_job):
+    response = api_request('GET', '/api/video-stream/job', headers={'Range': 'bytes=0-3,-4'})
+
+    assert response.status_code == 206
+    assert response.headers['content-type'].startswith('multipart/byteranges')
+    assert int(response.headers['content-length']) == len(response.content)
+    assert b'Content-Range: bytes 0-3/1024\r\n\r\n' + stream_job[:4] in response.content
+    assert b'Content-Range: bytes 1020-1023/1024\r\n\r\n' + stream_job[-4:] in response.content
+
+
+def test_stream_answers_too_many_ranges_with_whole_file(stream_job):
+    header = 'bytes=' + ','.join(f'{i}-{i}' for i in range(0, 400, 2))
+    response = api_request('GET', '/api/video-stream/job', headers={'Range': header})
+
+    assert response.status_code == 200
+    assert response.content == stream_job
+
+
+def test_stream_rejects_unsatisfiable_range(stream_job):
+    response = api_request('GET', '/api/video-stream/job', headers={'Range': 'bytes=5000-'})
+
+    assert response.status_code == 416
+    assert response.headers['content-range'] == 'bytes */1024'
+
+
+def test_stream_honours_etag(stream_job):
+    etag = api_request('HEAD', '/api/video-stream/job').headers['etag']
+
+    assert api_request('GET', '/api/video-stream/job', headers={'If-None-Match': etag}).status_code == 304
+    # A stale If-Range gets the whole file instead of the range
+    response = api_request('GET', '/api/video-stream/job', headers={'Range': 'bytes=0-9', 'If-Range': '"stale"'})
+    assert response.status_code == 200 and len(response.content) == 1024
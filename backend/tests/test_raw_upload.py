@@ -0,0 +1,45 @@
+import asyncio
+import hashlib
+
+import server
+from conftest import api_request, requires_ffmpeg
+
+
+@requires_ffmpeg
+def test_raw_upload_writes_body_once_and_registers_job(sample_video, db, temp_base, no_upload_indexing, monkeypatch):
+    # Several write batches per upload
+    monkeypatch.setattr(server, 'UPLOAD_WRITE_BUFFER_SIZE', 16 * 1024)
+    data = sample_video.read_bytes()
+
+    response = api_request('POST', '/api/upload-video-raw', params={'filename': '../clip.mp4'}, content=data)
+
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert body['filename'] == 'clip.mp4' and body['size'] == len(data)
+    job = asyncio.run(db.video_jobs.find_one({'id': body['job_id']}))
+    assert job['content_hash'] == f'sha256:{hashlib.sha256(data).hexdigest()}'
+    with open(job['file_path'], 'rb') as f:
+        assert f.read() == data
+
+
+def test_raw_upload_rejects_unsupported_formats(db, temp_base):
+    response = api_request('POST', '/api/upload-video-raw', params={'filename': 'notes.txt'}, content=b'text')
+    assert response.status_code == 400
+
+
+def test_raw_upload_body_longer_than_content_length_is_a_client_error(db, temp_base):
+    response = api_request(
+        'POST', '/api/upload-video-raw', params={'filename': 'clip.mp4'},
+        content=b'x' * 20, headers={'Content-Length': '10'},
+    )
+
+    assert response.status_code == 400
+    assert response.json()['detail'] == "Request body is larger than expected"
+    assert list((temp_base / 'uploads').iterdir()) == []
+
+
+def test_raw_upload_that_cannot_be_probed_fails_and_is_removed(db, temp_base):
+    response = api_request('POST', '/api/upload-video-raw', params={'filename': 'clip.mp4'}, content=b'not a video')
+
+    assert response.status_code == 500
+    assert list((temp_base / 'uploads').iterdir()) == []
@@ -0,0 +1,66 @@
+import asyncio
+import subprocess
+
+import pytest
+
+import server
+from conftest import requires_ffmpeg
+
+
+@pytest.fixture(scope='module')
+def scene_video(tmp_path_factory):
+    """Three flat colour shots changing at 3 s and 7 s"""
+    if not server.shutil.which('ffmpeg'):
+        pytest.skip("ffmpeg is not installed")
+    path = tmp_path_factory.mktemp('scenes') / 'scenes.mp4'
+    shots = ''.join(f"color=c={colour}:s=160x120:r=25:d={duration}[v{i}];"
+                    for i, (colour, duration) in enumerate([('red', 3), ('blue', 4), ('white', 3)]))
+    subprocess.run(
+        ['ffmpeg', '-v', 'error', '-y', '-filter_complex', f"{shots}[v0][v1][v2]concat=n=3:v=1:a=0",
+         '-c:v', 'libx264', '-preset', 'ultrafast', '-pix_fmt', 'yuv420p', str(path)],
+        check=True,
+    )
+    return path
+
+
+def test_splits_from_cut_points_cover_the_video():
+    assert server.splits_from_cut_points([3.0, 7.0], 10.0) == [
+        {'start': 0.0, 'end': 3.0}, {'start': 3.0, 'end': 7.0}, {'start': 7.0, 'end': 10.0}
+    ]
+    assert server.splits_from_cut_points([], 10.0) == [{'start': 0.0, 'end': 10.0}]
+
+
+def test_choose_cut_points_respects_min_length():
+    candidates = [(1.0, 0.5), (3.0, 0.5), (3.5, 0.9), (8.0, 0.5), (9.5, 0.5)]
+    # 1.0 and 3.5 are too close to the previous cut, 9.5 too close to the end
+    assert server.choose_cut_points(candidates, 10.0, 2.0, None) == [3.0, 8.0]
+
+
+def test_choose_cut_points_forces_cuts_past_max_length():
+    assert server.choose_cut_points([(6.0, 0.5)], 20.0, 2.0, 4.0) == [4.0, 6.0, 10.0, 14.0, 18.0]
+    assert server.choose_cut_points([], 10.0, 2.0, 4.0) == [4.0, 8.0]
+
+
+def test_choose_cut_points_never_leaves_a_short_tail():
+    # Cutting at 9.0 would leave 1 s; the last 5.5 s are halved instead
+    assert server.choose_cut_points([], 10.0, 2.0, 4.5) == [4.5, 7.25]
+
+
+@requires_ffmpeg
+@pytest.mark.parametrize('batch_frames', [512, 7])
+def test_scene_cuts_are_found_across_batches(scene_video, monkeypatch, batch_frames):
+    monkeypatch.setattr(server, 'SCENE_BATCH_FRAMES', batch_frames)
+    config = server.SplitConfig(method='scenes')
+
+    cuts = asyncio.run(server.detect_scene_cuts(str(scene_video), {'duration': 10.0}, config))
+
+    assert cuts == [3.0, 7.0]
+
+
+@requires_ffmpeg
+def test_scene_split_plan_honours_min_and_max_length(scene_video):
+    config = server.SplitConfig(method='scenes', max_segment_duration=2.5, min_segment_duration=1.0)
+
+    splits = asyncio.run(server.plan_splits(str(scene_video), {'duration': 10.0}, config))
+
+    assert [split['end'] for split in splits] == [2.5, 5.0, 7.0, 8.5, 10.0]
@@ -0,0 +1,193 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+import server
+from conftest import api_request
+
+CONFIG = server.SplitConfig(method='time_based', time_points=[5.0])
+
+
+def insert_jobs(db, *jobs):
+    asyncio.run(db.video_jobs.insert_many([{'file_path': '/videos/source.mp4', **job} for job in jobs]))
+
+
+def get_job(db, job_id):
+    return asyncio.run(db.video_jobs.find_one({'id': job_id}))
+
+
+@pytest.fixture
+def scheduler(db):
+    return server.JobScheduler(1)
+
+
+def test_claim_takes_highest_priority_then_oldest(db, scheduler):
+    now = datetime.utcnow()
+    insert_jobs(
+        db,
+        {'id': 'old', 'status': 'queued', 'priority': 0, 'queued_at': now - timedelta(minutes=5)},
+        {'id': 'new', 'status': 'queued', 'priority': 0, 'queued_at': now},
+        {'id': 'urgent', 'status': 'queued', 'priority': 5, 'queued_at': now},
+        {'id': 'busy', 'status': 'processing', 'priority': 9, 'queued_at': now},
+    )
+
+    async def claim_all():
+        return [(await scheduler.claim()) for _ in range(4)]
+
+    claimed = asyncio.run(claim_all())
+
+    assert [job['id'] if job else None for job in claimed] == ['urgent', 'old', 'new', None]
+    job = get_job(db, 'urgent')
+    assert job['status'] == 'processing' and job['worker_id'] == scheduler.worker_id
+    assert job['attempts'] == 1
+
+
+def test_enqueue_only_moves_jobs_from_allowed_statuses(db, scheduler):
+    insert_jobs(db, {'id': 'job', 'status': 'uploaded'})
+
+    async def enqueue_twice():
+        return await asyncio.gather(
+            scheduler.enqueue('job', CONFIG, ['uploaded']),
+            scheduler.enqueue('job', CONFIG, ['uploaded']),
+        )
+
+    assert sorted(asyncio.run(enqueue_twice())) == [False, True]
+    job = get_job(db, 'job')
+    assert job['status'] == 'queued' and job['split_config']['time_points'] == [5.0]
+
+
+def test_queue_position_follows_claim_order(db, scheduler):
+    now = datetime.utcnow()
+    insert_jobs(
+        db,
+        {'id': 'a', 'status': 'queued', 'priority': 0, 'queued_at': now - timedelta(seconds=2)},
+        {'id': 'b', 'status': 'queued', 'priority': 0, 'queued_at': now},
+        {'id': 'c', 'status': 'queued', 'priority': 1, 'queued_at': now},
+    )
+
+    positions = {job_id: asyncio.run(scheduler.queue_position(get_job(db, job_id))) for job_id in 'abc'}
+
+    assert positions == {'a': 2, 'b': 3, 'c': 1}
+
+
+def test_split_and_retry_endpoints_refuse_jobs_already_queued(db, monkeypatch):
+    monkeypatch.setattr(server.scheduler, 'notify', lambda: None)
+    insert_jobs(db, {'id': 'job', 'status': 'uploaded'})
+    body = CONFIG.dict()
+
+    first = api_request('POST', '/api/split-video/job', json=body)
+    assert first.status_code == 200 and first.json()['queue_position'] == 1
+    assert api_request('POST', '/api/split-video/job', json=body).status_code == 400
+
+    asyncio.run(db.video_jobs.update_one({'id': 'job'}, {'$set': {'status': 'failed', 'attempts': 3}}))
+    assert api_request('POST', '/api/retry/job').status_code == 200
+    assert get_job(db, 'job')['attempts'] == 0
+    assert api_request('POST', '/api/retry/job').status_code == 409
+
+
+def test_retry_reports_conflict_when_job_was_requeued_meanwhile(db, monkeypatch):
+    insert_jobs(db, {'id': 'job', 'status': 'failed', 'split_config': CONFIG.dict()})
+
+    async def lose_race(job_id, config, from_statuses, reset_attempts=False):
+        await db.video_jobs.update_one({'id': job_id}, {'$set': {'status': 'queued'}})
+        return await server.JobScheduler.enqueue(server.scheduler, job_id, config, from_statuses, reset_attempts)
+
+    monkeypatch.setattr(server.scheduler, 'enqueue', lose_race)
+
+    assert api_request('POST', '/api/retry/job').status_code == 409
+
+
+def test_worker_runs_queued_jobs(db, monkeypatch):
+    processed = asyncio.Queue()
+
+    async def fake_process_video_job(job_id, file_path, config):
+        await db.video_jobs.update_one({'id': job_id}, {'$set': {'status': 'completed'}})
+        processed.put_nowait((job_id, config.time_points))
+
+    monkeypatch.setattr(server, 'process_video_job', fake_process_video_job)
+    monkeypatch.setattr(server, 'SCHEDULER_POLL_INTERVAL', 0.05)
+    insert_jobs(db, {'id': 'job', 'status': 'uploaded'})
+
+    async def run():
+        scheduler = server.JobScheduler(2)
+        await scheduler.start()
+        try:
+            await scheduler.enqueue('job', CONFIG, ['uploaded'])
+            return await asyncio.wait_for(processed.get(), 5)
+        finally:
+            await scheduler.stop()
+
+    assert asyncio.run(run()) == ('job', [5.0])
+    job = get_job(db, 'job')
+    assert job['status'] == 'completed' and job['attempts'] == 1
+
+
+def test_recover_requeues_jobs_whose_lease_lapsed(db, scheduler, monkeypatch):
+    monkeypatch.setattr(server, 'MAX_JOB_ATTEMPTS', 3)
+    now = datetime.utcnow()
+    insert_jobs(
+        db,
+        {'id': 'lapsed', 'status': 'processing', 'attempts': 1, 'worker_id': 'dead', 'progress': 40.0,
+         'lease_expires_at': now - timedelta(seconds=1)},
+        {'id': 'unleased', 'status': 'processing', 'attempts': 1},
+        {'id': 'exhausted', 'status': 'processing', 'attempts': 3, 'worker_id': 'dead',
+         'lease_expires_at': now - timedelta(seconds=1)},
+        {'id': 'alive', 'status': 'processing', 'attempts': 1, 'worker_id': 'other',
+         'lease_expires_at': now + timedelta(seconds=30)},
+    )
+
+    assert asyncio.run(scheduler.recover()) == 2
+
+    lapsed = get_job(db, 'lapsed')
+    assert (lapsed['status'], lapsed['progress']) == ('queued', 0.0)
+    assert 'worker_id' not in lapsed and 'lease_expires_at' not in lapsed
+    assert get_job(db, 'unleased')['status'] == 'queued'
+    exhausted = get_job(db, 'exhausted')
+    assert (exhausted['status'], exhausted['error_message']) == ('failed', 'Job was interrupted too many times')
+    assert get_job(db, 'alive')['status'] == 'processing'
+
+
+def test_heartbeat_renews_the_lease_and_stops_jobs_taken_over(db, scheduler, monkeypatch):
+    monkeypatch.setattr(server, 'JOB_HEARTBEAT_INTERVAL', 0.01)
+    expires = datetime.utcnow() + timedelta(seconds=1)
+    insert_jobs(db, {'id': 'job', 'status': 'processing', 'worker_id': scheduler.worker_id, 'lease_expires_at': expires})
+
+    async def run():
+        task = asyncio.create_task(asyncio.sleep(60))
+        heartbeat = asyncio.create_task(scheduler.heartbeat('job', task))
+        await asyncio.sleep(0.05)
+        renewed = (await db.video_jobs.find_one({'id': 'job'}))['lease_expires_at'] > expires
+        # Another node requeued and claimed the job meanwhile
+        await db.video_jobs.update_one({'id': 'job'}, {'$set': {'worker_id': 'other'}})
+        await asyncio.wait_for(heartbeat, 1)
+        await asyncio.gather(task, return_exceptions=True)
+        return renewed, task.cancelled()
+
+    assert asyncio.run(run()) == (True, True)
+
+
+def test_stop_hands_unfinished_jobs_back(db, monkeypatch):
+    started = asyncio.Event()
+
+    async def endless_job(job_id, file_path, config):
+        started.set()
+        await asyncio.sleep(60)
+
+    monkeypatch.setattr(server, 'process_video_job', endless_job)
+    insert_jobs(db, {'id': 'job', 'status': 'queued', 'priority': 0, 'queued_at': datetime.utcnow(),
+                     'split_config': CONFIG.dict(), 'attempts': 0})
+
+    async def run():
+        scheduler = server.JobScheduler(1)
+        await scheduler.start()
+        await asyncio.wait_for(started.wait(), 5)
+        assert (await db.video_jobs.find_one({'id': 'job'}))['worker_id'] == scheduler.worker_id
+        await scheduler.stop()
+
+    asyncio.run(run())
+
+    job = get_job(db, 'job')
+    # A clean shutdown does not count as an attempt
+    assert (job['status'], job['attempts']) == ('queued', 0)
+    assert 'worker_id' not in job
@@ -0,0 +1,72 @@
+import asyncio
+import subprocess
+
+import pytest
+
+import server
+from conftest import requires_ffmpeg
+
+
+@pytest.fixture(scope='module')
+def speech(tmp_path_factory):
+    """10 s of tone with pauses at 3-4 s and 7-8 s"""
+    if not server.shutil.which('ffmpeg'):
+        pytest.skip("ffmpeg is not installed")
+    path = tmp_path_factory.mktemp('silence') / 'speech.wav'
+    subprocess.run(
+        ['ffmpeg', '-v', 'error', '-y', '-f', 'lavfi',
+         '-i', "aevalsrc='if(between(mod(t,4),3,4),0,0.5*sin(2*PI*440*t))':s=8000:d=10", str(path)],
+        check=True,
+    )
+    return path
+
+
+def test_silence_cuts_pick_the_pause_nearest_the_target():
+    silences = [(2.0, 2.5), (4.8, 5.2), (9.0, 9.5), (11.0, 11.4)]
+    # Pause midpoints 5.0 and 9.25 are nearest the 5 s targets; the 5.75 s tail needs no cut
+    assert server.choose_silence_cuts(silences, 15.0, 5.0, 2.5, 7.5) == [5.0, 9.25]
+
+
+def test_silence_cuts_force_a_cut_without_a_usable_pause():
+    assert server.choose_silence_cuts([(0.5, 1.0)], 20.0, 5.0, 2.5, 7.5) == [5.0, 10.0, 15.0]
+    # A tail shorter than max_length is left alone
+    assert server.choose_silence_cuts([], 7.0, 5.0, 2.5, 7.5) == []
+
+
+@requires_ffmpeg
+@pytest.mark.parametrize('batch_seconds', [60, 0.5])
+def test_silences_are_found_across_batches(speech, monkeypatch, batch_seconds):
+    monkeypatch.setattr(server, 'SILENCE_BATCH_SECONDS', batch_seconds)
+    config = server.SplitConfig(method='silence', min_silence_duration=0.5)
+
+    silences = asyncio.run(server.detect_silences(str(speech), config))
+
+    assert len(silences) == 2
+    for (start, end), expected in zip(silences, [(3.0, 4.0), (7.0, 8.0)]):
+        assert start == pytest.approx(expected[0], abs=0.06) and end == pytest.approx(expected[1], abs=0.06)
+
+
+@requires_ffmpeg
+def test_short_pauses_are_ignored(speech):
+    config = server.SplitConfig(method='silence', min_silence_duration=1.5)
+    assert asyncio.run(server.detect_silences(str(speech), config)) == []
+
+
+@requires_ffmpeg
+def test_silence_split_plan(speech):
+    config = server.SplitConfig(method='silence', target_segment_duration=4.0)
+    video_info = {'duration': 10.0, 'audio_streams': [{'index': 0}]}
+
+    splits = asyncio.run(server.plan_splits(str(speech), video_info, config))
+
+    assert [split['end'] for split in splits] == pytest.approx([3.5, 7.5, 10.0], abs=0.06)
+
+
+def test_silence_split_needs_audio_and_a_target():
+    config = server.SplitConfig(method='silence', target_segment_duration=4.0)
+    with pytest.raises(Exception, match="No audio stream"):
+        asyncio.run(server.plan_splits('video.mp4', {'duration': 10.0, 'audio_streams': []}, config))
+    with pytest.raises(Exception, match="needs target_segment_duration"):
+        asyncio.run(server.plan_splits(
+            'video.mp4', {'duration': 10.0, 'audio_streams': [{}]}, server.SplitConfig(method='silence')
+        ))
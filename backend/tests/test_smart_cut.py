@@ -0,0 +1,118 @@
+import asyncio
+import json
+import subprocess
+
+import pytest
+
+import server
+from conftest import make_video, requires_ffmpeg
+
+
+def probe_stream(path) -> dict:
+    result = subprocess.run(
+        ['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-show_streams', '-of', 'json', str(path)],
+        capture_output=True, text=True, check=True,
+    )
+    return json.loads(result.stdout)['streams'][0]
+
+
+def frame_hashes(path) -> list:
+    result = subprocess.run(
+        ['ffmpeg', '-v', 'error', '-i', str(path), '-map', '0:v:0', '-f', 'framemd5', '-'],
+        capture_output=True, text=True, check=True,
+    )
+    return [line.rsplit(',', 1)[-1].strip() for line in result.stdout.splitlines() if line and not line.startswith('#')]
+
+
+@pytest.fixture(scope='module')
+def closed_gop_video(tmp_path_factory):
+    if not server.shutil.which('ffmpeg'):
+        pytest.skip("ffmpeg is not installed")
+    return make_video(
+        tmp_path_factory.mktemp('smart_cut') / 'closed.mp4',
+        extra_args=['-preset', 'medium', '-profile:v', 'high', '-x264-params', 'bframes=3:ref=3'],
+    )
+
+
+@pytest.fixture(scope='module')
+def mpegts_roundtrip(tmp_path_factory):
+    """Smart cut joins MPEG-TS pieces; skip where the ffmpeg build cannot read them back"""
+    path = tmp_path_factory.mktemp('mpegts') / 'probe.ts'
+    written = subprocess.run(
+        ['ffmpeg', '-v', 'error', '-y', '-f', 'lavfi', '-i', 'testsrc2=s=64x64:d=0.2', '-c:v', 'libx264', str(path)],
+        capture_output=True,
+    )
+    read = subprocess.run(['ffmpeg', '-v', 'error', '-i', str(path), '-f', 'null', '-'], capture_output=True)
+    if written.returncode != 0 or read.returncode != 0:
+        pytest.skip("this ffmpeg build cannot round-trip MPEG-TS")
+
+
+def test_h264_nal_types_reads_annex_b_and_length_prefixed_packets():
+    annex_b = b'\x00\x00\x00\x01\x09\xf0' + b'\x00\x00\x00\x01\x67\x64\x00' + b'\x00\x00\x01\x65\x88\x84'
+    assert server.h264_nal_types(annex_b) == [9, 7, 5]
+
+    length_prefixed = b'\x00\x00\x00\x02\x06\x05' + b'\x00\x00\x00\x03\x41\x9a\x00'
+    assert server.h264_nal_types(length_prefixed) == [6, 1]
+    # Lengths that overrun the packet mean a different prefix size; never report an IDR
+    assert server.h264_nal_types(b'\x00\x00\x09\x02\x65\x88') == []
+
+
+def test_parse_hex_dump_ignores_ascii_column():
+    # avcC extradata as printed by ffprobe -show_data
+    dump = ("\n00000000: 014d 401f ffe1 0018 674d 401f eca0 a0fd  .M@.....gM@.....\n"
+            "00000010: 8088 0000 0300 0800 0003 0190 78c1 8cb0  ............x...\n"
+            "00000020: 0100 0568 e938 f2c8                      ...h.8..\n")
+    data = server.parse_hex_dump(dump)
+    assert len(data) == 40
+    assert data[:4] == b'\x01\x4d\x40\x1f' and data[-4:] == b'\xe9\x38\xf2\xc8'
+
+
+@requires_ffmpeg
+def test_smart_cut_source_matches_source_sps(closed_gop_video):
+    cut_source = asyncio.run(server.smart_cut_source(str(closed_gop_video), 'mp4', 'job'))
+
+    assert cut_source['start_time'] == pytest.approx(0.0, abs=0.05)
+    assert cut_source['encode']['profile:v'] == 'high'
+    assert cut_source['encode']['pix_fmt'] == 'yuv420p'
+    # x264 keeps one reference more than ref= for its B-pyramid
+    assert cut_source['encode']['refs'] == 4
+    assert cut_source['encode']['level'] == str(probe_stream(closed_gop_video)['level'])
+
+
+@requires_ffmpeg
+def test_smart_cut_source_rejects_outputs_without_in_band_parameter_sets(closed_gop_video):
+    assert asyncio.run(server.smart_cut_source(str(closed_gop_video), 'avi', 'job')) is None
+
+
+@requires_ffmpeg
+def test_find_idr_keyframe_skips_open_gop_keyframes(tmp_path, closed_gop_video):
+    open_gop = make_video(tmp_path / 'open.mp4', gop=50, extra_args=['-preset', 'medium', '-x264-params', 'open-gop=1'])
+
+    assert asyncio.run(server.find_idr_keyframe(str(open_gop), [2.0, 4.0])) is None
+    assert asyncio.run(server.find_idr_keyframe(str(closed_gop_video), [2.0, 3.0])) == 2.0
+
+
+@requires_ffmpeg
+def test_smart_cut_output_decodes_and_copies_from_the_idr_frame(closed_gop_video, mpegts_roundtrip, db, temp_base):
+    splits = [{'start': 0.5, 'end': 3.3}, {'start': 3.3, 'end': 7.0}]
+    config = server.SplitConfig(method='time_based', engine='smart_cut')
+    source_frames = frame_hashes(closed_gop_video)
+
+    outputs = asyncio.run(server.split_video_with_subtitles(
+        str(closed_gop_video), str(temp_base / 'outputs' / 'job'), splits, config, 'job'
+    ))
+
+    for output, split in zip(outputs, splits):
+        decoded = subprocess.run(
+            ['ffmpeg', '-v', 'error', '-xerror', '-i', output, '-f', 'null', '-'], capture_output=True, text=True
+        )
+        assert decoded.returncode == 0 and decoded.stderr == ''
+        stream = probe_stream(output)
+        assert stream['codec_tag_string'] == 'avc3'
+        assert stream['profile'] == 'High'
+        # Frames from the first IDR frame on are the source's, bit for bit
+        first_idr = int(split['start']) + 1
+        frames = frame_hashes(output)
+        copied = frames.index(source_frames[first_idr * 25])
+        assert frames[copied:copied + 25] == source_frames[first_idr * 25:first_idr * 25 + 25]
+        assert copied == pytest.approx((first_idr - split['start']) * 25, abs=1)
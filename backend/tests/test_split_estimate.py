@@ -0,0 +1,149 @@
+import asyncio
+import shutil
+
+import pytest
+
+import server
+from conftest import api_request, requires_ffmpeg
+
+# 1 MB/s of 1080p30: encoding at the default rate takes exactly realtime
+VIDEO_INFO = {'duration': 10.0, 'size': 10_000_000, 'video_streams': [{'width': 1920, 'height': 1080, 'fps': 30.0}]}
+SPLITS = [{'start': 0.0, 'end': 4.0}, {'start': 4.0, 'end': 8.0}, {'start': 8.0, 'end': 10.0}]
+
+
+@pytest.fixture
+def no_profile(db, monkeypatch):
+    monkeypatch.setattr(server, 'encoder_profile', None)
+    monkeypatch.setattr(server.os, 'cpu_count', lambda: 8)
+
+
+def estimate(config, splits=SPLITS):
+    return asyncio.run(server.estimate_split_cost('video.mp4', VIDEO_INFO, splits, config))
+
+
+def test_reencode_estimate_defaults_and_slot_scheduling(no_profile):
+    config = server.SplitConfig(method='intervals', preserve_quality=False, max_parallel_segments=2)
+
+    result = estimate(config)
+
+    assert (result['mode'], result['basis'], result['parallel'], result['samples']) == ('reencode', 'default', 2, 0)
+    assert [segment['estimated_seconds'] for segment in result['segments']] == [4.0, 4.0, 2.0]
+    assert [segment['estimated_bytes'] for segment in result['segments']] == [6_000_000, 6_000_000, 3_000_000]
+    # Two slots: the third segment starts when the first one finishes
+    assert result['estimated_total_seconds'] == 6.0
+
+
+def test_copy_estimate_learns_from_history(no_profile):
+    config = server.SplitConfig(method='intervals', preserve_quality=True, force_keyframes=False,
+                                max_parallel_segments=1)
+    assert estimate(config)['basis'] == 'default'
+
+    # A finished copy job moved the whole 10 MB source in 2 s
+    asyncio.run(server.record_throughput(VIDEO_INFO, SPLITS, config, {'preset': 'medium'}, 2.0, 10_000_000))
+    result = estimate(config)
+
+    assert (result['mode'], result['basis'], result['samples']) == ('copy', 'history', 1)
+    assert [segment['estimated_copy_seconds'] for segment in result['segments']] == [0.8, 0.8, 0.4]
+    assert result['estimated_total_bytes'] == 10_000_000
+
+
+def test_reencode_estimate_uses_calibration(no_profile, monkeypatch):
+    monkeypatch.setattr(server, 'encoder_profile', {
+        'width': 1280, 'height': 720, 'results': [{'preset': 'medium', 'threads': 4, 'fps': 60.0}]
+    })
+    config = server.SplitConfig(method='intervals', preserve_quality=False, max_parallel_segments=2)
+
+    result = estimate(config)
+
+    # 2.25x the calibration pixels at 30 fps against 60 fps per segment
+    assert result['basis'] == 'calibration'
+    assert result['segments'][0]['estimated_encode_seconds'] == 4.5
+
+
+def smart_cut_keyframes(monkeypatch, start_time, keyframes):
+    """Fake a source starting at start_time with keyframes at these media times"""
+    probes = []
+
+    async def fake_run_ffprobe_async(file_path, *extra_args):
+        return {'format': {'start_time': str(start_time)}}
+
+    async def fake_probe_keyframes(file_path, start, end):
+        probes.append((start, end))
+        return [start_time + k for k in keyframes if start <= start_time + k <= end]
+
+    monkeypatch.setattr(server, 'run_ffprobe_async', fake_run_ffprobe_async)
+    monkeypatch.setattr(server, 'probe_keyframes', fake_probe_keyframes)
+    return probes
+
+
+def test_smart_cut_estimate_only_encodes_up_to_the_first_keyframe(no_profile, monkeypatch):
+    smart_cut_keyframes(monkeypatch, 0.0, [1.0, 3.0])
+    config = server.SplitConfig(method='intervals', engine='smart_cut', preserve_quality=False,
+                                max_parallel_segments=1)
+
+    segment = estimate(config, SPLITS[:1])['segments'][0]
+
+    assert (segment['estimated_encode_seconds'], segment['estimated_bytes']) == (1.0, 4_500_000)
+    assert segment['estimated_copy_seconds'] > 0
+
+
+def test_smart_cut_estimate_probes_keyframes_once_from_the_start_time(no_profile, monkeypatch):
+    # Timestamps start at 1.4 s, as in MPEG-TS sources
+    probes = smart_cut_keyframes(monkeypatch, 1.4, [0.5, 4.5, 9.0])
+    config = server.SplitConfig(method='intervals', engine='smart_cut', preserve_quality=False,
+                                max_parallel_segments=1)
+
+    result = estimate(config)
+
+    assert probes == [(1.4, 11.4)]
+    # Heads run to the first keyframe in each split, or the whole split without one
+    assert [segment['estimated_encode_seconds'] for segment in result['segments']] == [0.5, 0.5, 1.0]
+
+
+@requires_ffmpeg
+def test_split_plan_endpoint_is_a_dry_run(sample_video, no_profile, temp_base):
+    upload = temp_base / 'uploads' / 'job_sample.mp4'
+    shutil.copy(sample_video, upload)
+    asyncio.run(server.db.video_jobs.insert_one({'id': 'job', 'status': 'uploaded', 'file_path': str(upload)}))
+
+    response = api_request('POST', '/api/split-plan/job', json={'method': 'intervals', 'interval_duration': 4})
+
+    assert response.status_code == 200
+    plan = response.json()
+    assert [(segment['start'], segment['end']) for segment in plan['segments']] == [(0, 4), (4, 8), (8, 10)]
+    assert asyncio.run(server.db.video_jobs.find_one({'id': 'job'}))['status'] == 'uploaded'
+    assert not any((temp_base / 'outputs').iterdir())
+    assert api_request('POST', '/api/split-plan/job', json={'method': 'chapters'}).status_code == 400
+
+
+def test_reencode_history_is_kept_per_engine(no_profile):
+    per_segment = server.SplitConfig(method='intervals', preserve_quality=False, max_parallel_segments=1)
+    smart_cut = per_segment.copy(update={'engine': 'smart_cut'})
+    encoder = server.resolve_encoder_settings(per_segment)
+
+    # A smart cut job stream-copied most of the source in 1 s at the same preset
+    asyncio.run(server.record_throughput(VIDEO_INFO, SPLITS, smart_cut, encoder, 1.0, 10_000_000))
+    result = estimate(per_segment)
+
+    assert (result['basis'], result['samples']) == ('default', 0)
+    assert result['estimated_total_bytes'] == 15_000_000
+
+
+def test_estimate_sizes_splits_from_the_packet_index(no_profile, monkeypatch):
+    class FakeIndex:
+        # The last 2 s carry 60% of the video packet bytes
+        size = [100] * 8 + [600] * 2
+
+        def byte_range(self, start, end):
+            return sum(self.size[int(start):int(end)])
+
+    async def fake_load_packet_index(file_path):
+        return FakeIndex()
+
+    monkeypatch.setattr(server, 'load_packet_index', fake_load_packet_index)
+    config = server.SplitConfig(method='intervals', preserve_quality=True, force_keyframes=False,
+                                max_parallel_segments=1)
+
+    result = estimate(config)
+
+    assert [segment['estimated_bytes'] for segment in result['segments']] == [2_000_000, 2_000_000, 6_000_000]
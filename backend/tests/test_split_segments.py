@@ -0,0 +1,231 @@
+import asyncio
+import json
+import logging
+import subprocess
+from pathlib import Path
+
+import pytest
+
+import server
+from conftest import make_video, requires_ffmpeg
+
+
+def media_duration(path) -> float:
+    result = subprocess.run(
+        ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'json', str(path)],
+        capture_output=True, text=True, check=True,
+    )
+    return float(json.loads(result.stdout)['format']['duration'])
+
+
+def output_of(stream) -> str:
+    return next(arg for arg in stream.compile() if arg.endswith('.mp4') and '_part_' in arg)
+
+
+@requires_ffmpeg
+def test_segments_run_with_bounded_parallelism_and_keep_order(sample_video, db, temp_base, monkeypatch):
+    running = 0
+    peak = 0
+
+    async def fake_run_ffmpeg_async(stream, on_progress=None):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        output_path = output_of(stream)
+        # Later segments finish first, so results must not come back in completion order
+        await asyncio.sleep(0.01 * (7 - int(output_path[-7:-4])))
+        Path(output_path).write_bytes(b'segment')
+        running -= 1
+
+    monkeypatch.setattr(server, 'run_ffmpeg_async', fake_run_ffmpeg_async)
+    splits = [{'start': float(i), 'end': float(i + 1)} for i in range(6)]
+    config = server.SplitConfig(method='time_based', max_parallel_segments=2)
+
+    outputs = asyncio.run(server.split_video_with_subtitles(
+        str(sample_video), str(temp_base / 'outputs' / 'job'), splits, config, 'job'
+    ))
+
+    assert [Path(path).name for path in outputs] == [f"sample_part_{i:03d}.mp4" for i in range(1, 7)]
+    assert peak == 2
+
+
+@requires_ffmpeg
+def test_failed_segment_fails_the_split(sample_video, db, temp_base, monkeypatch):
+    async def fake_run_ffmpeg_async(stream, on_progress=None):
+        output_path = output_of(stream)
+        if output_path.endswith('_002.mp4'):
+            raise RuntimeError("encoder crashed")
+        Path(output_path).write_bytes(b'segment')
+
+    monkeypatch.setattr(server, 'run_ffmpeg_async', fake_run_ffmpeg_async)
+    splits = [{'start': 0.0, 'end': 1.0}, {'start': 1.0, 'end': 2.0}, {'start': 2.0, 'end': 3.0}]
+    config = server.SplitConfig(method='time_based')
+
+    with pytest.raises(Exception, match="1 of 3 splits failed: Error processing split 2"):
+        asyncio.run(server.split_video_with_subtitles(
+            str(sample_video), str(temp_base / 'outputs' / 'job'), splits, config, 'job'
+        ))
+
+
+@requires_ffmpeg
+def test_per_segment_split_encodes_each_range(sample_video, db, temp_base):
+    splits = [{'start': 0.0, 'end': 4.0}, {'start': 4.0, 'end': 10.0}]
+    config = server.SplitConfig(method='time_based', preserve_quality=False, max_parallel_segments=2)
+
+    outputs = asyncio.run(server.split_video_with_subtitles(
+        str(sample_video), str(temp_base / 'outputs' / 'job'), splits, config, 'job'
+    ))
+
+    assert [round(media_duration(path)) for path in outputs] == [4, 6]
+
+
+@requires_ffmpeg
+def test_single_pass_split_cuts_every_range(sample_video, db, temp_base, caplog):
+    caplog.set_level(logging.INFO, logger='server')
+    splits = [{'start': 0.0, 'end': 3.0}, {'start': 3.0, 'end': 7.0}, {'start': 8.0, 'end': 10.0}]
+    config = server.SplitConfig(method='intervals', engine='segment_muxer', preserve_quality=False)
+
+    outputs = asyncio.run(server.split_video_with_subtitles(
+        str(sample_video), str(temp_base / 'outputs' / 'job'), splits, config, 'job'
+    ))
+
+    assert [Path(path).name for path in outputs] == [f"sample_part_{i:03d}.mp4" for i in range(1, 4)]
+    assert [round(media_duration(path)) for path in outputs] == [3, 4, 2]
+    assert sorted(p.name for p in (temp_base / 'outputs' / 'job').iterdir()) == [Path(p).name for p in outputs]
+    assert 'falling back' not in caplog.text
+
+
+@requires_ffmpeg
+def test_single_pass_split_cuts_sub_frame_tail_separately(tmp_path, db, temp_base, caplog):
+    caplog.set_level(logging.INFO, logger='server')
+    # Audio runs 23 ms past the last video frame, so the tail split holds no frame
+    source = make_video(tmp_path / 'tail.mp4', audio_duration=10.023)
+    source_duration = media_duration(source)
+    assert source_duration > 10.0
+    splits = [{'start': 0.0, 'end': 5.0}, {'start': 5.0, 'end': 10.0}, {'start': 10.0, 'end': source_duration}]
+    config = server.SplitConfig(method='intervals', engine='segment_muxer', preserve_quality=False)
+    segments = []
+
+    async def on_segment(index, output_path):
+        segments.append(index)
+
+    outputs = asyncio.run(server.split_video_with_subtitles(
+        str(source), str(temp_base / 'outputs' / 'job'), splits, config, 'job', on_segment=on_segment
+    ))
+
+    assert len(outputs) == 3 and all(Path(path).exists() for path in outputs)
+    assert sorted(segments) == [0, 1, 2]
+    assert 'falling back' not in caplog.text
+
+
+def fake_segment_muxer(monkeypatch, piece_times):
+    """Fake ffmpeg: the segment muxer reports pieces cut at piece_times, per-segment runs write their output"""
+    runs = []
+
+    async def fake_get_video_info(file_path, fast=False):
+        return {'duration': 10.0, 'size': 1000, 'video_streams': [{'fps': 25.0}], 'subtitle_streams': []}
+
+    async def fake_run_ffmpeg_async(stream, on_progress=None):
+        args = stream.compile()
+        if 'segment' in args:
+            runs.append('segment_muxer')
+            pattern = next(arg for arg in args if '.job_piece_' in arg)
+            segment_list = args[args.index('-segment_list') + 1]
+            rows = []
+            for n, (piece_start, piece_end) in enumerate(zip(piece_times, piece_times[1:])):
+                Path(pattern % n).write_bytes(b'piece')
+                rows.append(f"{Path(pattern % n).name},{piece_start},{piece_end}\n")
+                await on_progress({'out_time': piece_end, 'speed': 1.0})
+            Path(segment_list).write_text(''.join(rows))
+        else:
+            runs.append('per_segment')
+            Path(output_of(stream)).write_bytes(b'segment')
+            await on_progress({'out_time': 0.0, 'speed': 1.0})
+
+    monkeypatch.setattr(server, 'get_video_info', fake_get_video_info)
+    monkeypatch.setattr(server, 'run_ffmpeg_async', fake_run_ffmpeg_async)
+    return runs
+
+
+@pytest.fixture
+def job_events(monkeypatch):
+    """segment_completed events and progress values written while a job runs"""
+    events = {'completed': [], 'progress': []}
+
+    def fake_publish_job_event(job_id, event_type, data):
+        if event_type == 'segment_completed':
+            events['completed'].append(data['segment'])
+
+    async def fake_update_job_progress(job_id, progress, status=None, extra=None):
+        events['progress'].append(progress)
+
+    monkeypatch.setattr(server, 'publish_job_event', fake_publish_job_event)
+    monkeypatch.setattr(server, 'update_job_progress', fake_update_job_progress)
+    return events
+
+
+SPLITS_WITH_GAP = [{'start': 0.0, 'end': 3.0}, {'start': 3.0, 'end': 7.0}, {'start': 8.0, 'end': 10.0}]
+
+
+def single_pass(temp_base, splits=SPLITS_WITH_GAP, on_segment=None, **config):
+    config = server.SplitConfig(method='intervals', engine='segment_muxer', **config)
+    return asyncio.run(server.split_video_with_subtitles(
+        str(temp_base / 'sample.mp4'), str(temp_base / 'outputs' / 'job'), splits, config, 'job',
+        on_segment=on_segment
+    ))
+
+
+def test_reencoded_pieces_map_by_order_despite_shifted_times(db, temp_base, monkeypatch, job_events):
+    # ffmpeg reports re-encoded cut times shifted by the stream's start offset
+    runs = fake_segment_muxer(monkeypatch, [0.0, 3.08, 7.08, 8.08, 10.08])
+
+    outputs = single_pass(temp_base, preserve_quality=False)
+
+    assert runs == ['segment_muxer']
+    assert [Path(path).name for path in outputs] == [f"sample_part_{i:03d}.mp4" for i in range(1, 4)]
+    # The 7-8s gap piece is dropped
+    assert sorted(p.name for p in (temp_base / 'outputs' / 'job').iterdir()) == [Path(p).name for p in outputs]
+    assert sorted(job_events['completed']) == [1, 2, 3]
+
+
+def test_copied_pieces_are_checked_against_the_cut_intervals(db, temp_base, monkeypatch):
+    copy = {'preserve_quality': True, 'force_keyframes': False}
+    runs = fake_segment_muxer(monkeypatch, [0.0, 3.08, 7.08, 8.08, 10.08])
+    single_pass(temp_base, **copy)
+    assert runs == ['segment_muxer']
+
+    # No keyframe near 3s: the cut lands half a second late
+    runs = fake_segment_muxer(monkeypatch, [0.0, 3.5, 7.0, 8.0, 10.0])
+    single_pass(temp_base, **copy)
+    assert runs == ['segment_muxer'] + ['per_segment'] * 3
+
+
+def test_missing_piece_falls_back_for_the_whole_job_without_repeating_progress(
+        db, temp_base, monkeypatch, job_events):
+    # The first piece runs on to 7s and holds the second split too
+    runs = fake_segment_muxer(monkeypatch, [0.0, 7.0, 8.0, 10.0])
+    segments = []
+
+    async def on_segment(index, output_path):
+        segments.append(index)
+
+    outputs = single_pass(temp_base, on_segment=on_segment)
+
+    assert runs == ['segment_muxer'] + ['per_segment'] * 3
+    assert sorted(segments) == [0, 1, 2]
+    assert sorted(p.name for p in (temp_base / 'outputs' / 'job').iterdir()) == [Path(p).name for p in outputs]
+    # Each segment completes once and progress never drops back
+    assert sorted(job_events['completed']) == [1, 2, 3]
+    assert job_events['progress'] == sorted(job_events['progress'])
+    assert job_events['progress'][-1] == 100.0
+
+
+def test_sub_frame_tail_is_cut_on_its_own(db, temp_base, monkeypatch, job_events):
+    runs = fake_segment_muxer(monkeypatch, [0.0, 5.04, 10.04])
+    splits = [{'start': 0.0, 'end': 5.0}, {'start': 5.0, 'end': 10.0}, {'start': 10.0, 'end': 10.023}]
+
+    outputs = single_pass(temp_base, splits, preserve_quality=False)
+
+    assert runs == ['segment_muxer', 'per_segment']
+    assert all(Path(path).exists() for path in outputs)
+    assert sorted(job_events['completed']) == [1, 2, 3]
@@ -0,0 +1,148 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+import server
+from conftest import api_request
+
+
+@pytest.fixture
+def quota(monkeypatch):
+    monkeypatch.setattr(server, 'STORAGE_QUOTA_BYTES', 10_000)
+    monkeypatch.setattr(server, 'STORAGE_HIGH_WATERMARK', 0.8)
+    monkeypatch.setattr(server, 'STORAGE_LOW_WATERMARK', 0.5)
+
+
+def add_job(db, temp_base, status, size, accessed_hours_ago=0, created_hours_ago=0):
+    """A job holding an upload and one output of `size` bytes each"""
+    job_id = str(uuid.uuid4())
+    upload = temp_base / 'uploads' / f'{job_id}_clip.mp4'
+    upload.write_bytes(bytes(size))
+    (temp_base / 'outputs' / job_id).mkdir()
+    (temp_base / 'outputs' / job_id / 'clip_part_001.mp4').write_bytes(bytes(size))
+    now = datetime.utcnow()
+    asyncio.run(db.video_jobs.insert_one({
+        'id': job_id, 'status': status, 'file_path': str(upload),
+        'created_at': now - timedelta(hours=created_hours_ago),
+        'updated_at': now - timedelta(hours=created_hours_ago),
+        'last_accessed_at': now - timedelta(hours=accessed_hours_ago),
+    }))
+    return job_id
+
+
+def status_of(db, job_id) -> str:
+    return asyncio.run(db.video_jobs.find_one({'id': job_id}))['status']
+
+
+def test_eviction_expires_least_recently_used_completed_jobs_first(db, temp_base, quota):
+    oldest = add_job(db, temp_base, 'completed', 1000, accessed_hours_ago=3)
+    failed = add_job(db, temp_base, 'failed', 1000, accessed_hours_ago=4)
+    recent = add_job(db, temp_base, 'completed', 1000, accessed_hours_ago=1)
+    pending = add_job(db, temp_base, 'uploaded', 250, accessed_hours_ago=10)
+    manager = server.StorageManager(interval=60)
+
+    # 6500 used + 2000 requested crosses 80%; evict 3500 to get back to 50%
+    asyncio.run(manager.ensure_space(2000))
+
+    # The failed job keeps its upload for a retry while completed jobs can go
+    assert [status_of(db, job) for job in (oldest, failed, recent, pending)] == ['expired', 'failed', 'expired', 'uploaded']
+    assert not (temp_base / 'outputs' / oldest).exists()
+    assert list((temp_base / 'uploads').glob(f'{failed}_*'))
+    assert server.directory_size(temp_base) == 2500
+
+    # With no completed jobs left, failed ones are evicted as a last resort
+    asyncio.run(manager.ensure_space(6000))
+    assert status_of(db, failed) == 'expired'
+
+
+def test_expiry_skips_jobs_whose_status_changed(db, temp_base, quota):
+    job_id = add_job(db, temp_base, 'failed', 1000)
+    job = asyncio.run(db.video_jobs.find_one({'id': job_id}, {'_id': 0}))
+    # A retry requeued the job after eviction picked it
+    asyncio.run(db.video_jobs.update_one({'id': job_id}, {'$set': {'status': 'queued'}}))
+
+    freed = asyncio.run(server.StorageManager(interval=60).expire_job(job, 'Evicted to free disk space', ['failed']))
+
+    assert freed == 0
+    assert status_of(db, job_id) == 'queued'
+    assert (temp_base / 'outputs' / job_id / 'clip_part_001.mp4').exists()
+
+
+def test_requests_that_can_never_fit_fail_without_evicting(db, temp_base, quota):
+    job = add_job(db, temp_base, 'completed', 1000)
+    manager = server.StorageManager(interval=60)
+
+    with pytest.raises(Exception, match="Not enough disk space"):
+        asyncio.run(manager.ensure_space(20_000))
+
+    assert status_of(db, job) == 'completed'
+
+
+def test_reservations_shrink_as_outputs_are_written(db, temp_base, quota):
+    manager = server.StorageManager(interval=60)
+    asyncio.run(manager.reserve('job', 3000))
+    (temp_base / 'outputs' / 'job').mkdir()
+    (temp_base / 'outputs' / 'job' / 'part.mp4').write_bytes(bytes(1000))
+
+    assert manager.reserved_bytes() == 2000
+    # 1000 used + 2000 reserved + 6000 = 90% and nothing to evict
+    with pytest.raises(Exception, match="Not enough disk space"):
+        asyncio.run(manager.ensure_space(7500))
+    manager.release('job')
+    assert manager.reserved_bytes() == 0
+
+
+def test_stale_uploads_and_sessions_expire(db, temp_base, monkeypatch):
+    monkeypatch.setattr(server, 'UPLOAD_TTL_HOURS', 24)
+    stale = add_job(db, temp_base, 'uploaded', 10, accessed_hours_ago=30, created_hours_ago=30)
+    watched = add_job(db, temp_base, 'uploaded', 10, accessed_hours_ago=1, created_hours_ago=30)
+    fresh = add_job(db, temp_base, 'uploaded', 10, created_hours_ago=1)
+    session_file = temp_base / 'uploads' / 'session.part'
+    session_file.write_bytes(b'partial')
+    asyncio.run(db.upload_sessions.insert_one({
+        'id': 'session', 'status': 'open', 'file_path': str(session_file),
+        'updated_at': datetime.utcnow() - timedelta(hours=30)
+    }))
+
+    asyncio.run(server.StorageManager(interval=60).expire_stale_uploads())
+
+    assert [status_of(db, job) for job in (stale, watched, fresh)] == ['expired', 'uploaded', 'uploaded']
+    assert not session_file.exists()
+    assert asyncio.run(db.upload_sessions.count_documents({})) == 0
+
+
+def test_touches_are_batched_into_last_accessed_at(db, temp_base):
+    job = add_job(db, temp_base, 'completed', 10, accessed_hours_ago=5)
+    manager = server.StorageManager(interval=60)
+
+    manager.touch(job)
+    asyncio.run(manager.flush_access())
+
+    accessed = asyncio.run(db.video_jobs.find_one({'id': job}))['last_accessed_at']
+    assert datetime.utcnow() - accessed < timedelta(minutes=1)
+    assert manager.accessed == {}
+
+
+def test_sweep_drops_local_copies_of_jobs_expired_elsewhere(db, temp_base, shared_store, monkeypatch):
+    monkeypatch.setattr(server, 'ORPHAN_GRACE_SECONDS', -10)
+    expired = add_job(db, temp_base, 'completed', 10)
+    live = add_job(db, temp_base, 'completed', 10)
+    asyncio.run(db.video_jobs.update_one({'id': expired}, {'$set': {'status': 'expired'}}))
+
+    asyncio.run(server.StorageManager(interval=60).sweep())
+
+    assert not (temp_base / 'outputs' / expired).exists()
+    assert not list((temp_base / 'uploads').glob(f'{expired}_*'))
+    assert (temp_base / 'outputs' / live).exists()
+
+
+def test_storage_endpoint_reports_usage(db, temp_base, quota):
+    add_job(db, temp_base, 'completed', 1000)
+
+    stats = api_request('GET', '/api/storage').json()
+
+    assert (stats['used'], stats['capacity'], stats['free']) == (2000, 10_000, 8000)
+    assert stats['directories']['outputs'] == 1000
+    assert stats['jobs'] == {'completed': {'count': 1, 'bytes': 0}}
@@ -0,0 +1,107 @@
+import asyncio
+import json
+import subprocess
+from pathlib import Path
+
+import pytest
+
+import server
+from conftest import requires_ffmpeg
+
+SRT = """1
+00:00:01,000 --> 00:00:02,500
+First line
+
+2
+00:00:04,500 --> 00:00:06,000 X1:0 X2:10
+Across the cut
+second row
+
+3
+00:00:07,000 --> 00:00:08,000
+"""
+
+
+@pytest.fixture(scope='module')
+def subtitled_video(sample_video, tmp_path_factory):
+    """sample.mp4 with two English SRT tracks in Matroska"""
+    work = tmp_path_factory.mktemp('subtitles')
+    (work / 'a.srt').write_text(SRT)
+    (work / 'b.srt').write_text("1\n00:00:08,000 --> 00:00:09,000\nLate\n")
+    path = work / 'subtitled.mkv'
+    subprocess.run(
+        ['ffmpeg', '-v', 'error', '-y', '-i', str(sample_video), '-i', str(work / 'a.srt'), '-i', str(work / 'b.srt'),
+         '-map', '0', '-map', '1', '-map', '2', '-c', 'copy', '-c:s', 'srt',
+         '-metadata:s:s:0', 'language=eng', '-metadata:s:s:1', 'language=eng', str(path)],
+        check=True,
+    )
+    return path
+
+
+def test_parse_srt_handles_crlf_positions_and_empty_cues():
+    cues = server.parse_srt(SRT.replace('\n', '\r\n'))
+    assert cues == [(1.0, 2.5, 'First line'), (4.5, 6.0, 'Across the cut\nsecond row')]
+
+
+def test_cues_between_finds_long_cues_that_started_earlier():
+    track = server.SubtitleTrack(2, 'eng', [(30.0, 31.0, 'b'), (0.0, 20.0, 'long'), (12.0, 13.0, 'a')])
+    assert [cue[2] for cue in track.cues_between(10.0, 20.0)] == ['long', 'a']
+    assert track.cues_between(20.0, 30.0) == []
+
+
+def test_slices_are_rebased_clipped_and_shifted(tmp_path):
+    tracks = [server.SubtitleTrack(2, 'eng', server.parse_srt(SRT)), server.SubtitleTrack(3, 'fra', [])]
+
+    written = server.write_subtitle_slices(tracks, 5.0, 10.0, -0.5, str(tmp_path), 'clip_part_002')
+
+    # Only tracks with cues in range get a file
+    assert written == [{'path': str(tmp_path / 'clip_part_002.eng.srt'), 'language': 'eng'}]
+    # Offset -0.5 reads the source from 4.5 s: the cue across the cut starts at 0
+    assert (tmp_path / 'clip_part_002.eng.srt').read_text() == (
+        "1\n00:00:00,000 --> 00:00:01,500\nAcross the cut\nsecond row\n"
+    )
+
+
+@requires_ffmpeg
+def test_tracks_are_extracted_in_one_pass(subtitled_video, db, tmp_path, monkeypatch):
+    video_info = asyncio.run(server.get_video_info(str(subtitled_video)))
+    runs = []
+    run_ffmpeg_async = server.run_ffmpeg_async
+
+    async def counting_run(stream, on_progress=None):
+        runs.append(stream)
+        await run_ffmpeg_async(stream, on_progress)
+
+    monkeypatch.setattr(server, 'run_ffmpeg_async', counting_run)
+
+    tracks = asyncio.run(server.extract_subtitle_tracks(str(subtitled_video), video_info, tmp_path))
+
+    assert len(runs) == 1
+    assert [len(track.cues) for track in tracks] == [2, 1]
+    # Repeated languages get numbered sidecar names
+    assert [track.suffix for track in tracks] == ['eng.2', 'eng.3']
+    assert list(tmp_path.iterdir()) == []
+
+
+@requires_ffmpeg
+def test_split_muxes_and_writes_sidecars(subtitled_video, db, temp_base):
+    splits = [{'start': 0.0, 'end': 5.0}, {'start': 5.0, 'end': 10.0}]
+    config = server.SplitConfig(method='time_based', preserve_quality=False, subtitle_mode='both')
+    output_dir = temp_base / 'outputs' / 'job'
+
+    outputs = asyncio.run(server.split_video_with_subtitles(str(subtitled_video), str(output_dir), splits, config, 'job'))
+
+    assert sorted(path.name for path in output_dir.iterdir()) == [
+        'subtitled_part_001.eng.2.srt', 'subtitled_part_001.mp4',
+        'subtitled_part_002.eng.2.srt', 'subtitled_part_002.eng.3.srt', 'subtitled_part_002.mp4',
+    ]
+    # Remuxing moved the cues by the source's 23 ms video delay
+    [(start, end, text)] = server.parse_srt((output_dir / 'subtitled_part_002.eng.3.srt').read_text())
+    assert (start, end, text) == (pytest.approx(3.0, abs=0.03), pytest.approx(4.0, abs=0.03), 'Late')
+    probe = subprocess.run(
+        ['ffprobe', '-v', 'error', '-select_streams', 's', '-show_streams', '-of', 'json', outputs[1]],
+        capture_output=True, text=True, check=True,
+    )
+    streams = json.loads(probe.stdout)['streams']
+    assert [(stream['codec_name'], stream['tags']['language']) for stream in streams] == [('mov_text', 'eng')] * 2
+    assert not any(Path(server.PROCESS_DIR / 'job').glob('*.srt'))
@@ -0,0 +1,82 @@
+import asyncio
+import json
+import subprocess
+
+import pytest
+
+import server
+from conftest import api_request, requires_ffmpeg
+
+
+@pytest.fixture
+def small_sprites(monkeypatch):
+    monkeypatch.setattr(server, 'THUMBNAIL_INTERVAL', 1.0)
+    monkeypatch.setattr(server, 'THUMBNAIL_WIDTH', 64)
+    monkeypatch.setattr(server, 'SPRITE_COLUMNS', 3)
+    monkeypatch.setattr(server, 'SPRITE_ROWS', 2)
+
+
+def image_size(path) -> tuple:
+    result = subprocess.run(
+        ['ffprobe', '-v', 'error', '-show_entries', 'stream=width,height', '-of', 'csv=p=0', str(path)],
+        capture_output=True, text=True, check=True,
+    )
+    return tuple(int(value) for value in result.stdout.strip().split(','))
+
+
+def test_format_vtt_timestamp():
+    assert server.format_vtt_timestamp(0) == '00:00:00.000'
+    assert server.format_vtt_timestamp(3725.0004) == '01:02:05.000'
+    assert server.format_vtt_timestamp(59.9996) == '00:01:00.000'
+
+
+@requires_ffmpeg
+def test_sprites_tile_one_frame_per_interval(sample_video, db, temp_base, small_sprites):
+    asyncio.run(db.video_jobs.insert_one({'id': 'job', 'status': 'uploaded'}))
+
+    asyncio.run(server.prepare_thumbnails('job', str(sample_video)))
+
+    job = asyncio.run(db.video_jobs.find_one({'id': 'job'}))
+    assert (job['thumbnails'], job['thumbnail_count']) == ('ready', 10)
+    preview_dir = temp_base / 'previews' / 'job'
+    manifest = json.loads((preview_dir / 'thumbnails.json').read_text())
+    # 320x240 source scaled to 64 wide, 6 tiles per sheet
+    assert (manifest['width'], manifest['height']) == (64, 48)
+    assert manifest['sheets'] == ['sprite_000.jpg', 'sprite_001.jpg']
+    assert image_size(preview_dir / 'sprite_000.jpg') == (192, 96)
+    assert manifest['thumbnails'][7] == {'start': 7.0, 'end': 8.0, 'sheet': 'sprite_001.jpg', 'x': 64, 'y': 0}
+    vtt = (preview_dir / 'thumbnails.vtt').read_text()
+    assert '00:00:07.000 --> 00:00:08.000\nsprite_001.jpg#xywh=64,0,64,48' in vtt
+    assert not list((temp_base / 'previews').glob('.*.tmp'))
+
+
+@requires_ffmpeg
+def test_thumbnails_endpoint_serves_immutable_files(sample_video, db, temp_base, small_sprites):
+    asyncio.run(db.video_jobs.insert_one({'id': 'job', 'status': 'uploaded'}))
+    asyncio.run(server.prepare_thumbnails('job', str(sample_video)))
+
+    response = api_request('GET', '/api/thumbnails/job/sprite_000.jpg')
+
+    assert response.status_code == 200
+    assert response.headers['content-type'] == 'image/jpeg'
+    assert response.headers['cache-control'] == server.PREVIEW_CACHE_CONTROL
+    assert response.content == (temp_base / 'previews' / 'job' / 'sprite_000.jpg').read_bytes()
+    assert api_request('GET', '/api/thumbnails/job/thumbnails.vtt').text.startswith('WEBVTT')
+
+
+def test_thumbnails_endpoint_reports_missing_and_building(db, temp_base):
+    asyncio.run(db.video_jobs.insert_one({'id': 'job', 'status': 'uploaded', 'thumbnails': 'building'}))
+
+    assert api_request('GET', '/api/thumbnails/job/thumbnails.json').status_code == 409
+    assert api_request('GET', '/api/thumbnails/job/server.py').status_code == 404
+    assert api_request('GET', '/api/thumbnails/other/thumbnails.json').status_code == 404
+
+
+def test_failed_generation_is_recorded(db, temp_base, tmp_path):
+    asyncio.run(db.video_jobs.insert_one({'id': 'job', 'status': 'uploaded'}))
+    (tmp_path / 'broken.mp4').write_bytes(b'not a video')
+
+    asyncio.run(server.prepare_thumbnails('job', str(tmp_path / 'broken.mp4')))
+
+    assert asyncio.run(db.video_jobs.find_one({'id': 'job'}))['thumbnails'] == 'failed'
+    assert not (temp_base / 'previews' / '.job.tmp').exists()
@@ -0,0 +1,129 @@
+import asyncio
+import io
+import os
+import zipfile
+import zlib
+
+import server
+from conftest import api_request
+
+
+def bytes_reader(data: bytes):
+    async def read_range(start, end):
+        yield data[start:end + 1]
+    return read_range
+
+
+async def zeros_reader(start, end):
+    yield bytes(end - start + 1)
+
+
+def entry(name: str, data: bytes) -> dict:
+    return {'file': name, 'size': len(data), 'mtime': 1700000000.0, 'crc32': zlib.crc32(data),
+            'read_range': bytes_reader(data)}
+
+
+def read_all(read_range, start, end) -> bytes:
+    async def collect():
+        return b''.join([chunk async for chunk in read_range(start, end)])
+    return asyncio.run(collect())
+
+
+class RangeFile(io.RawIOBase):
+    """Seekable file over a zip_range_reader, read lazily like an HTTP client would"""
+
+    def __init__(self, read_range, size):
+        self.read_range, self.size, self.position = read_range, size, 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        self.position = {os.SEEK_SET: 0, os.SEEK_CUR: self.position, os.SEEK_END: self.size}[whence] + offset
+        return self.position
+
+    def read(self, n=-1):
+        end = self.size - 1 if n < 0 else min(self.position + n, self.size) - 1
+        if end < self.position:
+            return b''
+        data = read_all(self.read_range, self.position, end)
+        self.position += len(data)
+        return data
+
+
+def test_stored_zip_matches_zipfile():
+    entries = [entry('a_part_001.mp4', b'first segment' * 100), entry('a_part_001.srt', b''), entry('ü.mp4', b'x')]
+
+    parts, total = server.build_stored_zip(entries)
+    archive = read_all(server.zip_range_reader(parts), 0, total - 1)
+
+    assert len(archive) == total
+    with zipfile.ZipFile(io.BytesIO(archive)) as zf:
+        assert zf.testzip() is None
+        assert zf.namelist() == ['a_part_001.mp4', 'a_part_001.srt', 'ü.mp4']
+        assert zf.read('a_part_001.mp4') == b'first segment' * 100
+        assert all(info.compress_type == zipfile.ZIP_STORED for info in zf.infolist())
+
+
+def test_zip_range_reader_serves_arbitrary_ranges():
+    parts, total = server.build_stored_zip([entry('a.mp4', b'abc' * 50), entry('b.mp4', b'def' * 50)])
+    reader = server.zip_range_reader(parts)
+    archive = read_all(reader, 0, total - 1)
+
+    for start, end in [(0, 0), (10, 200), (total - 30, total - 1), (60, 61)]:
+        assert read_all(reader, start, end) == archive[start:end + 1]
+
+
+def test_large_entries_use_zip64():
+    big = 5 * 1024 ** 3
+    entries = [
+        {'file': 'big.mp4', 'size': big, 'mtime': 1700000000.0, 'crc32': 0, 'read_range': zeros_reader},
+        entry('after.mp4', b'past the 4 GiB mark'),
+    ]
+
+    parts, total = server.build_stored_zip(entries)
+
+    with zipfile.ZipFile(RangeFile(server.zip_range_reader(parts), total)) as zf:
+        big_info, after_info = zf.infolist()
+        assert big_info.file_size == big
+        assert after_info.header_offset > server.ZIP_LIMIT
+        assert zf.read('after.mp4') == b'past the 4 GiB mark'
+
+
+def test_download_all_streams_outputs_and_sidecars(db, temp_base):
+    output_dir = temp_base / 'outputs' / 'job'
+    output_dir.mkdir()
+    (output_dir / 'clip_part_001.mp4').write_bytes(b'video' * 1000)
+    (output_dir / 'clip_part_001.srt').write_bytes(b'1\n00:00:00,000 --> 00:00:01,000\nhi\n')
+    described = server.describe_output_file(str(output_dir / 'clip_part_001.mp4'))
+    asyncio.run(db.video_jobs.insert_one({
+        'id': 'job', 'status': 'completed', 'filename': 'clip.mp4',
+        # The sidecar has no CRC yet, so it is computed and cached on the job
+        'splits': [{**described, 'subtitles': [{'file': 'clip_part_001.srt'}]}]
+    }))
+
+    response = api_request('GET', '/api/download-all/job')
+
+    assert response.status_code == 200
+    assert response.headers['content-disposition'] == 'attachment; filename="clip_splits.zip"'
+    assert int(response.headers['content-length']) == len(response.content)
+    with zipfile.ZipFile(io.BytesIO(response.content)) as zf:
+        assert zf.testzip() is None
+        assert zf.namelist() == ['clip_part_001.mp4', 'clip_part_001.srt']
+    job = asyncio.run(db.video_jobs.find_one({'id': 'job'}))
+    assert job['splits'][0]['subtitles'][0]['crc32'] == zlib.crc32((output_dir / 'clip_part_001.srt').read_bytes())
+
+    partial = api_request('GET', '/api/download-all/job', headers={'Range': 'bytes=100-199'})
+    assert partial.status_code == 206
+    assert partial.content == response.content[100:200]
+
+
+def test_download_all_requires_a_completed_job(db, temp_base):
+    asyncio.run(db.video_jobs.insert_one({'id': 'job', 'status': 'processing', 'filename': 'clip.mp4'}))
+    assert api_request('GET', '/api/download-all/job').status_code == 404